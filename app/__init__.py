@@ -14,8 +14,11 @@ def create_app():
 
     os.makedirs(os.path.join(app.root_path, '..', 'instance'), exist_ok=True)
     app.config.from_object(Config)
+    if app.config["FILE_DELIVERY"] not in ("flask", "nginx", "apache"):
+        raise RuntimeError(f"FILE_DELIVERY must be flask, nginx or apache, not {app.config['FILE_DELIVERY']!r}")
+    app.config["USE_X_SENDFILE"] = app.config["FILE_DELIVERY"] == "apache"
 
-    for p in [app.config.get('STORAGE_DIR'), app.config.get('REPORTS_DIR'), app.config.get('UPLOADS_DIR'), app.config.get('MEDIA_DIR')]:
+    for p in [app.config.get('STORAGE_DIR'), app.config.get('REPORTS_DIR'), app.config.get('UPLOADS_DIR'), app.config.get('MEDIA_DIR'), app.config.get('IMPORTS_DIR'), app.config.get('BLOBS_DIR')]:
         if p:
             os.makedirs(p, exist_ok=True)
 
@@ -28,6 +31,8 @@ def create_app():
         app.config.get("REPORTS_DIR"),
         app.config.get("UPLOADS_DIR"),
         app.config.get("MEDIA_DIR"),
+        app.config.get("IMPORTS_DIR"),
+        app.config.get("BLOBS_DIR"),
     ]:
         if p:
             os.makedirs(p, exist_ok=True)
@@ -35,11 +40,15 @@ def create_app():
     db.init_app(app)
     login_manager.init_app(app)
 
-    from .models import User
+    from .profiler import init_profiler
+    init_profiler(app)
+
+    from .cache import init_cache, load_cached_user
+    init_cache(app)
 
     @login_manager.user_loader
     def load_user(user_id: str):
-        return User.query.get(user_id)
+        return load_cached_user(user_id)
 
     # Jinja helpers
     from .filters import bp as filters_bp
@@ -50,12 +59,17 @@ def create_app():
     from .routes.teacher import bp as teacher_bp
     from .routes.chairman import bp as chairman_bp
     from .routes.files import bp as files_bp
+    from .routes.uploads import bp as uploads_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(student_bp, url_prefix="/student")
     app.register_blueprint(teacher_bp, url_prefix="/teacher")
     app.register_blueprint(chairman_bp, url_prefix="/chairman")
     app.register_blueprint(files_bp, url_prefix="/files")
+    app.register_blueprint(uploads_bp, url_prefix="/uploads")
+
+    from .commands import register_commands
+    register_commands(app)
 
     @app.context_processor
     def inject_brand():
@@ -70,10 +84,11 @@ def create_app():
         }
 
     with app.app_context():
-        db.create_all()
-        from .migrate import ensure_schema
-        ensure_schema()
+        from .migrate import ensure_schema, schema_lock
         from .seed import ensure_seed_data
-        ensure_seed_data()
+        with schema_lock():
+            db.create_all()
+            ensure_schema()
+            ensure_seed_data()
 
     return app
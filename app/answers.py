@@ -0,0 +1,105 @@
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, update
+
+from . import db
+from .grading import grader_for
+from .models import Attempt, AttemptAnswer
+
+def _dumps(response: Any) -> Optional[str]:
+    return None if response is None else json.dumps(response, ensure_ascii=False)
+
+def _loads(raw: Optional[str]) -> Any:
+    return json.loads(raw) if raw else None
+
+def save_answers(attempt_id: int, graded: List[Dict[str, Any]]) -> None:
+    """Bulk-insert graded answers: dicts with question_id, response, is_correct[, time_spent_sec]."""
+    if not graded:
+        return
+    db.session.execute(insert(AttemptAnswer), [
+        {
+            "attempt_id": attempt_id,
+            "question_id": g["question_id"],
+            "position": i,
+            "response_json": _dumps(g.get("response")),
+            "is_correct": bool(g.get("is_correct")),
+            "time_spent_sec": g.get("time_spent_sec"),
+        }
+        for i, g in enumerate(graded, start=1)
+    ])
+
+def answers_for(attempt_ids: List[int]) -> Dict[int, List[AttemptAnswer]]:
+    """attempt_id -> answers in question order, one query for the whole batch."""
+    out: Dict[int, List[AttemptAnswer]] = {aid: [] for aid in attempt_ids}
+    if not attempt_ids:
+        return out
+    rows = (
+        AttemptAnswer.query.filter(AttemptAnswer.attempt_id.in_(attempt_ids))
+        .order_by(AttemptAnswer.attempt_id.asc(), AttemptAnswer.position.asc())
+        .all()
+    )
+    for r in rows:
+        out[r.attempt_id].append(r)
+    return out
+
+def display_answers(attempt: Attempt) -> List[Dict[str, Any]]:
+    """Rows for the result page and PDF: prompt, student/correct answer, is_correct."""
+    from .bank import get_bank
+    bank = get_bank(attempt.skill_id)
+    out = []
+    for a in answers_for([attempt.id])[attempt.id]:
+        cq = bank.get(a.question_id)
+        response = _loads(a.response_json)
+        if cq is None:
+            out.append({"question_id": a.question_id, "prompt": "(question removed)", "qtype": None,
+                        "student_answer": "-" if response is None else str(response),
+                        "correct_answer": "-", "is_correct": a.is_correct, "time_spent_sec": a.time_spent_sec})
+            continue
+        _, student_disp = grader_for(cq.qtype).grade(response, cq.answer)
+        out.append({"question_id": cq.id, "prompt": cq.prompt, "qtype": cq.qtype,
+                    "student_answer": student_disp, "correct_answer": cq.answer_display,
+                    "is_correct": a.is_correct, "time_spent_sec": a.time_spent_sec})
+    return out
+
+def set_correctness(changes: List[Dict[str, Any]]) -> None:
+    """Bulk update of [{"id", "is_correct"}] after re-grading."""
+    if changes:
+        db.session.execute(update(AttemptAnswer), changes)
+
+def backfill_from_json(batch_size: int = 500) -> int:
+    """Move legacy Attempt.answers_json blobs into AttemptAnswer rows; returns attempts converted."""
+    converted, last_id = 0, 0
+    while True:
+        batch = (
+            db.session.query(Attempt.id, Attempt.answers_json)
+            .filter(Attempt.answers_json.isnot(None), Attempt.id > last_id)
+            .order_by(Attempt.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return converted
+        last_id = batch[-1][0]
+        ids = [aid for aid, _ in batch]
+        have = {aid for (aid,) in db.session.query(AttemptAnswer.attempt_id)
+                .filter(AttemptAnswer.attempt_id.in_(ids)).distinct()}
+
+        for aid, raw in batch:
+            if aid in have:
+                continue
+            try:
+                entries = json.loads(raw) or []
+            except ValueError:
+                entries = []
+            graded = []
+            for e in entries:
+                if not isinstance(e, dict) or e.get("question_id") is None:
+                    continue
+                response = e["response"] if "response" in e else grader_for(e.get("qtype") or "").from_display(e.get("student_answer"))
+                graded.append({"question_id": e["question_id"], "response": response, "is_correct": e.get("is_correct")})
+            save_answers(aid, graded)
+        db.session.execute(update(Attempt).where(Attempt.id.in_(ids)).values(answers_json=None))
+        db.session.flush()
+        converted += len(ids)
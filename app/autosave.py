@@ -0,0 +1,162 @@
+from __future__ import annotations
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import update
+from werkzeug.datastructures import MultiDict
+
+from . import db
+from .models import Attempt, AttemptDraft, Skill
+from .stats import _upsert
+
+# Autosave for tests in progress. test.html posts only the answers changed
+# since its last acknowledged save, and they are merged into one AttemptDraft row:
+#   {"a": {"12": "2", "13": ["0", "3"], "14": "osmosis"}, "t": {"12": 31}}
+# A save that changes nothing is not written; one that only moves the
+# per-question timers is written at most every AUTOSAVE_MIN_INTERVAL_SEC (the
+# client keeps those timers and sends them again with its next answer). In the
+# steady state a save is one primary-key read and one UPDATE.
+
+MAX_VALUE_LEN = 2000
+MAX_CHOICES = 50
+GRACE_SEC = 30  # saves still accepted this long after the timer hits zero
+
+class AutosaveError(ValueError):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def deadline_for(attempt: Attempt, skill: Skill) -> datetime:
+    duration_min = skill.duration_min or current_app.config["DEFAULT_TEST_DURATION_MIN"]
+    return attempt.started_at + timedelta(minutes=duration_min)
+
+def open_attempt(student_id: str, skill_id: int) -> Optional[Attempt]:
+    """The student's unfinished attempt at this skill, if any (uses ix_attempt_student_skill_finished)."""
+    return (Attempt.query.filter_by(student_id=student_id, skill_id=skill_id)
+            .filter(Attempt.finished_at.is_(None))
+            .order_by(Attempt.started_at.desc()).first())
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def _clean(delta: Any) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    delta = delta if isinstance(delta, dict) else {}
+    answers: Dict[str, Any] = {}
+    for qid, value in (delta.get("a") if isinstance(delta.get("a"), dict) else {}).items():
+        if not str(qid).isdigit():
+            continue
+        if value is None or isinstance(value, str):
+            answers[str(qid)] = value[:MAX_VALUE_LEN] if value else None
+        elif isinstance(value, list):
+            answers[str(qid)] = [str(v)[:20] for v in value[:MAX_CHOICES]]
+    times = {str(qid): v for qid, v in (delta.get("t") if isinstance(delta.get("t"), dict) else {}).items()
+             if str(qid).isdigit() and isinstance(v, int) and 0 <= v < 86400}
+    return answers, times
+
+def _merge(data: Dict[str, Any], answers: Dict[str, Any], times: Dict[str, int]) -> Tuple[bool, bool]:
+    """Apply a delta in place -> (answers changed, timers changed)."""
+    a, t = data.setdefault("a", {}), data.setdefault("t", {})
+    answers_changed = times_changed = False
+    for qid, value in answers.items():
+        if value in (None, "", []):
+            if qid in a:
+                del a[qid]
+                answers_changed = True
+        elif a.get(qid) != value:
+            a[qid] = value
+            answers_changed = True
+    for qid, value in times.items():
+        if t.get(qid) != value:
+            t[qid] = value
+            times_changed = True
+    return answers_changed, times_changed
+
+def _create(attempt_id: int, student_id: str, answers, times, now: datetime) -> Optional[Dict[str, Any]]:
+    """First save of an attempt: check it against the Attempt row, then insert the draft."""
+    row = (db.session.query(Attempt, Skill).join(Skill, Skill.id == Attempt.skill_id)
+           .filter(Attempt.id == attempt_id).first())
+    if row is None or row[0].student_id != student_id:
+        raise AutosaveError("Attempt not found.", 404)
+    attempt, skill = row
+    if attempt.finished_at is not None:
+        raise AutosaveError("This attempt was already submitted.", 409)
+    deadline = deadline_for(attempt, skill)
+    if now > deadline + timedelta(seconds=GRACE_SEC):
+        raise AutosaveError("Time is up.", 409)
+    data: Dict[str, Any] = {"a": {}, "t": {}}
+    _merge(data, answers, times)
+    res = db.session.execute(
+        _upsert(AttemptDraft.__table__)
+        .values(attempt_id=attempt_id, student_id=student_id, deadline=deadline,
+                data_json=_dumps(data), rev=1, saved_at=now)
+        .on_conflict_do_nothing(index_elements=["attempt_id"])
+    )
+    db.session.commit()
+    return {"rev": 1, "saved": True, "deferred": False} if res.rowcount else None
+
+def save(attempt_id: int, student_id: str, delta: Any, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Merge one client delta into the attempt's draft and commit. -> {"rev", "saved", "deferred"}."""
+    now = now or datetime.utcnow()
+    answers, times = _clean(delta)
+    for _ in range(3):
+        draft = db.session.get(AttemptDraft, attempt_id)
+        if draft is None:
+            result = _create(attempt_id, student_id, answers, times, now)
+            if result:
+                return result
+            continue  # another request created it first
+        if draft.student_id != student_id:
+            raise AutosaveError("Attempt not found.", 404)
+        if now > draft.deadline + timedelta(seconds=GRACE_SEC):
+            raise AutosaveError("Time is up.", 409)
+
+        data = json.loads(draft.data_json)
+        answers_changed, times_changed = _merge(data, answers, times)
+        if not answers_changed and not times_changed:
+            return {"rev": draft.rev, "saved": False, "deferred": False}
+        if not answers_changed and (now - draft.saved_at).total_seconds() < current_app.config["AUTOSAVE_MIN_INTERVAL_SEC"]:
+            return {"rev": draft.rev, "saved": False, "deferred": True}
+        raw = _dumps(data)
+        if len(raw) > current_app.config["AUTOSAVE_MAX_BYTES"]:
+            raise AutosaveError("Too much data to autosave.", 413)
+
+        # Conditional on rev: a second tab saving at the same moment is merged, not lost.
+        rev = draft.rev + 1  # read before the commit expires the row
+        res = db.session.execute(
+            update(AttemptDraft)
+            .where(AttemptDraft.attempt_id == attempt_id, AttemptDraft.rev == draft.rev)
+            .values(data_json=raw, rev=rev, saved_at=now)
+        )
+        db.session.commit()
+        if res.rowcount:
+            return {"rev": rev, "saved": True, "deferred": False}
+        db.session.expire_all()
+    raise AutosaveError("The attempt is being saved elsewhere; try again.", 409)
+
+def has_draft(attempt_id: int) -> bool:
+    return db.session.query(AttemptDraft.attempt_id).filter(AttemptDraft.attempt_id == attempt_id).first() is not None
+
+def draft_for(attempt_id: int) -> Dict[str, Any]:
+    """Saved answers and timers for prefilling test.html: {"a": ..., "t": ..., "rev": n}."""
+    draft = db.session.get(AttemptDraft, attempt_id)
+    if draft is None:
+        return {"a": {}, "t": {}, "rev": 0}
+    data = json.loads(draft.data_json)
+    return {"a": data.get("a", {}), "t": data.get("t", {}), "rev": draft.rev}
+
+def draft_form(attempt_id: int) -> MultiDict:
+    """The draft as the form test.html would have posted, for grading an attempt that ran out of time."""
+    draft = draft_for(attempt_id)
+    form = MultiDict()
+    for qid, value in draft["a"].items():
+        for v in (value if isinstance(value, list) else [value]):
+            form.add(f"q_{qid}", v)
+    for qid, secs in draft["t"].items():
+        form.add(f"t_{qid}", str(secs))
+    return form
+
+def discard(attempt_id: int) -> None:
+    """Drop the draft once the attempt is graded. Runs in the caller's transaction."""
+    db.session.query(AttemptDraft).filter(AttemptDraft.attempt_id == attempt_id).delete(synchronize_session=False)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import json, threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, update
+
+from . import db
+from .grading import grader_for
+from .models import Skill, Question
+
+@dataclass(frozen=True)
+class CompiledQuestion:
+    id: int
+    qtype: str
+    prompt: str
+    options: Tuple[str, ...]
+    answer: Any          # key compiled by the qtype's grader (int / frozenset / text / None)
+    answer_display: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass(frozen=True)
+class CompiledBank:
+    skill_id: int
+    version: int
+    questions: Tuple[CompiledQuestion, ...]
+    by_id: Dict[int, CompiledQuestion] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "by_id", {q.id: q for q in self.questions})
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def get(self, question_id: Any) -> Optional[CompiledQuestion]:
+        return self.by_id.get(question_id)
+
+_CACHE: Dict[int, CompiledBank] = {}
+_LOCK = threading.Lock()
+
+def _loads(raw: Optional[str]) -> Any:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception:
+        return None
+
+def compile_question(q: Question) -> CompiledQuestion:
+    options = _loads(q.options_json)
+    meta = _loads(q.meta_json)
+    answer, answer_display = grader_for(q.qtype).compile_key(_loads(q.answer_json))
+    return CompiledQuestion(
+        id=q.id,
+        qtype=q.qtype,
+        prompt=q.prompt,
+        options=tuple(options) if isinstance(options, list) else (),
+        answer=answer,
+        answer_display=answer_display,
+        meta=meta if isinstance(meta, dict) else {},
+    )
+
+def get_bank(skill_id: int, version: Optional[int] = None) -> CompiledBank:
+    """Compiled questions for a skill, rebuilt only when ``Skill.bank_version`` changes.
+
+    Pass ``version`` when the Skill row is already loaded to skip the version query.
+    """
+    if version is None:
+        version = db.session.query(Skill.bank_version).filter(Skill.id == skill_id).scalar()
+    version = version or 0
+
+    cached = _CACHE.get(skill_id)
+    if cached is not None and cached.version == version:
+        return cached
+
+    rows = Question.query.filter_by(skill_id=skill_id).order_by(Question.id.asc()).all()
+    bank = CompiledBank(skill_id=skill_id, version=version, questions=tuple(compile_question(q) for q in rows))
+    with _LOCK:
+        current = _CACHE.get(skill_id)
+        if current is None or current.version <= version:
+            _CACHE[skill_id] = bank
+    return bank
+
+def bump_bank_version(skill_ids: Iterable[int]) -> None:
+    """Invalidate compiled banks in every process. Call in the transaction that changes questions."""
+    ids = sorted({int(s) for s in skill_ids if s is not None})
+    if not ids:
+        return
+    db.session.execute(
+        update(Skill)
+        .where(Skill.id.in_(ids))
+        .values(bank_version=func.coalesce(Skill.bank_version, 0) + 1)
+    )
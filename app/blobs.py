@@ -0,0 +1,204 @@
+from __future__ import annotations
+import hashlib, os, re, shutil, tempfile, time
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from flask import current_app, g
+from sqlalchemy import case, delete, func, update
+
+from . import db
+from .models import Blob, MediaAsset, RemediationUpload
+from .stats import _upsert
+
+# Content-addressed storage for uploads. Each distinct file is kept once at
+#   BLOBS_DIR/ab/cd/<sha256>
+# and RemediationUpload / MediaAsset rows point at it by hash, so the same
+# worksheet sent to a whole class is one file. Blob.refcount counts those rows;
+# `flask gc-blobs` deletes blobs that have been unreferenced for a while.
+# Contents never change under a hash, so /files/blob/<sha> is cached forever.
+#
+# GC and a new upload of the same content can meet: the upload finds the file
+# in place, then GC (which saw refcount 0) unlinks it. So an upload keeps its
+# own copy as a spare until retain() holds the Blob row, and GC unlinks while
+# it still holds the rows it deleted; retain() then puts the file back if GC
+# got there first.
+
+CHUNK = 1024 * 1024
+_SHA = re.compile(r"^[0-9a-f]{64}$")
+
+def is_sha(value: str) -> bool:
+    return bool(_SHA.match(value or ""))
+
+def blob_relpath(sha: str) -> str:
+    return f"{sha[:2]}/{sha[2:4]}/{sha}"
+
+def blob_path(sha: str) -> str:
+    return os.path.join(current_app.config["BLOBS_DIR"], sha[:2], sha[2:4], sha)
+
+def variants_path(sha: str) -> str:
+    return os.path.join(current_app.config["BLOBS_DIR"], "variants", sha)
+
+def _tmp_dir() -> str:
+    path = os.path.join(current_app.config["BLOBS_DIR"], "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def adopt(tmp: str, sha: str) -> None:
+    """Move a fully written temp file (inside BLOBS_DIR) to its place in the store."""
+    final = blob_path(sha)
+    if os.path.exists(final):
+        # Already stored: kept only until retain() knows GC isn't removing it.
+        spare = g.setdefault("_blob_spares", {})
+        if sha in spare:
+            _unlink(spare[sha])
+        spare[sha] = tmp
+        return
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(tmp, final)
+
+def _settle(sha: str) -> None:
+    """With the Blob row locked: restore the file from this upload's spare if GC removed it."""
+    spare = g.get("_blob_spares", {}).pop(sha, None)
+    final = blob_path(sha)
+    if os.path.exists(final):
+        if spare:
+            _unlink(spare)  # this upload costs no extra space
+    elif spare:
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(spare, final)
+    else:
+        current_app.logger.warning("Blob %s is referenced but its file is missing", sha)
+
+def store(stream: BinaryIO) -> Tuple[str, int]:
+    """Copy ``stream`` into the store, hashing while it streams -> (sha256, size). No DB work."""
+    h, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=_tmp_dir())
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        sha = h.hexdigest()
+        adopt(tmp, sha)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return sha, size
+
+def retain(sha: str, size: int, mime: Optional[str] = None) -> None:
+    """Count one more reference to a stored blob. Runs in the caller's transaction."""
+    db.session.execute(
+        _upsert(Blob.__table__)
+        .values(sha256=sha, size=size, mime=mime, refcount=0, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["sha256"])
+    )
+    db.session.execute(update(Blob).where(Blob.sha256 == sha)
+                       .values(refcount=Blob.refcount + 1, released_at=None))
+    _settle(sha)
+
+def release(sha: Optional[str]) -> None:
+    """Drop one reference (call when deleting a referencing row). Runs in the caller's transaction."""
+    if not sha:
+        return
+    db.session.execute(
+        update(Blob).where(Blob.sha256 == sha, Blob.refcount > 0)
+        .values(refcount=Blob.refcount - 1,
+                released_at=case((Blob.refcount <= 1, datetime.utcnow()), else_=Blob.released_at))
+    )
+
+def can_read(sha: str, user) -> bool:
+    """Media blobs are readable by any signed-in user (like /files/media); remediation blobs by its teacher and student."""
+    if user.role == "chairman":
+        return True
+    if db.session.query(MediaAsset.id).filter(MediaAsset.blob_sha == sha).first():
+        return True
+    return db.session.query(RemediationUpload.id).filter(
+        RemediationUpload.blob_sha == sha,
+        (RemediationUpload.student_id == user.id) | (RemediationUpload.teacher_id == user.id),
+    ).first() is not None
+
+def recount() -> int:
+    """Reset every refcount from the referencing rows; returns how many had drifted."""
+    counts: Dict[str, int] = {}
+    for model in (RemediationUpload, MediaAsset):
+        rows = (db.session.query(model.blob_sha, func.count())
+                .filter(model.blob_sha.isnot(None)).group_by(model.blob_sha))
+        for sha, n in rows:
+            counts[sha] = counts.get(sha, 0) + n
+    now = datetime.utcnow()
+    drifted = 0
+    for sha, refcount in db.session.query(Blob.sha256, Blob.refcount).all():
+        want = counts.get(sha, 0)
+        if refcount != want:
+            values: Dict[str, Any] = {"refcount": want}
+            if want == 0:
+                values["released_at"] = now
+            db.session.execute(update(Blob).where(Blob.sha256 == sha).values(**values))
+            drifted += 1
+    return drifted
+
+def collect_garbage(grace_sec: Optional[int] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Delete blobs unreferenced for ``grace_sec`` (BLOB_GC_GRACE_SEC), plus stray files in BLOBS_DIR."""
+    started = time.monotonic()
+    grace = current_app.config["BLOB_GC_GRACE_SEC"] if grace_sec is None else grace_sec
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+
+    drifted = recount()
+    candidates = (db.session.query(Blob.sha256, Blob.size)
+                  .filter(Blob.refcount == 0, func.coalesce(Blob.released_at, Blob.created_at) < cutoff)
+                  .all())
+    removed = []
+    if dry_run:
+        db.session.rollback()
+        removed = candidates
+    else:
+        for sha, size in candidates:
+            # Re-check refcount in the DELETE: an upload may have retained it meanwhile.
+            res = db.session.execute(delete(Blob).where(Blob.sha256 == sha, Blob.refcount == 0))
+            if res.rowcount:
+                removed.append((sha, size))
+                # Unlink before the commit: retain() of this hash waits for it, then restores the file.
+                _unlink(blob_path(sha))
+                shutil.rmtree(variants_path(sha), ignore_errors=True)
+        db.session.commit()
+
+    strays = _sweep_strays(time.time() - grace, dry_run)
+    return {"removed": len(removed), "bytes": sum(size for _, size in removed), "strays": strays,
+            "drifted": drifted, "seconds": round(time.monotonic() - started, 2)}
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _sweep_strays(older_than: float, dry_run: bool) -> int:
+    """Files with no Blob row (a request died between store() and commit) and stale temp files."""
+    root = current_app.config["BLOBS_DIR"]
+    if not os.path.isdir(root):
+        return 0
+    known = {sha for (sha,) in db.session.query(Blob.sha256)}
+    count = 0
+    for dirpath, dirs, files in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        if rel == "variants":
+            for d in list(dirs):
+                if d not in known and os.path.getmtime(os.path.join(dirpath, d)) < older_than:
+                    count += 1
+                    if not dry_run:
+                        shutil.rmtree(os.path.join(dirpath, d), ignore_errors=True)
+            dirs[:] = []
+            continue
+        for name in files:
+            path = os.path.join(dirpath, name)
+            stale = rel == "tmp" or (is_sha(name) and name not in known)
+            if stale and os.path.getmtime(path) < older_than:
+                count += 1
+                if not dry_run:
+                    _unlink(path)
+    return count
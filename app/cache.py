@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os, threading, time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from flask import Flask, current_app
+from flask_login import UserMixin
+
+from . import db
+
+class TTLCache:
+    """Small thread-safe per-process cache with expiry. Other workers catch up within ``ttl``."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        hit = self._data.get(key)
+        if hit is None or hit[0] < time.monotonic():
+            return default
+        return hit[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))  # oldest insert
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        hit = self._data.get(key)
+        if hit is not None and hit[0] >= time.monotonic():
+            return hit[1]
+        value = factory()
+        self.set(key, value, ttl)
+        return value
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+# Teacher dropdown on the login page: read on every login, changed a few times a year.
+TeacherChoice = namedtuple("TeacherChoice", "id name")
+_teachers = TTLCache(ttl=60, maxsize=1)
+
+def teacher_choices() -> List[TeacherChoice]:
+    from .models import User
+
+    def load():
+        rows = (db.session.query(User.id, User.name)
+                .filter(User.role == "teacher").order_by(User.name.asc()).all())
+        return [TeacherChoice(tid, name) for tid, name in rows]
+
+    return _teachers.get_or_set("all", load, ttl=current_app.config["TEACHER_CACHE_SEC"])
+
+def forget_teachers() -> None:
+    _teachers.clear()
+
+# Current user for Flask-Login: every authenticated request (media, reports,
+# polling pages) needs only these fields, so keep them for USER_CACHE_SEC.
+class CachedUser(UserMixin):
+    __slots__ = ("id", "role", "name", "teacher_id", "email")
+
+    def __init__(self, id: str, role: str, name: str, teacher_id: Optional[str], email: Optional[str]):
+        self.id, self.role, self.name, self.teacher_id, self.email = id, role, name, teacher_id, email
+
+    def get_id(self) -> str:
+        return self.id
+
+_users = TTLCache(ttl=30, maxsize=5000)
+
+# role and teacher_id decide what a request may see, so an edit must reach every
+# worker, not only the one that made it: forget_users() appends a byte to a
+# marker file in STORAGE_DIR, and each lookup (one stat()) drops this worker's
+# cached users when the file's mtime or size has moved.
+_marker: Dict[str, Any] = {"path": None, "seen": None}
+MARKER_MAX_BYTES = 65536
+
+def init_cache(app: Flask) -> None:
+    _users.ttl = app.config["USER_CACHE_SEC"]
+    _users.maxsize = app.config["USER_CACHE_SIZE"]
+    _marker["path"] = os.path.join(app.config["STORAGE_DIR"], ".user-cache-marker")
+    _marker["seen"] = None
+
+def _marker_state() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(_marker["path"])
+    except (OSError, TypeError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _sync_users() -> None:
+    state = _marker_state()
+    if state != _marker["seen"]:
+        _users.clear()
+        _marker["seen"] = state
+
+def load_cached_user(user_id: str) -> Optional[CachedUser]:
+    if _users.ttl > 0:
+        _sync_users()
+    hit = _users.get(user_id) if _users.ttl > 0 else None
+    if hit is not None:
+        return hit
+    from .models import User
+    row = (db.session.query(User.id, User.role, User.name, User.teacher_id, User.email)
+           .filter(User.id == user_id).first())
+    if row is None:
+        return None  # misses are not cached: the ID may be imported a moment later
+    user = CachedUser(*row)
+    if _users.ttl > 0:
+        _users.set(user_id, user)
+    return user
+
+def forget_users(user_ids) -> None:
+    """Drop edited users from the cache in every worker. Call after the edit is committed."""
+    for uid in user_ids:
+        _users.pop(uid)
+    path = _marker["path"]
+    if not path:
+        return
+    try:
+        big = os.path.exists(path) and os.path.getsize(path) >= MARKER_MAX_BYTES
+        with open(path, "wb" if big else "ab") as fh:
+            fh.write(b".")
+    except OSError as e:
+        current_app.logger.warning("Could not signal user cache invalidation (%s); other workers "
+                                   "catch up within USER_CACHE_SEC", e)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import click
+from flask import Flask
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command("rebuild-stats")
+    def rebuild_stats():
+        """Recompute the per-student/teacher/week rollup tables from attempts."""
+        from .stats import rebuild_rollups
+        n = rebuild_rollups()
+        click.echo(f"Rebuilt rollups from {n} finished attempts.")
+
+    @app.cli.command("rebuild-item-stats")
+    def rebuild_item_stats():
+        """Recompute per-question difficulty/discrimination sums from attempt answers."""
+        from .item_analysis import rebuild_item_stats as run
+        r = run()
+        click.echo(f"Rebuilt item stats for {r['questions']} questions "
+                   f"from {r['answers']} answers in {r['seconds']}s.")
+
+    @app.cli.command("media-variants")
+    @click.option("--missing-only/--all", default=True, show_default=True)
+    def media_variants(missing_only):
+        """Build WebP/JPEG variants for catalogued images (inline, not via the job queue)."""
+        from .media import build_variants, iter_images, variants
+        done = 0
+        for rel in iter_images():
+            if missing_only and variants(rel):
+                continue
+            r = build_variants(rel)
+            if "skipped" in r:
+                raise click.ClickException(r["skipped"])
+            done += 1
+            click.echo(f"  {rel}: {', '.join(r['variants'])}")
+        click.echo(f"Built variants for {done} image(s).")
+
+    @app.cli.command("sync-media")
+    def sync_media():
+        """Reconcile the media catalogue with the files in MEDIA_DIR."""
+        from .media import sync_media as run
+        r = run()
+        click.echo(f"{r['files']} files: {r['added']} added, {r['updated']} updated, {r['removed']} removed; "
+                   f"{r['links']} question links in {r['seconds']}s.")
+
+    @app.cli.command("gc-blobs")
+    @click.option("--grace", "grace_sec", type=int, default=None,
+                  help="Keep blobs unreferenced for less than this many seconds (default BLOB_GC_GRACE_SEC).")
+    @click.option("--dry-run", is_flag=True)
+    def gc_blobs(grace_sec, dry_run):
+        """Delete stored uploads that no remediation file or media row references any more."""
+        from .blobs import collect_garbage
+        r = collect_garbage(grace_sec, dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        click.echo(f"{verb} {r['removed']} blobs ({r['bytes'] / 1048576:.1f} MB) and {r['strays']} stray files "
+                   f"in {r['seconds']}s; fixed {r['drifted']} refcounts.")
+
+    @app.cli.command("clean-uploads")
+    @click.option("--ttl", "ttl_sec", type=int, default=None,
+                  help="Idle seconds before a resumable upload is dropped (default UPLOAD_SESSION_TTL_SEC).")
+    def clean_uploads(ttl_sec):
+        """Remove abandoned resumable uploads and their partial files."""
+        from .uploads import expire_sessions
+        click.echo(f"Removed {expire_sessions(ttl_sec)} abandoned upload(s).")
+
+    @app.cli.command("regrade")
+    @click.option("--skill-id", type=int, default=None, help="Only attempts for this skill.")
+    @click.option("--batch-size", type=int, default=500, show_default=True)
+    def regrade(skill_id, batch_size):
+        """Re-score past attempts against the current answer keys."""
+        from .grading import regrade_attempts
+        r = regrade_attempts(skill_id, batch_size=batch_size)
+        click.echo(f"Scanned {r['scanned']} attempts, changed {r['changed']} "
+                   f"in {r['seconds']}s ({r['per_sec']} attempts/sec).")
+
+    @app.cli.command("import-students")
+    @click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--batch-size", type=int, default=None)
+    def import_students(csv_path, batch_size):
+        """Bulk-import a student roster CSV (student_id,name[,pin,teacher_id])."""
+        from .roster import import_roster
+        counts = import_roster(csv_path, batch_size=batch_size,
+                               progress=lambda c: click.echo(f"  {c['rows']} rows...", err=True))
+        click.echo(f"Created: {counts['created']}, Updated: {counts['updated']}, Skipped: {counts['skipped']}.")
@@ -29,6 +29,8 @@ class Config:
     REPORTS_DIR = os.path.join(STORAGE_DIR, "reports")
     UPLOADS_DIR = os.path.join(STORAGE_DIR, "uploads")
     MEDIA_DIR = os.path.join(STORAGE_DIR, "media")
+    IMPORTS_DIR = os.path.join(STORAGE_DIR, "imports")
+    BLOBS_DIR = os.path.join(STORAGE_DIR, "blobs")  # uploads by SHA-256, see app/blobs.py
 
     BRAND_NAME = os.environ.get("BRAND_NAME", "Al Thaghr — Skill Tests")
     BRAND_TAGLINE = os.environ.get("BRAND_TAGLINE", "Skills • Timed Tests • Reports")
@@ -46,11 +48,75 @@ class Config:
         os.environ.get("MEDIA_ALLOWED_EXT", "png,jpg,jpeg,mp4,webm,gif").split(",")
     )
 
+    # flask (send_file from the worker) / nginx (X-Accel-Redirect) / apache (X-Sendfile)
+    FILE_DELIVERY = os.environ.get("FILE_DELIVERY", "flask")
+    # nginx `internal` location whose alias is STORAGE_DIR
+    ACCEL_REDIRECT_PREFIX = os.environ.get("ACCEL_REDIRECT_PREFIX", "/_protected")
+    FILE_MAX_AGE = int(os.environ.get("FILE_MAX_AGE", "3600"))  # media; reports always revalidate
+    BLOB_MAX_AGE = int(os.environ.get("BLOB_MAX_AGE", str(365 * 24 * 3600)))  # /files/blob/<sha>: immutable
+    BLOB_GC_GRACE_SEC = int(os.environ.get("BLOB_GC_GRACE_SEC", str(24 * 3600)))
+
+    # Test autosave (app/autosave.py): client debounce, and how often a save that
+    # only moves the per-question timers is written.
+    AUTOSAVE_DEBOUNCE_MS = int(os.environ.get("AUTOSAVE_DEBOUNCE_MS", "1500"))
+    AUTOSAVE_MIN_INTERVAL_SEC = int(os.environ.get("AUTOSAVE_MIN_INTERVAL_SEC", "15"))
+    AUTOSAVE_MAX_BYTES = int(os.environ.get("AUTOSAVE_MAX_BYTES", "65536"))
+
+    # Question markup of test.html, cached per worker by skill bank version and
+    # question order (app/fragments.py). Bounds how long new image variants or
+    # moved media take to show up; 0 disables.
+    TEST_FRAGMENT_CACHE_SEC = int(os.environ.get("TEST_FRAGMENT_CACHE_SEC", "300"))
+
+    # Resumable uploads (app/uploads.py): files above one chunk are sent in pieces.
+    UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_MB", "1024")) * 1024 * 1024
+    UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+    UPLOAD_SESSION_TTL_SEC = int(os.environ.get("UPLOAD_SESSION_TTL_SEC", str(24 * 3600)))
+
+    # Image variants (needs Pillow): widths in px, generated in the background.
+    MEDIA_VARIANT_WIDTHS = sorted(int(w) for w in os.environ.get("MEDIA_VARIANT_WIDTHS", "480,960").split(",") if w.strip())
+    MEDIA_WEBP_QUALITY = int(os.environ.get("MEDIA_WEBP_QUALITY", "78"))
+    MEDIA_JPEG_QUALITY = int(os.environ.get("MEDIA_JPEG_QUALITY", "82"))
+
     SMTP_HOST = os.environ.get("SMTP_HOST")
     SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
     SMTP_USER = os.environ.get("SMTP_USER")
     SMTP_PASS = os.environ.get("SMTP_PASS")
     SMTP_FROM = os.environ.get("SMTP_FROM")
     SMTP_TLS = os.environ.get("SMTP_TLS", "1") == "1"
+    SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "20"))
+    SMTP_BATCH_SIZE = int(os.environ.get("SMTP_BATCH_SIZE", "50"))
+    SMTP_RATE_PER_MIN = int(os.environ.get("SMTP_RATE_PER_MIN", "60"))  # 0 = unlimited
+    SMTP_MAX_TRIES = int(os.environ.get("SMTP_MAX_TRIES", "5"))
+    # A flush claims its batch; claims older than this (worker killed mid-send) are queued again
+    SMTP_CLAIM_TIMEOUT_SEC = int(os.environ.get("SMTP_CLAIM_TIMEOUT_SEC", "900"))
+    # >0: collect each teacher's reports into one digest e-mail per N minutes
+    EMAIL_DIGEST_MIN = int(os.environ.get("EMAIL_DIGEST_MIN", "0"))
+
+    # Background jobs (PDF reports, e-mail). Run `python -m app.worker` as a separate
+    # process, or leave the embedded worker thread on for single-service deploys.
+    JOBS_EMBEDDED_WORKER = os.environ.get("JOBS_EMBEDDED_WORKER", "1") == "1"
+    JOB_POLL_SEC = float(os.environ.get("JOB_POLL_SEC", "2"))
+    JOB_MAX_TRIES = int(os.environ.get("JOB_MAX_TRIES", "5"))
+    JOB_BACKOFF_SEC = int(os.environ.get("JOB_BACKOFF_SEC", "30"))
+    JOB_LOCK_TIMEOUT_SEC = int(os.environ.get("JOB_LOCK_TIMEOUT_SEC", "600"))
+
+    ROSTER_BATCH_SIZE = int(os.environ.get("ROSTER_BATCH_SIZE", "1000"))
+    ROSTER_HASH_WORKERS = int(os.environ.get("ROSTER_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+    PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "50"))
+    API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", "500"))
+
+    # Per-request SQL profiling: query count/time headers and N+1 warnings.
+    SQL_PROFILE = os.environ.get("SQL_PROFILE", "0") == "1"
+    SQL_PROFILE_REPEAT_LIMIT = int(os.environ.get("SQL_PROFILE_REPEAT_LIMIT", "10"))
+    SQL_PROFILE_STRICT = os.environ.get("SQL_PROFILE_STRICT", "0") == "1"  # raise instead of warn
+
+    # werkzeug method string incl. cost, e.g. "scrypt:16384:8:1" or "pbkdf2:sha256:100000".
+    # Stored hashes are rewritten to this method on each user's next successful login.
+    PIN_HASH_METHOD = os.environ.get("PIN_HASH_METHOD", "scrypt:32768:8:1")
+    TEACHER_CACHE_SEC = int(os.environ.get("TEACHER_CACHE_SEC", "60"))
+    # Logged-in user (id, role, name, teacher_id, email) cached per worker; 0 disables.
+    USER_CACHE_SEC = int(os.environ.get("USER_CACHE_SEC", "30"))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "5000"))
 
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
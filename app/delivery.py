@@ -0,0 +1,65 @@
+from __future__ import annotations
+import mimetypes, os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, abort, current_app, send_file
+from werkzeug.utils import safe_join
+
+# How protected files leave the app once the view has checked permissions:
+#   flask  - send_file from the worker (conditional GET, strong ETag, byte ranges)
+#   nginx  - X-Accel-Redirect to an `internal` location aliased to STORAGE_DIR
+#   apache - X-Sendfile with the absolute path (mod_xsendfile)
+# With a proxy the worker is free as soon as the headers are written, however
+# long a class takes to stream a video.
+
+MODES = ("flask", "nginx", "apache")
+
+def resolve(base_dir: str, relpath: str) -> str:
+    """Absolute path of ``relpath`` inside ``base_dir``; 404 on traversal or a missing file."""
+    path = safe_join(base_dir, relpath)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return path
+
+def _accel_uri(abs_path: str) -> str:
+    root = os.path.realpath(current_app.config["STORAGE_DIR"])
+    rel = os.path.relpath(os.path.realpath(abs_path), root)
+    if rel.startswith(".."):
+        raise ValueError(f"{abs_path} is outside STORAGE_DIR; nginx cannot serve it")
+    return current_app.config["ACCEL_REDIRECT_PREFIX"].rstrip("/") + "/" + quote(rel.replace(os.sep, "/"))
+
+def deliver(abs_path: str, *, download_name: Optional[str] = None, as_attachment: bool = False,
+            max_age: Optional[int] = None, mimetype: Optional[str] = None, immutable: bool = False) -> Response:
+    """``immutable`` is for content-addressed files (blobs): cached for BLOB_MAX_AGE without revalidation."""
+    mode = current_app.config["FILE_DELIVERY"]
+    if immutable:
+        max_age = current_app.config["BLOB_MAX_AGE"]
+    max_age = current_app.config["FILE_MAX_AGE"] if max_age is None else max_age
+    mimetype = mimetype or mimetypes.guess_type(download_name or abs_path)[0] or "application/octet-stream"
+
+    if mode == "nginx":
+        # nginx keeps Content-Type, Content-Disposition and Cache-Control from this
+        # response and adds its own ETag, Last-Modified and Range handling.
+        resp = Response(status=200)
+        resp.headers["X-Accel-Redirect"] = _accel_uri(abs_path)
+        resp.headers["Content-Type"] = mimetype
+        if as_attachment:
+            name = download_name or os.path.basename(abs_path)
+            resp.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name)}"
+        resp.headers["Cache-Control"] = f"private, max-age={max_age}" if max_age else "private, no-cache"
+        if immutable:
+            resp.headers["Cache-Control"] += ", immutable"
+        return resp
+
+    # "apache" is Flask's own USE_X_SENDFILE (set in create_app); send_file then
+    # emits X-Sendfile instead of reading the file.
+    resp = send_file(abs_path, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                     conditional=True, etag=True, max_age=max_age)
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    if not max_age:
+        resp.cache_control.no_cache = True
+    if immutable:
+        resp.cache_control.immutable = True
+    return resp
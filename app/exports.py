@@ -0,0 +1,164 @@
+from __future__ import annotations
+import csv, io, tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from flask import Response, stream_with_context
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import User, Skill, Attempt, StudentSkillStat, TeacherSkillStat, TeacherStudentStat
+
+# Streaming exports. Rows come from server-side cursors (yield_per) as plain
+# tuples and are written out in chunks, so memory stays flat however many
+# attempts there are.
+
+YIELD_PER = 1000
+CSV_FLUSH_ROWS = 500
+XLSX_CHUNK = 64 * 1024
+FORMATS = ("csv", "xlsx")
+
+def _pct(v: Optional[float]) -> Optional[float]:
+    return round(v * 100, 1) if v is not None else None
+
+def _result(passed: Optional[bool]) -> str:
+    return "" if passed is None else ("PASS" if passed else "FAIL")
+
+ATTEMPT_HEADER = ["attempt_id", "finished_at", "student_id", "student_name", "teacher_id", "teacher_name",
+                  "skill", "iso_year", "iso_week", "score_pct", "correct", "total", "result", "duration_sec"]
+
+def attempt_rows(filters: Dict[str, Any]) -> Iterator[List[Any]]:
+    """Finished attempts, oldest first. Accepts pagination.attempt_filters() output."""
+    student, teacher = aliased(User), aliased(User)
+    q = (
+        db.session.query(
+            Attempt.id, Attempt.finished_at, Attempt.student_id, student.name, Attempt.teacher_id, teacher.name,
+            Skill.name, Attempt.iso_year, Attempt.iso_week, Attempt.score, Attempt.correct_count,
+            Attempt.total_count, Attempt.passed, Attempt.duration_sec,
+        )
+        .join(student, student.id == Attempt.student_id)
+        .join(teacher, teacher.id == Attempt.teacher_id)
+        .join(Skill, Skill.id == Attempt.skill_id)
+        .filter(Attempt.finished_at.isnot(None))
+    )
+    if "teacher_id" in filters:
+        q = q.filter(Attempt.teacher_id == filters["teacher_id"])
+    if "skill_id" in filters:
+        q = q.filter(Attempt.skill_id == filters["skill_id"])
+    if "week" in filters:
+        q = q.filter(Attempt.iso_year == filters["week"][0], Attempt.iso_week == filters["week"][1])
+    if "result" in filters:
+        q = q.filter(Attempt.passed.is_(filters["result"] == "pass"))
+
+    for r in q.order_by(Attempt.finished_at.asc(), Attempt.id.asc()).yield_per(YIELD_PER):
+        yield [r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8], _pct(r[9]), r[10], r[11], _result(r[12]), r[13]]
+
+PERFORMANCE_HEADER = ["teacher_id", "teacher_name", "skill", "attempts", "avg_pct", "best_pct",
+                      "passed", "failed", "last_attempt_at"]
+
+def teacher_performance_rows() -> Iterator[List[Any]]:
+    """One row per (teacher, skill) from the rollups."""
+    q = (
+        db.session.query(
+            User.id, User.name, Skill.name, TeacherSkillStat.attempts, TeacherSkillStat.score_sum,
+            TeacherSkillStat.best_score, TeacherSkillStat.passed_count, TeacherSkillStat.failed_count,
+            TeacherSkillStat.last_at,
+        )
+        .join(TeacherSkillStat, TeacherSkillStat.teacher_id == User.id)
+        .join(Skill, Skill.id == TeacherSkillStat.skill_id)
+        .order_by(User.name.asc(), Skill.order_index.asc())
+    )
+    for tid, tname, skill, n, total, best, passed, failed, last_at in q.yield_per(YIELD_PER):
+        yield [tid, tname, skill, n, _pct(total / n) if n else None, _pct(best), passed, failed, last_at]
+
+ROSTER_HEADER = ["student_id", "student_name", "teacher_id", "teacher_name", "attempts", "avg_pct", "passed", "failed"]
+
+def roster_rows(teacher_id: Optional[str] = None) -> Iterator[List[Any]]:
+    """Students with their overall totals; with ``teacher_id``, that teacher's class and only
+    the attempts taken with that teacher (as on the teacher dashboard)."""
+    teacher = aliased(User)
+    if teacher_id is None:
+        agg = (
+            db.session.query(
+                StudentSkillStat.student_id.label("sid"),
+                func.sum(StudentSkillStat.attempts).label("attempts"),
+                func.sum(StudentSkillStat.score_sum).label("score_sum"),
+                func.sum(StudentSkillStat.passed_count).label("passed"),
+                func.sum(StudentSkillStat.failed_count).label("failed"),
+            )
+            .group_by(StudentSkillStat.student_id)
+            .subquery()
+        )
+    else:
+        agg = (
+            db.session.query(
+                TeacherStudentStat.student_id.label("sid"),
+                TeacherStudentStat.attempts.label("attempts"),
+                TeacherStudentStat.score_sum.label("score_sum"),
+                TeacherStudentStat.passed_count.label("passed"),
+                TeacherStudentStat.failed_count.label("failed"),
+            )
+            .filter(TeacherStudentStat.teacher_id == teacher_id)
+            .subquery()
+        )
+    q = (
+        db.session.query(User.id, User.name, User.teacher_id, teacher.name,
+                         agg.c.attempts, agg.c.score_sum, agg.c.passed, agg.c.failed)
+        .outerjoin(teacher, teacher.id == User.teacher_id)
+        .outerjoin(agg, agg.c.sid == User.id)
+        .filter(User.role == "student")
+    )
+    if teacher_id is not None:
+        q = q.filter(User.teacher_id == teacher_id)
+    for sid, name, tid, tname, n, total, passed, failed in q.order_by(User.name.asc(), User.id.asc()).yield_per(YIELD_PER):
+        yield [sid, name, tid, tname, n or 0, _pct(total / n) if n else None, passed or 0, failed or 0]
+
+def _cell(v: Any) -> Any:
+    return v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v
+
+def _csv_chunks(header: Sequence[str], rows: Iterable[List[Any]]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    buf.write("\ufeff")  # Excel needs the BOM to read UTF-8 (Arabic names)
+    w.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        w.writerow([_cell(v) for v in row])
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def _xlsx_chunks(header: Sequence[str], rows: Iterable[List[Any]]) -> Iterator[bytes]:
+    # XLSX is a zip, so it can't be emitted row by row; write-only mode keeps the
+    # sheet on disk and the finished file is streamed from a temp file.
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(header))
+    for row in rows:
+        ws.append(row)
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(XLSX_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+def export_response(name: str, fmt: str, header: Sequence[str], rows: Iterable[List[Any]]) -> Response:
+    """Stream ``rows`` as a CSV/XLSX download. ``rows`` is consumed lazily inside the response."""
+    filename = f"{name}_{datetime.utcnow():%Y%m%d_%H%M}.{fmt}"
+    if fmt == "xlsx":
+        body = _xlsx_chunks(header, rows)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = _csv_chunks(header, rows)
+        mimetype = "text/csv"  # Flask adds "; charset=utf-8" to text/* types
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
@@ -1,5 +1,6 @@
 import json
 from flask import Blueprint
+from markupsafe import Markup, escape
 
 bp = Blueprint("filters", __name__)
 
@@ -11,3 +12,37 @@ def loads_filter(s):
         return json.loads(s)
     except Exception:
         return None
+
+@bp.app_template_filter("filesize")
+def filesize(n):
+    n = float(n or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+@bp.app_template_global("media_url")
+def media_url(relpath):
+    from .media import media_url as url
+    return url(relpath)
+
+@bp.app_template_global("media_img")
+def media_img(relpath, alt="", css="media", sizes="(max-width: 700px) 100vw, 700px"):
+    """<picture> for a library image: WebP + JPEG srcset when variants exist, else the original."""
+    from .media import media_url, variant_url, variants
+    found = variants(relpath)
+    if not found:
+        src = media_url(relpath)
+        return Markup(f'<img class="{escape(css)}" src="{escape(src)}" alt="{escape(alt)}" loading="lazy">')
+
+    def srcset(items):
+        return ", ".join(f"{variant_url(relpath, name)} {w}w" for w, name in items)
+
+    largest_jpg = variant_url(relpath, found["jpg"][-1][1])
+    webp = (f'<source type="image/webp" srcset="{escape(srcset(found["webp"]))}" sizes="{escape(sizes)}">'
+            if found["webp"] else "")
+    return Markup(
+        f'<picture>{webp}'
+        f'<img class="{escape(css)}" src="{escape(largest_jpg)}" srcset="{escape(srcset(found["jpg"]))}" '
+        f'sizes="{escape(sizes)}" alt="{escape(alt)}" loading="lazy" decoding="async"></picture>'
+    )
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from typing import Optional, Sequence, Tuple
+
+from flask import current_app
+from markupsafe import Markup
+
+from .bank import CompiledQuestion
+from .cache import TTLCache
+from .pools import option_order
+
+# Each question of test.html renders the same for everyone taking a skill, so
+# its markup is kept per (skill, bank version, question, option order) until
+# TEST_FRAGMENT_CACHE_SEC passes. A question edit bumps the bank version and so
+# changes the key. Pooled skills draw a different subset per attempt
+# (app/pools.py), so pages are assembled from these per-question pieces;
+# test.html fills in the per-attempt parts (form action, timer, saved answers).
+
+_fragments = TTLCache(ttl=300, maxsize=8192)
+
+def question_markup(skill_id: int, version: int, questions: Sequence[CompiledQuestion],
+                    seed: Optional[int] = None) -> Markup:
+    """Rendered test_question.html for each question, in this order, options ordered by ``seed``."""
+    ttl = current_app.config["TEST_FRAGMENT_CACHE_SEC"]
+    template = current_app.jinja_env.get_template("test_question.html")
+
+    def render(q: CompiledQuestion, order: Tuple[int, ...]) -> Markup:
+        return Markup(template.render(q=q, options=[(i, q.options[i]) for i in order]))
+
+    parts = []
+    for q in questions:
+        order = option_order(q, seed)
+        if ttl <= 0:
+            parts.append(render(q, order))
+        else:
+            parts.append(_fragments.get_or_set((skill_id, version or 0, q.id, order),
+                                               lambda: render(q, order), ttl=ttl))
+    return Markup("").join(parts)
+
+def forget_fragments() -> None:
+    _fragments.clear()
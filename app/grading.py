@@ -0,0 +1,186 @@
+from __future__ import annotations
+import json, time
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .jobs import handler, report_progress
+from .models import Skill, Attempt
+
+class Grader:
+    """Grades one question type. Keys are compiled once per bank; responses per submit."""
+
+    def compile_key(self, raw: Any) -> Tuple[Any, str]:
+        """Stored answer_json value -> (typed key, display string)."""
+        return raw, str(raw) if raw is not None else "-"
+
+    def read(self, form, field: str) -> Any:
+        """Form data -> JSON-serialisable response stored with the attempt."""
+        return form.get(field)
+
+    def from_display(self, display: Optional[str]) -> Any:
+        """Recover a response from answers saved before responses were stored."""
+        return None if display in (None, "-") else display
+
+    def grade(self, response: Any, key: Any) -> Tuple[bool, str]:
+        """-> (is_correct, display string of the response)."""
+        return False, str(response) if response is not None else "-"
+
+GRADERS: Dict[str, Grader] = {}
+_FALLBACK = Grader()
+
+def register(*qtypes: str) -> Callable[[Type[Grader]], Type[Grader]]:
+    def deco(cls):
+        inst = cls()
+        for qt in qtypes:
+            GRADERS[qt] = inst
+        return cls
+    return deco
+
+def grader_for(qtype: str) -> Grader:
+    return GRADERS.get(qtype, _FALLBACK)
+
+@register("mcq_single", "true_false", "image_mcq_single", "video_cued_mcq_single")
+class SingleChoiceGrader(Grader):
+    def compile_key(self, raw):
+        try:
+            return (int(raw) if raw is not None else None), (str(raw) if raw is not None else "-")
+        except Exception:
+            return None, str(raw)
+
+    def grade(self, response, key):
+        try:
+            ok = response is not None and key is not None and int(response) == key
+        except Exception:
+            ok = False
+        return ok, response if response is not None else "-"
+
+@register("mcq_multi")
+class MultiChoiceGrader(Grader):
+    def compile_key(self, raw):
+        try:
+            key = frozenset(int(x) for x in (raw or []))
+        except Exception:
+            return None, "-"
+        return key, ",".join(map(str, sorted(key))) if key else "-"
+
+    def read(self, form, field):
+        return form.getlist(field)
+
+    def from_display(self, display):
+        return [] if display in (None, "-") else [x for x in display.split(",") if x]
+
+    def grade(self, response, key):
+        try:
+            chosen = frozenset(int(x) for x in (response or []))
+        except Exception:
+            return False, "-"
+        return (key is not None and chosen == key), ",".join(map(str, sorted(chosen))) if chosen else "-"
+
+@register("short_text")
+class ShortTextGrader(Grader):
+    def compile_key(self, raw):
+        return str(raw or "").strip().lower(), str(raw or "-")
+
+    def grade(self, response, key):
+        given = (response or "").strip().lower()
+        return (bool(key) and given == key), response or "-"
+
+def regrade_attempts(skill_id: Optional[int] = None, batch_size: int = 500) -> Dict[str, Any]:
+    """Re-score finished attempts from their stored responses against the current answer keys.
+
+    Streams attempts in id order, one batch per transaction. Rollups and item stats are
+    adjusted by the score changes in the same transaction, so concurrent submits are kept.
+    """
+    from .answers import answers_for, set_correctness
+    from .bank import get_bank
+    from .item_analysis import regrade_answer_stats
+    from .reports import enqueue_attempt_report
+    from .stats import regrade_rollups
+
+    started = time.monotonic()
+    skills = Skill.query.all()
+    pass_pcts = {s.id: (s.pass_pct or 80) for s in skills}
+    versions = {s.id: s.bank_version for s in skills}
+    scanned = changed = 0
+    last_id = 0
+
+    while True:
+        q = Attempt.query.filter(Attempt.finished_at.isnot(None), Attempt.score.isnot(None), Attempt.id > last_id)
+        if skill_id is not None:
+            q = q.filter(Attempt.skill_id == skill_id)
+        batch = q.order_by(Attempt.id.asc()).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        updates, regraded, answer_changes, rollup_changes = [], [], [], []
+        item_deltas: Dict[int, Dict[str, float]] = {}
+        answers = answers_for([a.id for a in batch])
+        for a in batch:
+            scanned += 1
+            bank = get_bank(a.skill_id, versions.get(a.skill_id))
+            rows = answers[a.id]
+            correct, dirty, graded = 0, False, []
+            for row in rows:
+                cq = bank.get(row.question_id)
+                is_correct = row.is_correct
+                if cq is not None:
+                    response = json.loads(row.response_json) if row.response_json else None
+                    is_correct, _ = grader_for(cq.qtype).grade(response, cq.answer)
+                    if is_correct != row.is_correct:
+                        answer_changes.append({"id": row.id, "is_correct": is_correct})
+                        dirty = True
+                correct += 1 if is_correct else 0
+                graded.append((row.question_id, bool(row.is_correct), is_correct))
+
+            total = len(rows)
+            score = correct / total if total else 0.0
+            passed = score * 100 >= pass_pcts.get(a.skill_id, 80)
+            if dirty or correct != a.correct_count or total != a.total_count or bool(a.passed) != passed:
+                changed += 1
+                updates.append({
+                    "id": a.id, "score": score, "correct_count": correct, "total_count": total,
+                    "passed": passed, "pdf_path": None,
+                })
+                regraded.append(a)
+                old = a.score or 0.0
+                rollup_changes.append({
+                    "student_id": a.student_id, "teacher_id": a.teacher_id, "skill_id": a.skill_id,
+                    "iso_year": a.iso_year, "iso_week": a.iso_week, "finished_at": a.finished_at,
+                    "old_score": old, "old_passed": bool(a.passed), "score": score, "passed": passed,
+                })
+                for qid, was_ok, ok in graded:
+                    d = item_deltas.setdefault(qid, dict.fromkeys(
+                        ("correct", "total_sum", "total_sq_sum", "correct_total_sum"), 0))
+                    d["correct"] += int(ok) - int(was_ok)
+                    d["total_sum"] += score - old
+                    d["total_sq_sum"] += score * score - old * old
+                    d["correct_total_sum"] += (score if ok else 0.0) - (old if was_ok else 0.0)
+
+        set_correctness(answer_changes)
+        if updates:
+            db.session.execute(update(Attempt), updates)
+            regrade_rollups(rollup_changes)
+            regrade_answer_stats(item_deltas)
+            # Reports are re-rendered; the teacher e-mail is deduplicated per attempt.
+            for a in regraded:
+                enqueue_attempt_report(a, rebuild=True)
+        db.session.commit()
+        db.session.expunge_all()
+        report_progress({"scanned": scanned, "changed": changed})
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    result = {"scanned": scanned, "changed": changed, "seconds": round(elapsed, 2),
+              "per_sec": round(scanned / elapsed, 1)}
+    current_app.logger.info("Regrade finished: %s", result)
+    return result
+
+def regrade_job_key(skill_id: Optional[int], version: int) -> str:
+    return f"regrade:{skill_id or 'all'}:{version}"
+
+@handler("regrade")
+def regrade_job(payload: Dict[str, Any]):
+    return regrade_attempts(payload.get("skill_id"))
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import math, time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, case, func, insert, update
+
+from . import db
+from .models import Attempt, AttemptAnswer, Question, QuestionStat
+from .stats import _upsert
+
+# Classical item analysis from running sums (see QuestionStat):
+#   difficulty  p   = correct / answers           (share answering correctly)
+#   discrimination  = point-biserial r between "item correct" and the attempt score
+#                     r = (M1 - M0) / s * sqrt(p * (1 - p))
+# M1/M0 are mean scores of students who got the item right/wrong, s the score SD.
+
+HARD_P = 0.3           # below: most students miss it
+POOR_DISCRIMINATION = 0.2
+
+def record_answers(graded: List[Dict[str, Any]], score: float) -> None:
+    """Fold one submitted attempt into QuestionStat. Runs in the caller's transaction."""
+    if not graded:
+        return
+    now = datetime.utcnow()
+    rows = []
+    for g in graded:
+        ok = bool(g.get("is_correct"))
+        spent = g.get("time_spent_sec")
+        rows.append({
+            "question_id": g["question_id"], "answers": 1, "correct": 1 if ok else 0,
+            "total_sum": score, "total_sq_sum": score * score, "correct_total_sum": score if ok else 0.0,
+            "time_sum": spent or 0, "timed": 1 if spent is not None else 0, "updated_at": now,
+        })
+    t = QuestionStat.__table__
+    stmt = _upsert(t).values(rows)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["question_id"],
+        set_={c: t.c[c] + new[c] for c in ("answers", "correct", "total_sum", "total_sq_sum",
+                                            "correct_total_sum", "time_sum", "timed")}
+        | {"updated_at": new.updated_at},
+    )
+    db.session.execute(stmt)
+
+def regrade_answer_stats(deltas: Dict[int, Dict[str, float]]) -> None:
+    """Apply per-question {"correct", "total_sum", "total_sq_sum", "correct_total_sum"} deltas
+    from re-scored attempts. Answer counts and timings do not change. Runs in the caller's transaction.
+    """
+    if not deltas:
+        return
+    t = QuestionStat.__table__
+    cols = ("correct", "total_sum", "total_sq_sum", "correct_total_sum")
+    stmt = (
+        update(t)
+        .where(t.c.question_id == bindparam("b_qid"))
+        .values({c: t.c[c] + bindparam(f"d_{c}") for c in cols} | {"updated_at": bindparam("b_now")})
+    )
+    now = datetime.utcnow()
+    db.session.execute(stmt, [
+        {"b_qid": qid, "b_now": now, **{f"d_{c}": d[c] for c in cols}} for qid, d in deltas.items()
+    ])
+
+def rebuild_item_stats() -> Dict[str, Any]:
+    """Recompute QuestionStat with one aggregate query over attempt_answer."""
+    started = time.monotonic()
+    score = func.coalesce(Attempt.score, 0.0)
+    rows = (
+        db.session.query(
+            AttemptAnswer.question_id,
+            func.count(AttemptAnswer.id),
+            func.sum(case((AttemptAnswer.is_correct, 1), else_=0)),
+            func.sum(score),
+            func.sum(score * score),
+            func.sum(case((AttemptAnswer.is_correct, score), else_=0.0)),
+            func.sum(func.coalesce(AttemptAnswer.time_spent_sec, 0)),
+            func.count(AttemptAnswer.time_spent_sec),
+        )
+        .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+        .join(Question, Question.id == AttemptAnswer.question_id)
+        .filter(Attempt.finished_at.isnot(None))
+        .group_by(AttemptAnswer.question_id)
+        .all()
+    )
+    now = datetime.utcnow()
+    db.session.query(QuestionStat).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(insert(QuestionStat), [
+            {"question_id": qid, "answers": n, "correct": c or 0, "total_sum": s or 0.0,
+             "total_sq_sum": s2 or 0.0, "correct_total_sum": s1 or 0.0, "time_sum": ts or 0,
+             "timed": tn or 0, "updated_at": now}
+            for qid, n, c, s, s2, s1, ts, tn in rows
+        ])
+    db.session.commit()
+    answers = sum(r[1] for r in rows)
+    return {"questions": len(rows), "answers": answers, "seconds": round(time.monotonic() - started, 2)}
+
+def difficulty(st: QuestionStat) -> Optional[float]:
+    return st.correct / st.answers if st.answers else None
+
+def discrimination(st: QuestionStat) -> Optional[float]:
+    n, n1 = st.answers, st.correct
+    if not n or n1 in (0, n):
+        return None  # everyone (or no one) got it right: r is undefined
+    mean = st.total_sum / n
+    var = st.total_sq_sum / n - mean * mean
+    if var <= 1e-12:
+        return None
+    m1 = st.correct_total_sum / n1
+    m0 = (st.total_sum - st.correct_total_sum) / (n - n1)
+    p = n1 / n
+    return (m1 - m0) / math.sqrt(var) * math.sqrt(p * (1 - p))
+
+def item_report(skill_id: int, min_answers: int = 1) -> List[Dict[str, Any]]:
+    """Questions of a skill, most-missed first, with difficulty and discrimination."""
+    rows = (
+        db.session.query(Question, QuestionStat)
+        .join(QuestionStat, QuestionStat.question_id == Question.id)
+        .filter(Question.skill_id == skill_id, QuestionStat.answers >= min_answers)
+        .order_by((QuestionStat.correct * 1.0 / QuestionStat.answers).asc(), Question.id.asc())
+        .all()
+    )
+    out = []
+    for q, st in rows:
+        p, r = difficulty(st), discrimination(st)
+        flags = []
+        if p is not None and p < HARD_P:
+            flags.append("hard")
+        if r is not None and r < POOR_DISCRIMINATION:
+            flags.append("check key" if r < 0 else "low discrimination")
+        out.append({
+            "question": q, "answers": st.answers, "correct": st.correct,
+            "p": round(p, 3) if p is not None else None,
+            "r": round(r, 3) if r is not None else None,
+            "avg_time": round(st.time_sum / st.timed, 1) if st.timed else None,
+            "flags": flags,
+        })
+    return out
@@ -0,0 +1,183 @@
+from __future__ import annotations
+import json, threading, time, traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from flask import Flask, current_app
+from sqlalchemy import update
+
+from . import db
+from .models import Job
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+_running = threading.local()
+
+def handler(kind: str):
+    """Register a job handler. It receives the payload dict and may return a result dict."""
+    def deco(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return deco
+
+def _load_handlers() -> None:
+    # Modules that register handlers with @handler.
+    from . import grading, mailer, media, reports, roster, uploads  # noqa: F401
+
+def enqueue(kind: str, payload: Optional[Dict[str, Any]] = None, *, key: Optional[str] = None,
+            delay_sec: int = 0, requeue: bool = False) -> Job:
+    """Add a job to the caller's transaction. A job with the same ``key`` is only queued once;
+    with ``requeue`` one that already finished (done or failed) under that key is queued again."""
+    if key:
+        existing = Job.query.filter_by(key=key).first()
+        if existing and requeue and existing.status in ("done", "failed"):
+            existing.status, existing.tries, existing.locked_at = "queued", 0, None
+            existing.last_error = existing.result_json = existing.finished_at = None
+            existing.payload_json = json.dumps(payload or {}, ensure_ascii=False)
+            existing.run_after = datetime.utcnow() + timedelta(seconds=delay_sec)
+        if existing:
+            return existing
+    job = Job(
+        kind=kind,
+        key=key,
+        payload_json=json.dumps(payload or {}, ensure_ascii=False),
+        max_tries=current_app.config["JOB_MAX_TRIES"],
+        run_after=datetime.utcnow() + timedelta(seconds=delay_sec),
+    )
+    db.session.add(job)
+    return job
+
+def job_for(key: str) -> Optional[Job]:
+    return Job.query.filter_by(key=key).first()
+
+def report_progress(data: Dict[str, Any]) -> None:
+    """From inside a handler: store interim progress on the running job and renew its lock (committed).
+
+    Long handlers call this once per batch so the job is not requeued as stale while it runs.
+    """
+    job_id = getattr(_running, "job_id", None)
+    if job_id is None:
+        return
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running")
+        .values(result_json=json.dumps(data, ensure_ascii=False, default=str), locked_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+def _heartbeat(app: Flask, job_id: int, stop: threading.Event) -> None:
+    """Renew the job's lock every quarter lock timeout until ``stop`` is set.
+
+    Covers handlers that block for long without reporting progress (one big render or query).
+    """
+    every = max(app.config["JOB_LOCK_TIMEOUT_SEC"] / 4, 0.05)
+    while not stop.wait(every):
+        try:
+            with app.app_context():
+                db.session.execute(
+                    update(Job).where(Job.id == job_id, Job.status == "running").values(locked_at=datetime.utcnow())
+                )
+                db.session.commit()
+                db.session.remove()
+        except Exception:
+            app.logger.warning("Heartbeat for job %s failed", job_id, exc_info=True)
+
+def _requeue_stale(now: datetime) -> None:
+    cutoff = now - timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT_SEC"])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_at < cutoff)
+        .values(status="queued", locked_at=None)
+    )
+    db.session.commit()
+
+def claim_next() -> Optional[Job]:
+    """Atomically move the oldest due job to ``running``. Safe with several workers."""
+    now = datetime.utcnow()
+    _requeue_stale(now)
+    candidates = (
+        db.session.query(Job.id)
+        .filter(Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after.asc(), Job.id.asc())
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        res = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", locked_at=now, tries=Job.tries + 1)
+        )
+        db.session.commit()
+        if res.rowcount == 1:
+            return db.session.get(Job, job_id)
+    return None
+
+def run_job(job: Job) -> None:
+    fn = HANDLERS.get(job.kind)
+    _running.job_id = job.id
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(current_app._get_current_object(), job.id, stop),
+                     name=f"job-{job.id}-heartbeat", daemon=True).start()
+    try:
+        if fn is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        result = fn(json.loads(job.payload_json or "{}"))
+    except Exception:
+        db.session.rollback()
+        err = traceback.format_exc()
+        current_app.logger.warning("Job %s (%s) failed, try %s/%s", job.id, job.kind, job.tries, job.max_tries)
+        job = db.session.get(Job, job.id)
+        job.last_error = err[-4000:]
+        job.locked_at = None
+        if job.tries >= job.max_tries:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+        else:
+            backoff = current_app.config["JOB_BACKOFF_SEC"] * (2 ** (job.tries - 1))
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=backoff)
+        db.session.commit()
+        return
+    finally:
+        stop.set()
+        _running.job_id = None
+
+    job.status = "done"
+    job.locked_at = None
+    job.finished_at = datetime.utcnow()
+    if result is not None:
+        job.result_json = json.dumps(result, ensure_ascii=False, default=str)
+    db.session.commit()
+
+def work_once() -> bool:
+    """Run at most one due job. Returns True if a job was run."""
+    job = claim_next()
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+def run_worker(app: Flask, *, stop: Optional[threading.Event] = None, burst: bool = False) -> None:
+    """Poll for jobs until ``stop`` is set. With ``burst`` the loop exits once the queue is empty."""
+    _load_handlers()
+    poll = app.config["JOB_POLL_SEC"]
+    while not (stop and stop.is_set()):
+        try:
+            with app.app_context():
+                ran = work_once()
+                db.session.remove()
+        except Exception:
+            app.logger.exception("Job worker loop error")
+            ran = False
+        if not ran:
+            if burst:
+                return
+            time.sleep(poll)
+
+def start_embedded_worker(app: Flask) -> Optional[threading.Thread]:
+    """Start a daemon worker thread inside a web process when JOBS_EMBEDDED_WORKER is on."""
+    if not app.config.get("JOBS_EMBEDDED_WORKER"):
+        return None
+    t = threading.Thread(target=run_worker, args=(app,), name="job-worker", daemon=True)
+    t.start()
+    return t
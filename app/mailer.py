@@ -0,0 +1,236 @@
+from __future__ import annotations
+import calendar, json, os, smtplib, time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .jobs import handler, enqueue
+from .models import OutboxMessage
+
+def smtp_configured() -> bool:
+    cfg = current_app.config
+    return bool(cfg.get("SMTP_HOST") and cfg.get("SMTP_FROM"))
+
+def _flush_bucket(when: datetime) -> str:
+    return when.strftime("%Y%m%d%H%M")
+
+def _schedule_flush(when: datetime) -> None:
+    delay = max(0, int((when - datetime.utcnow()).total_seconds()))
+    enqueue("outbox_flush", key=f"outbox_flush:{_flush_bucket(when)}", delay_sec=delay)
+
+def queue_email(to_email: str, subject: str, body: str, *, attachments: Optional[List[Dict[str, str]]] = None,
+                dedupe_key: Optional[str] = None, digest: bool = False) -> Optional[OutboxMessage]:
+    """Add a message to the outbox in the caller's transaction and schedule a flush."""
+    if dedupe_key and OutboxMessage.query.filter_by(dedupe_key=dedupe_key).first():
+        return None
+
+    send_after = datetime.utcnow()
+    digest_min = current_app.config.get("EMAIL_DIGEST_MIN") or 0
+    if digest and digest_min > 0:
+        # Align to the digest window so every report in it goes out together.
+        epoch = calendar.timegm(send_after.utctimetuple()) // (digest_min * 60)
+        send_after = datetime.utcfromtimestamp((epoch + 1) * digest_min * 60)
+
+    msg = OutboxMessage(
+        dedupe_key=dedupe_key,
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        attachments_json=json.dumps(attachments or [], ensure_ascii=False),
+        digest=bool(digest and digest_min > 0),
+        send_after=send_after,
+    )
+    db.session.add(msg)
+    _schedule_flush(send_after)
+    return msg
+
+class SmtpSession:
+    """One authenticated SMTP connection reused for many messages, with a send-rate cap."""
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.cfg = cfg
+        self.server: Optional[smtplib.SMTP] = None
+        rate = cfg.get("SMTP_RATE_PER_MIN") or 0
+        self.min_interval = 60.0 / rate if rate > 0 else 0.0
+        self._last_send = 0.0
+
+    def __enter__(self) -> "SmtpSession":
+        self.connect()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def connect(self) -> None:
+        cfg = self.cfg
+        server = smtplib.SMTP(cfg["SMTP_HOST"], cfg.get("SMTP_PORT", 587), timeout=cfg.get("SMTP_TIMEOUT", 20))
+        if cfg.get("SMTP_TLS", True):
+            server.starttls()
+        if cfg.get("SMTP_USER") and cfg.get("SMTP_PASS"):
+            server.login(cfg["SMTP_USER"], cfg["SMTP_PASS"])
+        self.server = server
+
+    def close(self) -> None:
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            except OSError:
+                pass
+            self.server = None
+
+    def send(self, msg: EmailMessage) -> None:
+        if self.min_interval:
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.connect()
+            self.server.send_message(msg)
+        self._last_send = time.monotonic()
+
+def _build_message(to_email: str, subject: str, body: str, attachments: List[Dict[str, str]]) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = current_app.config["SMTP_FROM"]
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body)
+    for a in attachments:
+        with open(a["path"], "rb") as f:
+            data = f.read()
+        maintype, subtype = (a.get("mime") or "application/pdf").split("/", 1)
+        msg.add_attachment(data, maintype=maintype, subtype=subtype,
+                           filename=a.get("filename") or os.path.basename(a["path"]))
+    return msg
+
+def _group(rows: List[OutboxMessage]) -> List[List[OutboxMessage]]:
+    """Digest rows for the same recipient become one e-mail; others go alone."""
+    groups: List[List[OutboxMessage]] = []
+    digests: Dict[str, List[OutboxMessage]] = {}
+    for r in rows:
+        if r.digest:
+            if r.to_email not in digests:
+                digests[r.to_email] = []
+                groups.append(digests[r.to_email])
+            digests[r.to_email].append(r)
+        else:
+            groups.append([r])
+    return groups
+
+def _compose(group: List[OutboxMessage]) -> EmailMessage:
+    if len(group) == 1:
+        m = group[0]
+        return _build_message(m.to_email, m.subject, m.body, json.loads(m.attachments_json or "[]"))
+    attachments: List[Dict[str, str]] = []
+    for m in group:
+        attachments.extend(json.loads(m.attachments_json or "[]"))
+    body = "Reports in this digest:\n\n" + "\n".join(f"- {m.subject}" for m in group)
+    subject = f"{current_app.config.get('BRAND_NAME') or 'Skill Tests'} — {len(group)} new test reports"
+    return _build_message(group[0].to_email, subject, body, attachments)
+
+def _release_stale_claims(now: datetime) -> None:
+    """Queue again messages a flush claimed but never settled (its worker died mid-send)."""
+    cutoff = now - timedelta(seconds=current_app.config["SMTP_CLAIM_TIMEOUT_SEC"])
+    db.session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.status == "sending", OutboxMessage.locked_at < cutoff)
+        .values(status="queued", locked_at=None)
+    )
+    db.session.commit()
+
+def _claim(ids: List[int], now: datetime) -> List[OutboxMessage]:
+    """Move still-queued messages to ``sending``; another flush may have taken some already."""
+    db.session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(ids), OutboxMessage.status == "queued")
+        .values(status="sending", locked_at=now)
+    )
+    db.session.commit()
+    return (
+        OutboxMessage.query
+        .filter(OutboxMessage.id.in_(ids), OutboxMessage.status == "sending", OutboxMessage.locked_at == now)
+        .order_by(OutboxMessage.to_email.asc(), OutboxMessage.id.asc())
+        .all()
+    )
+
+def flush_outbox(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Send due messages over a single SMTP connection. Returns sent/failed/remaining counts.
+
+    Flushes may overlap (one embedded worker per web process): each sends only the
+    messages it claimed.
+    """
+    cfg = current_app.config
+    batch_size = batch_size or cfg["SMTP_BATCH_SIZE"]
+    now = datetime.utcnow()
+    _release_stale_claims(now)
+    ids = [mid for (mid,) in (
+        db.session.query(OutboxMessage.id)
+        .filter(OutboxMessage.status == "queued", OutboxMessage.send_after <= now)
+        .order_by(OutboxMessage.to_email.asc(), OutboxMessage.id.asc())
+        .limit(batch_size)
+    )]
+    sent = failed = 0
+    if ids and not smtp_configured():
+        current_app.logger.warning("SMTP not configured; %s outbox messages left queued", len(ids))
+        return {"sent": 0, "failed": 0, "remaining": len(ids)}
+
+    rows = _claim(ids, now) if ids else []
+    claimed = [m.id for m in rows]
+    try:
+        if rows:
+            with SmtpSession(cfg) as smtp:
+                for group in _group(rows):
+                    try:
+                        smtp.send(_compose(group))
+                    except (smtplib.SMTPException, OSError) as e:
+                        for m in group:
+                            m.tries += 1
+                            m.last_error = str(e)[:2000]
+                            m.locked_at = None
+                            if m.tries >= cfg["SMTP_MAX_TRIES"]:
+                                m.status = "failed"
+                            else:
+                                m.status = "queued"
+                                m.send_after = datetime.utcnow() + timedelta(minutes=2 ** m.tries)
+                                _schedule_flush(m.send_after)
+                        failed += len(group)
+                    else:
+                        for m in group:
+                            m.status = "sent"
+                            m.locked_at = None
+                            m.sent_at = datetime.utcnow()
+                        sent += len(group)
+                    db.session.commit()
+    finally:
+        if claimed:
+            # SMTP connection or database failed mid-batch: hand back what was not settled.
+            db.session.rollback()
+            db.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(claimed), OutboxMessage.status == "sending",
+                       OutboxMessage.locked_at == now)
+                .values(status="queued", locked_at=None)
+            )
+            db.session.commit()
+
+    remaining = (
+        OutboxMessage.query
+        .filter(OutboxMessage.status == "queued", OutboxMessage.send_after <= datetime.utcnow())
+        .count()
+    )
+    if remaining:
+        _schedule_flush(datetime.utcnow() + timedelta(minutes=1))
+        db.session.commit()
+    return {"sent": sent, "failed": failed, "remaining": remaining}
+
+@handler("outbox_flush")
+def outbox_flush_job(payload: Dict[str, Any]):
+    return flush_outbox()
@@ -0,0 +1,382 @@
+from __future__ import annotations
+import json, mimetypes, os, shutil, struct, time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app, url_for
+from sqlalchemy import func, insert
+
+from . import db
+from .blobs import blob_path, blob_relpath, release, retain, store, variants_path
+from .cache import TTLCache
+from .delivery import resolve
+from .jobs import handler, enqueue
+from .models import MediaAsset, Question, QuestionMedia
+from .stats import _upsert
+
+# Media library files are addressed by a library path ("teacher/t1/map.png")
+# that question meta refers to. Uploads keep their bytes in the blob store
+# (app/blobs.py) and MediaAsset.blob_sha points there; files copied into
+# MEDIA_DIR by hand are read from MEDIA_DIR/<path>.
+
+_blobs = TTLCache(ttl=60, maxsize=8192)  # library path -> sha ("" when on disk)
+
+def blob_for(relpath: str) -> Optional[str]:
+    def load():
+        row = db.session.query(MediaAsset.blob_sha).filter(MediaAsset.path == relpath).first()
+        return (row[0] if row else None) or ""
+    return _blobs.get_or_set(relpath, load) or None
+
+def media_file(relpath: str) -> str:
+    """Absolute path of a library file; 404 when missing."""
+    sha = blob_for(relpath)
+    if sha:
+        return resolve(current_app.config["BLOBS_DIR"], blob_relpath(sha))
+    return resolve(current_app.config["MEDIA_DIR"], relpath)
+
+def media_url(relpath: str) -> str:
+    """Blob-backed files get their immutable /files/blob URL; the rest go through /files/media."""
+    sha = blob_for(relpath)
+    if sha:
+        return url_for("files.blob", sha=sha)
+    return url_for("files.media", relpath=relpath)
+
+# Resized copies of library images for test pages. Each image gets WebP and
+# JPEG variants at MEDIA_VARIANT_WIDTHS, written by the job worker to
+#   BLOBS_DIR/variants/<sha>/w<width>.<webp|jpg>     (uploads)
+#   <dir>/.variants/<name>/w<width>.<webp|jpg>       (files on disk)
+# test.html serves them with srcset; the original stays the fallback until the
+# variants exist.
+
+IMAGE_EXT = {"png", "jpg", "jpeg"}  # GIFs may be animated: served as uploaded
+VARIANT_DIR = ".variants"
+
+def is_image(relpath: str) -> bool:
+    return relpath.rsplit(".", 1)[-1].lower() in IMAGE_EXT
+
+def variants_dir(relpath: str) -> str:
+    head, name = os.path.split(relpath)
+    return os.path.join(head, VARIANT_DIR, name)
+
+def _variant_source(relpath: str) -> Tuple[str, str]:
+    """(original file, folder for its variants)."""
+    sha = blob_for(relpath)
+    if sha:
+        return blob_path(sha), variants_path(sha)
+    media_dir = current_app.config["MEDIA_DIR"]
+    return os.path.join(media_dir, relpath), os.path.join(media_dir, variants_dir(relpath))
+
+def queue_variants(relpath: str) -> None:
+    """Call after adding an image to the library (in the request's transaction)."""
+    if not is_image(relpath):
+        return
+    sha = blob_for(relpath)
+    if sha:
+        key = f"media_variants:{sha}"  # same picture uploaded twice: resized once
+    else:
+        stamp = int(os.path.getmtime(os.path.join(current_app.config["MEDIA_DIR"], relpath)))
+        key = f"media_variants:{relpath}:{stamp}"
+    enqueue("media_variants", {"relpath": relpath}, key=key)
+
+def build_variants(relpath: str) -> Dict[str, Any]:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        current_app.logger.warning("Pillow is not installed; serving %s without variants", relpath)
+        return {"skipped": "Pillow not installed"}
+
+    src, out_dir = _variant_source(relpath)
+    os.makedirs(out_dir, exist_ok=True)
+
+    written: List[str] = []
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)  # phone photos are stored sideways + EXIF rotation
+        width, height = im.size
+        has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        im = im.convert("RGBA" if has_alpha else "RGB")
+
+        for w in current_app.config["MEDIA_VARIANT_WIDTHS"]:
+            if w >= width and written:
+                break  # never upscale; keep one variant even for small images
+            target = im if w >= width else im.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+            tw = target.size[0]
+
+            webp = os.path.join(out_dir, f"w{tw}.webp")
+            target.save(webp + ".tmp", "WEBP", quality=current_app.config["MEDIA_WEBP_QUALITY"], method=4)
+            os.replace(webp + ".tmp", webp)
+
+            jpg = os.path.join(out_dir, f"w{tw}.jpg")
+            flat = target
+            if has_alpha:
+                flat = Image.new("RGB", target.size, (255, 255, 255))
+                flat.paste(target, mask=target.getchannel("A"))
+            flat.save(jpg + ".tmp", "JPEG", quality=current_app.config["MEDIA_JPEG_QUALITY"],
+                      optimize=True, progressive=True)
+            os.replace(jpg + ".tmp", jpg)
+            written += [os.path.basename(webp), os.path.basename(jpg)]
+            if w >= width:
+                break
+
+    _variants.pop(relpath)
+    return {"width": width, "height": height, "variants": written}
+
+def iter_images() -> Iterator[str]:
+    """Library paths of every catalogued image (run `flask sync-media` first for hand-copied files)."""
+    for (path,) in db.session.query(MediaAsset.path).order_by(MediaAsset.path).yield_per(1000):
+        if is_image(path):
+            yield path
+
+@handler("media_variants")
+def media_variants_job(payload: Dict[str, Any]):
+    return build_variants(payload["relpath"])
+
+_variants = TTLCache(ttl=60, maxsize=4096)
+
+def variants(relpath: str) -> Dict[str, List[Tuple[int, str]]]:
+    """{"webp": [(width, file name), ...], "jpg": [...]} for the variants that exist, smallest first."""
+    if not relpath or not is_image(relpath):
+        return {}
+
+    def scan():
+        found: Dict[str, List[Tuple[int, str]]] = {"webp": [], "jpg": []}
+        try:
+            entries = list(os.scandir(_variant_source(relpath)[1]))
+        except OSError:
+            return {}
+        for e in entries:
+            stem, _, ext = e.name.partition(".")
+            if ext in found and stem[:1] == "w" and stem[1:].isdigit():
+                found[ext].append((int(stem[1:]), e.name))
+        for v in found.values():
+            v.sort()
+        return found if found["jpg"] else {}
+
+    return _variants.get_or_set(relpath, scan)
+
+def variant_url(relpath: str, name: str) -> str:
+    sha = blob_for(relpath)
+    if sha:
+        return url_for("files.blob", sha=sha, variant=name)
+    return url_for("files.media", relpath=f"{variants_dir(relpath)}/{name}".replace(os.sep, "/"))
+
+# Catalogue: one MediaAsset row per file so the library pages are index scans
+# instead of a directory listing, plus QuestionMedia rows for "used by".
+
+MEDIA_KEYS = ("image_media", "video_media")
+
+def owner_for(relpath: str) -> Optional[str]:
+    parts = relpath.split("/")
+    return parts[1] if len(parts) >= 3 and parts[0] == "teacher" else None
+
+def _image_size(abs_path: str) -> Tuple[Optional[int], Optional[int]]:
+    try:
+        from PIL import Image
+    except ImportError:
+        return None, None
+    with Image.open(abs_path) as im:  # reads the header only
+        return im.size
+
+def _boxes(fh, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """ISO-BMFF boxes in [start, end): (type, body offset, box end)."""
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        size, kind = struct.unpack(">I4s", fh.read(8))
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", fh.read(8))[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+def mp4_duration(abs_path: str) -> Optional[float]:
+    """Duration in seconds from moov/mvhd, reading box headers only."""
+    with open(abs_path, "rb") as fh:
+        end = os.fstat(fh.fileno()).st_size
+        for kind, body, box_end in _boxes(fh, 0, end):
+            if kind != b"moov":
+                continue
+            for inner, inner_body, _ in _boxes(fh, body, box_end):
+                if inner != b"mvhd":
+                    continue
+                fh.seek(inner_body)
+                version = fh.read(4)[0]
+                if version == 1:
+                    _, _, scale, duration = struct.unpack(">QQIQ", fh.read(28))
+                else:
+                    _, _, scale, duration = struct.unpack(">IIII", fh.read(16))
+                return round(duration / scale, 2) if scale else None
+    return None
+
+def describe(abs_path: str, name: Optional[str] = None) -> Dict[str, Any]:
+    """Size, mime (from ``name``, else the path) and image dimensions / MP4 duration."""
+    st = os.stat(abs_path)
+    mime = mimetypes.guess_type(name or abs_path)[0]
+    info: Dict[str, Any] = {"size": st.st_size, "mtime": st.st_mtime, "mime": mime,
+                            "width": None, "height": None, "duration_sec": None}
+    try:
+        if mime and mime.startswith("image/"):
+            info["width"], info["height"] = _image_size(abs_path)
+        elif mime == "video/mp4":
+            info["duration_sec"] = mp4_duration(abs_path)
+    except Exception as e:  # a damaged file still gets catalogued
+        current_app.logger.info("Could not read media header of %s: %s", abs_path, e)
+    return info
+
+def _upsert_assets(rows: List[Dict[str, Any]]) -> None:
+    t = MediaAsset.__table__
+    stmt = _upsert(t).values(rows)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["path"],
+        set_={c: new[c] for c in ("owner_id", "size", "mime", "width", "height", "duration_sec", "mtime")},
+    )
+    db.session.execute(stmt)
+
+def _free_path(folder: str, name: str) -> str:
+    """Library path for a new upload; a taken name gets -2, -3, ... instead of being overwritten."""
+    stem, dot, ext = name.rpartition(".") if "." in name else (name, "", "")
+    n = 1
+    while True:
+        candidate = f"{folder}/{name}" if folder else name
+        taken = (db.session.query(MediaAsset.id).filter(MediaAsset.path == candidate).first()
+                 or os.path.exists(os.path.join(current_app.config["MEDIA_DIR"], candidate)))
+        if not taken:
+            return candidate
+        n += 1
+        name = f"{stem}-{n}{dot}{ext}"
+
+def save_upload(f, folder: str, name: str, uploaded_by: str) -> str:
+    """Store a media-library upload in the blob store; returns its library path. Caller commits."""
+    sha, size = store(f.stream)
+    return add_upload(sha, size, folder, name, uploaded_by)
+
+def add_upload(sha: str, size: int, folder: str, name: str, uploaded_by: str) -> str:
+    """Library entry for content already in the blob store (also used by resumable uploads)."""
+    path = _free_path(folder, name)
+    retain(sha, size, mimetypes.guess_type(path)[0])  # first: makes sure the file is in place
+    info = describe(blob_path(sha), name=path)
+    db.session.add(MediaAsset(path=path, owner_id=owner_for(path), uploaded_by=uploaded_by,
+                              blob_sha=sha, **info))
+    db.session.flush()
+    _blobs.pop(path)
+    queue_variants(path)
+    return path
+
+def delete_asset(asset: MediaAsset) -> None:
+    """Remove a library file: drop the blob reference, or the file and its variants on disk. Caller commits."""
+    if asset.blob_sha:
+        release(asset.blob_sha)  # the blob itself goes with `flask gc-blobs`
+    else:
+        media_dir = current_app.config["MEDIA_DIR"]
+        try:
+            os.remove(os.path.join(media_dir, asset.path))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(media_dir, variants_dir(asset.path)), ignore_errors=True)
+    db.session.delete(asset)
+    _blobs.pop(asset.path)
+    _variants.pop(asset.path)
+
+def _scan(media_dir: str, rel: str = "") -> Iterator[Tuple[str, os.DirEntry]]:
+    allowed = current_app.config["MEDIA_ALLOWED_EXT"]
+    try:
+        it = os.scandir(os.path.join(media_dir, rel) if rel else media_dir)
+    except FileNotFoundError:
+        return
+    with it:
+        for e in it:
+            if e.name.startswith("."):  # .variants/ and temp files
+                continue
+            r = f"{rel}/{e.name}" if rel else e.name
+            if e.is_dir(follow_symlinks=False):
+                yield from _scan(media_dir, r)
+            elif e.is_file() and e.name.rsplit(".", 1)[-1].lower() in allowed:
+                yield r, e
+
+def media_refs(meta_json: Optional[str]) -> List[str]:
+    try:
+        meta = json.loads(meta_json) if meta_json else None
+    except ValueError:
+        return []
+    if not isinstance(meta, dict):
+        return []
+    return sorted({meta[k].strip().lstrip("/") for k in MEDIA_KEYS
+                   if isinstance(meta.get(k), str) and meta[k].strip()})
+
+def link_questions(question_ids: Optional[Iterable[int]] = None,
+                   skill_ids: Optional[Iterable[int]] = None) -> int:
+    """Rebuild QuestionMedia for the given questions, skills, or (neither) all. Caller commits."""
+    src = db.session.query(Question.id, Question.meta_json).filter(Question.meta_json.isnot(None))
+    old = db.session.query(QuestionMedia)
+    if question_ids is not None:
+        ids = list(question_ids)
+        src = src.filter(Question.id.in_(ids))
+        old = old.filter(QuestionMedia.question_id.in_(ids))
+    elif skill_ids is not None:
+        sids = list(skill_ids)
+        src = src.filter(Question.skill_id.in_(sids))
+        old = old.filter(QuestionMedia.question_id.in_(
+            db.session.query(Question.id).filter(Question.skill_id.in_(sids))))
+    old.delete(synchronize_session=False)
+    rows = [{"question_id": qid, "path": p} for qid, meta in src.yield_per(1000) for p in media_refs(meta)]
+    if rows:
+        db.session.execute(insert(QuestionMedia), rows)
+    return len(rows)
+
+def usage_counts(paths: List[str]) -> Dict[str, int]:
+    if not paths:
+        return {}
+    return dict(db.session.query(QuestionMedia.path, func.count(QuestionMedia.question_id))
+                .filter(QuestionMedia.path.in_(paths)).group_by(QuestionMedia.path).all())
+
+def sync_media(batch_size: int = 500) -> Dict[str, Any]:
+    """Reconcile MediaAsset with MEDIA_DIR: add new files, refresh changed ones, drop missing ones.
+
+    Uploads live in the blob store and are left alone.
+    """
+    started = time.monotonic()
+    media_dir = current_app.config["MEDIA_DIR"]
+    known = {p: (size, mtime) for p, size, mtime in
+             db.session.query(MediaAsset.path, MediaAsset.size, MediaAsset.mtime)
+             .filter(MediaAsset.blob_sha.is_(None))}
+    uploaded = {p for (p,) in db.session.query(MediaAsset.path).filter(MediaAsset.blob_sha.isnot(None))}
+    seen = set()
+    added = updated = 0
+    batch: List[Dict[str, Any]] = []
+    now = datetime.utcnow()
+    for rel, entry in _scan(media_dir):
+        if rel in uploaded:
+            continue
+        seen.add(rel)
+        st = entry.stat()
+        old = known.get(rel)
+        if old is not None and old[0] == st.st_size and abs(old[1] - st.st_mtime) < 1e-3:
+            continue
+        if old is None:
+            added += 1
+        else:
+            updated += 1
+        batch.append({"path": rel, "owner_id": owner_for(rel), "uploaded_by": None,
+                      "created_at": now, **describe(entry.path)})
+        if len(batch) >= batch_size:
+            _upsert_assets(batch)
+            batch = []
+    if batch:
+        _upsert_assets(batch)
+
+    gone = [p for p in known if p not in seen]
+    for i in range(0, len(gone), batch_size):
+        (db.session.query(MediaAsset).filter(MediaAsset.path.in_(gone[i:i + batch_size]))
+         .delete(synchronize_session=False))
+    links = link_questions()
+    db.session.commit()
+    return {"files": len(seen), "added": added, "updated": updated, "removed": len(gone),
+            "links": links, "seconds": round(time.monotonic() - started, 2)}
+
+@handler("sync_media")
+def sync_media_job(payload: Dict[str, Any]):
+    return sync_media()
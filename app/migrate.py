@@ -1,10 +1,33 @@
 from __future__ import annotations
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Tuple
+
 from sqlalchemy import text
 from flask import current_app
 from . import db
+from .utils import locked
+
+# Ordered schema migrations. Each runs once per database and is recorded in
+# schema_migration. Keep them idempotent: fresh databases get tables (and the
+# indexes declared on the models) from db.create_all() before these run.
+# Never load mapped entities here (Model.query...): they SELECT every column of
+# the current model, including ones a later migration has not added yet. Use
+# text() SQL or column queries such as db.session.query(Attempt.id).
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = []
+
+def migration(version: int, name: str):
+    def deco(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return deco
+
+def _backend() -> str:
+    return db.engine.url.get_backend_name()
 
 def _is_sqlite() -> bool:
-    return db.engine.url.get_backend_name() == "sqlite"
+    return _backend() == "sqlite"
 
 def _has_column_sqlite(table: str, column: str) -> bool:
     rows = db.session.execute(text(f"PRAGMA table_info({table})")).fetchall()
@@ -20,21 +43,185 @@ def _has_column_pg(table: str, column: str) -> bool:
     r = db.session.execute(q, {"table": table, "col": column}).fetchone()
     return r is not None
 
-def ensure_schema():
-    backend = db.engine.url.get_backend_name()
-    current_app.logger.info("Schema check on %s", backend)
+def _has_column(table: str, column: str) -> bool:
+    return _has_column_sqlite(table, column) if _is_sqlite() else _has_column_pg(table, column)
+
+def _add_column(table: str, column: str, ddl: str) -> None:
+    if not _has_column(table, column):
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _create_index(name: str, table: str, columns: str, unique: bool = False) -> None:
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    db.session.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})"))
+
+def _has_rows(table: str, where: str = "") -> bool:
+    return db.session.execute(text(f"SELECT 1 FROM {table} {where} LIMIT 1")).first() is not None
+
+@migration(1, "skill.pass_pct")
+def _m1():
+    _add_column("skill", "pass_pct", "INTEGER")
+
+@migration(2, "attempt.passed")
+def _m2():
+    _add_column("attempt", "passed", "BOOLEAN")
+
+@migration(3, "skill.bank_version")
+def _m3():
+    _add_column("skill", "bank_version", "INTEGER NOT NULL DEFAULT 0")
+
+@migration(4, "backfill statistics rollups")
+def _m4():
+    from .stats import rebuild_rollups
+    if _has_rows("student_skill_stat") or not _has_rows("attempt", "WHERE finished_at IS NOT NULL"):
+        return
+    rebuild_rollups()
+
+@migration(5, "hot-path indexes")
+def _m5():
+    # One permission row per (student, skill): merge duplicates before the unique index.
+    db.session.execute(text("""
+        UPDATE student_skill SET allowed = :yes
+        WHERE id IN (
+            SELECT MIN(id) FROM student_skill
+            GROUP BY student_id, skill_id
+            HAVING MAX(CASE WHEN allowed THEN 1 ELSE 0 END) = 1
+        )
+    """), {"yes": True})
+    db.session.execute(text("""
+        DELETE FROM student_skill
+        WHERE id NOT IN (SELECT MIN(id) FROM student_skill GROUP BY student_id, skill_id)
+    """))
+    _create_index("ux_student_skill_student_skill", "student_skill", "student_id, skill_id", unique=True)
+    _create_index("ix_attempt_student_week_skill", "attempt", "student_id, iso_year, iso_week, skill_id")
+    _create_index("ix_attempt_student_skill_finished", "attempt", "student_id, skill_id, finished_at")
+    _create_index("ix_attempt_student_started", "attempt", "student_id, started_at")
+    _create_index("ix_attempt_teacher_finished", "attempt", "teacher_id, finished_at")
+    _create_index("ix_question_skill", "question", "skill_id")
+    _create_index("ix_remediation_teacher_student_skill", "remediation_upload", "teacher_id, student_id, skill_id")
+    _create_index("ix_remediation_student_uploaded", "remediation_upload", "student_id, uploaded_at")
+    _create_index("ix_user_role_teacher", '"user"', "role, teacher_id")
+    _create_index("ix_job_status_run_after", "job", "status, run_after")
+    _create_index("ix_outbox_status_send_after", "outbox_message", "status, send_after")
+
+@migration(6, "keyset pagination indexes")
+def _m6():
+    _create_index("ix_attempt_finished_id", "attempt", "finished_at, id")
+    _create_index("ix_attempt_skill_finished_id", "attempt", "skill_id, finished_at, id")
+    _create_index("ix_attempt_week_finished_id", "attempt", "iso_year, iso_week, finished_at, id")
+    _create_index("ix_question_skill_id", "question", "skill_id, id")
+
+@migration(7, "attempt answers out of answers_json")
+def _m7():
+    from .answers import backfill_from_json
+    n = backfill_from_json()
+    if n:
+        current_app.logger.info("Moved answers of %s attempts into attempt_answer", n)
 
-    if _is_sqlite():
-        if not _has_column_sqlite("skill", "pass_pct"):
-            db.session.execute(text("ALTER TABLE skill ADD COLUMN pass_pct INTEGER"))
-        if not _has_column_sqlite("attempt", "passed"):
-            db.session.execute(text("ALTER TABLE attempt ADD COLUMN passed BOOLEAN"))
-        db.session.commit()
+@migration(8, "backfill item analysis")
+def _m8():
+    from .item_analysis import rebuild_item_stats
+    if _has_rows("question_stat") or not _has_rows("attempt_answer"):
         return
+    rebuild_item_stats()
+
+@migration(9, "media catalogue")
+def _m9():
+    # Tables come from create_all(); fill them from the disk in the background.
+    if _has_rows("media_asset") or not os.path.isdir(current_app.config["MEDIA_DIR"]):
+        return
+    now = datetime.utcnow()
+    db.session.execute(text("""
+        INSERT INTO job (kind, key, payload_json, status, tries, max_tries, run_after, created_at)
+        SELECT 'sync_media', 'sync_media:initial', '{}', 'queued', 0, :tries, :now, :now
+        WHERE NOT EXISTS (SELECT 1 FROM job WHERE key = 'sync_media:initial')
+    """), {"tries": current_app.config["JOB_MAX_TRIES"], "now": now})
+
+@migration(10, "blob references")
+def _m10():
+    _add_column("remediation_upload", "blob_sha", "VARCHAR(64)")
+    _add_column("media_asset", "blob_sha", "VARCHAR(64)")
+    _create_index("ix_remediation_blob", "remediation_upload", "blob_sha")
+    _create_index("ix_media_asset_blob", "media_asset", "blob_sha")
+
+@migration(11, "question pools")
+def _m11():
+    _add_column("skill", "draw_count", "INTEGER")
+    _add_column("skill", "draw_by", "VARCHAR(16)")
+    _add_column("attempt", "question_ids_json", "TEXT")
+    _add_column("attempt", "seed", "INTEGER")
+
+@migration(12, "teacher keyset index")
+def _m12():
+    # The teacher reports page seeks on (finished_at, id); without id the tie-break needs a sort.
+    _create_index("ix_attempt_teacher_finished_id", "attempt", "teacher_id, finished_at, id")
+    db.session.execute(text("DROP INDEX IF EXISTS ix_attempt_teacher_finished"))
+
+@migration(13, "upload session result")
+def _m13():
+    _add_column("upload_session", "result_json", "TEXT")
+
+@migration(14, "teacher x student rollup")
+def _m14():
+    from .stats import rebuild_rollups
+    if _has_rows("teacher_student_stat") or not _has_rows("attempt", "WHERE finished_at IS NOT NULL"):
+        return
+    rebuild_rollups()
+
+@migration(15, "outbox claim")
+def _m15():
+    _add_column("outbox_message", "locked_at", "TIMESTAMP")
+
+def _ensure_migration_table() -> None:
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migration (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+    db.session.commit()
+
+_LOCK_ID = 74210531
+
+@contextmanager
+def schema_lock():
+    """Serialise create_all(), migrations and seeding across workers booting at once.
+
+    On SQLite this is an exclusive lock on a file next to the database. Postgres
+    migrations take an advisory lock in ensure_schema() instead.
+    """
+    path = db.engine.url.database if _is_sqlite() else None
+    if not path or path == ":memory:":
+        yield
+        return
+    with open(path + ".lock", "a+") as fh, locked(fh):
+        yield
+
+def ensure_schema():
+    backend = _backend()
+    current_app.logger.info("Schema check on %s", backend)
+    _ensure_migration_table()
+    pg = backend in ("postgresql", "postgres")
 
-    if backend in ("postgresql","postgres"):
-        if not _has_column_pg("skill", "pass_pct"):
-            db.session.execute(text("ALTER TABLE skill ADD COLUMN pass_pct INTEGER"))
-        if not _has_column_pg("attempt", "passed"):
-            db.session.execute(text("ALTER TABLE attempt ADD COLUMN passed BOOLEAN"))
-        db.session.commit()
+    applied = {v for (v,) in db.session.execute(text("SELECT version FROM schema_migration"))}
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        if pg:
+            # Several gunicorn workers boot at once: serialise and re-check.
+            db.session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_ID})
+        done = db.session.execute(text("SELECT 1 FROM schema_migration WHERE version = :v"), {"v": version}).first()
+        if done:
+            db.session.commit()
+            continue
+        current_app.logger.info("Applying migration %s: %s", version, name)
+        try:
+            fn()
+            db.session.execute(
+                text("INSERT INTO schema_migration (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()},
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
@@ -1,10 +1,14 @@
 from __future__ import annotations
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from . import db
 
 class User(UserMixin, db.Model):
+    __table_args__ = (
+        db.Index("ix_user_role_teacher", "role", "teacher_id"),
+    )
+
     id = db.Column(db.String(64), primary_key=True)
     role = db.Column(db.String(16), nullable=False)  # student / teacher / chairman
     name = db.Column(db.String(128), nullable=False)
@@ -16,7 +20,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(256), nullable=True)
 
     def set_pin(self, pin: str) -> None:
-        self.pin_hash = generate_password_hash(pin)
+        from .pins import hash_pin
+        self.pin_hash = hash_pin(pin)
 
     def check_pin(self, pin: str) -> bool:
         return check_password_hash(self.pin_hash, pin)
@@ -31,8 +36,17 @@ class Skill(db.Model):
     duration_min = db.Column(db.Integer, nullable=True)
     pass_pct = db.Column(db.Integer, nullable=True)  # pass threshold percent
     is_active = db.Column(db.Boolean, default=True)
+    bank_version = db.Column(db.Integer, nullable=False, default=0)  # bumped when questions change
+    # Question pool (app/pools.py): questions drawn per attempt, None = all;
+    # draw_by = "tag" / "difficulty" balances the draw on that question-meta key.
+    draw_count = db.Column(db.Integer, nullable=True)
+    draw_by = db.Column(db.String(16), nullable=True)
 
 class StudentSkill(db.Model):
+    __table_args__ = (
+        db.Index("ux_student_skill_student_skill", "student_id", "skill_id", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
     skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), nullable=False)
@@ -44,6 +58,11 @@ class StudentSkill(db.Model):
     skill = db.relationship("Skill")
 
 class Question(db.Model):
+    __table_args__ = (
+        db.Index("ix_question_skill", "skill_id"),
+        db.Index("ix_question_skill_id", "skill_id", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), nullable=False)
     qtype = db.Column(db.String(32), nullable=False)
@@ -56,6 +75,16 @@ class Question(db.Model):
     skill = db.relationship("Skill")
 
 class Attempt(db.Model):
+    __table_args__ = (
+        db.Index("ix_attempt_student_week_skill", "student_id", "iso_year", "iso_week", "skill_id"),
+        db.Index("ix_attempt_student_skill_finished", "student_id", "skill_id", "finished_at"),
+        db.Index("ix_attempt_student_started", "student_id", "started_at"),
+        db.Index("ix_attempt_teacher_finished_id", "teacher_id", "finished_at", "id"),
+        db.Index("ix_attempt_finished_id", "finished_at", "id"),
+        db.Index("ix_attempt_skill_finished_id", "skill_id", "finished_at", "id"),
+        db.Index("ix_attempt_week_finished_id", "iso_year", "iso_week", "finished_at", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
     teacher_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
@@ -73,24 +102,243 @@ class Attempt(db.Model):
     total_count = db.Column(db.Integer, nullable=True)
     passed = db.Column(db.Boolean, nullable=True)
 
-    answers_json = db.Column(db.Text, nullable=True)
+    # Questions shown, in order (JSON list of ids), and the seed of the draw and option order.
+    question_ids_json = db.Column(db.Text, nullable=True)
+    seed = db.Column(db.Integer, nullable=True)
+
+    answers_json = db.Column(db.Text, nullable=True)  # legacy; answers live in AttemptAnswer
     pdf_path = db.Column(db.String(512), nullable=True)
 
     student = db.relationship("User", foreign_keys=[student_id])
     teacher = db.relationship("User", foreign_keys=[teacher_id])
     skill = db.relationship("Skill")
 
+class AttemptAnswer(db.Model):
+    """One graded answer. Prompt and answer key are read from the question bank, not copied."""
+    __table_args__ = (
+        db.Index("ux_attempt_answer_attempt_position", "attempt_id", "position", unique=True),
+        db.Index("ix_attempt_answer_question", "question_id", "is_correct"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey("attempt.id"), nullable=False)
+    # No FK: answers outlive questions that are later removed from the bank.
+    question_id = db.Column(db.Integer, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    response_json = db.Column(db.Text, nullable=True)  # grader.read() output
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)
+    time_spent_sec = db.Column(db.Integer, nullable=True)
+
+class AttemptDraft(db.Model):
+    """Autosaved answers of an unfinished attempt (see app/autosave.py); deleted on submit.
+
+    student_id and deadline are copied from the attempt so a save needs only this row.
+    """
+    attempt_id = db.Column(db.Integer, db.ForeignKey("attempt.id"), primary_key=True)
+    student_id = db.Column(db.String(64), nullable=False)
+    deadline = db.Column(db.DateTime, nullable=False)
+    data_json = db.Column(db.Text, nullable=False, default="{}")  # {"a": {qid: response}, "t": {qid: seconds}}
+    rev = db.Column(db.Integer, nullable=False, default=0)
+    saved_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 class RemediationUpload(db.Model):
+    __table_args__ = (
+        db.Index("ix_remediation_teacher_student_skill", "teacher_id", "student_id", "skill_id"),
+        db.Index("ix_remediation_student_uploaded", "student_id", "uploaded_at"),
+        db.Index("ix_remediation_blob", "blob_sha"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     teacher_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
     student_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
     skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), nullable=False)
 
     filename = db.Column(db.String(256), nullable=False)
+    # Relative to BLOBS_DIR when blob_sha is set; older rows: relative to UPLOADS_DIR.
     stored_path = db.Column(db.String(512), nullable=False)
+    blob_sha = db.Column(db.String(64), nullable=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     note = db.Column(db.String(512), nullable=True)
 
     teacher = db.relationship("User", foreign_keys=[teacher_id])
     student = db.relationship("User", foreign_keys=[student_id])
     skill = db.relationship("Skill")
+
+class Blob(db.Model):
+    """Uploaded file content stored once under its SHA-256 (see app/blobs.py)."""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mime = db.Column(db.String(100), nullable=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)  # RemediationUpload + MediaAsset rows
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    released_at = db.Column(db.DateTime, nullable=True)  # when refcount last dropped to 0
+
+class UploadSession(db.Model):
+    """Resumable upload (see app/uploads.py). Once filed it keeps ``result_json`` so a repeated
+    finalize gets the same answer; deleted on expiry."""
+    __table_args__ = (
+        db.Index("ix_upload_session_updated", "updated_at"),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=False)
+    purpose = db.Column(db.String(16), nullable=False)  # remediation / media
+    filename = db.Column(db.String(256), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)  # declared by the client at init
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    params_json = db.Column(db.Text, nullable=True)  # where finalize files it (student/skill/note, folder)
+    result_json = db.Column(db.Text, nullable=True)  # what finalize filed: {"remediation": id} or {"media": path}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class MediaAsset(db.Model):
+    """A media-library file, catalogued on upload and by `flask sync-media` (see app/media.py)."""
+    __table_args__ = (
+        db.Index("ix_media_asset_owner_path", "owner_id", "path"),
+        db.Index("ix_media_asset_blob", "blob_sha"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(512), nullable=False, unique=True)  # relative to MEDIA_DIR, "/"-separated
+    # Library it is listed in: teacher id for teacher/<id>/..., NULL for the shared library.
+    owner_id = db.Column(db.String(64), nullable=True)
+    uploaded_by = db.Column(db.String(64), db.ForeignKey("user.id"), nullable=True)  # NULL when found by sync
+    blob_sha = db.Column(db.String(64), nullable=True)  # uploads; files found by sync live at MEDIA_DIR/path
+
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    mime = db.Column(db.String(100), nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    duration_sec = db.Column(db.Float, nullable=True)
+    mtime = db.Column(db.Float, nullable=False, default=0.0)  # st_mtime; sync skips unchanged files
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class QuestionMedia(db.Model):
+    """Media path referenced from a question's meta (image_media / video_media)."""
+    __table_args__ = (
+        db.Index("ix_question_media_path", "path"),
+    )
+
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id"), primary_key=True)
+    path = db.Column(db.String(512), primary_key=True)
+
+class StudentSkillStat(db.Model):
+    """Rollup of finished attempts per student × skill, maintained on submit."""
+    student_id = db.Column(db.String(64), db.ForeignKey("user.id"), primary_key=True)
+    skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), primary_key=True)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_score = db.Column(db.Float, nullable=True)
+    last_passed = db.Column(db.Boolean, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    passed_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+    skill = db.relationship("Skill")
+
+class TeacherSkillStat(db.Model):
+    """Rollup of finished attempts per teacher × skill, maintained on submit."""
+    teacher_id = db.Column(db.String(64), db.ForeignKey("user.id"), primary_key=True)
+    skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), primary_key=True)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_score = db.Column(db.Float, nullable=True)
+    last_passed = db.Column(db.Boolean, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    passed_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+class TeacherStudentStat(db.Model):
+    """Rollup of finished attempts per teacher × student (attempts taken with that teacher), maintained on submit."""
+    teacher_id = db.Column(db.String(64), db.ForeignKey("user.id"), primary_key=True)
+    student_id = db.Column(db.String(64), db.ForeignKey("user.id"), primary_key=True)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_score = db.Column(db.Float, nullable=True)
+    last_passed = db.Column(db.Boolean, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    passed_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SkillWeekStat(db.Model):
+    """Rollup of finished attempts per skill × ISO week, maintained on submit."""
+    skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), primary_key=True)
+    iso_year = db.Column(db.Integer, primary_key=True)
+    iso_week = db.Column(db.Integer, primary_key=True)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_score = db.Column(db.Float, nullable=True)
+    last_passed = db.Column(db.Boolean, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    passed_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+class QuestionStat(db.Model):
+    """Item-analysis sums per question, kept current on submit (see app/item_analysis.py).
+
+    ``total`` is the attempt score (0..1) of each respondent; the sums give the
+    p-value and the point-biserial correlation without rescanning answers.
+    """
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id"), primary_key=True)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    total_sum = db.Column(db.Float, nullable=False, default=0.0)
+    total_sq_sum = db.Column(db.Float, nullable=False, default=0.0)
+    correct_total_sum = db.Column(db.Float, nullable=False, default=0.0)
+    time_sum = db.Column(db.Integer, nullable=False, default=0)
+    timed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    question = db.relationship("Question")
+
+class Job(db.Model):
+    """Background work item picked up by the job worker (see app/jobs.py)."""
+    __table_args__ = (
+        db.Index("ix_job_status_run_after", "status", "run_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.String(160), nullable=True, unique=True)  # idempotency key
+    payload_json = db.Column(db.Text, nullable=True)
+
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued / running / done / failed
+    tries = db.Column(db.Integer, nullable=False, default=0)
+    max_tries = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result_json = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class OutboxMessage(db.Model):
+    """Queued e-mail; delivered in batches by app/mailer.py."""
+    __table_args__ = (
+        db.Index("ix_outbox_status_send_after", "status", "send_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dedupe_key = db.Column(db.String(160), nullable=True, unique=True)
+    to_email = db.Column(db.String(256), nullable=False)
+    subject = db.Column(db.String(512), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attachments_json = db.Column(db.Text, nullable=True)  # [{"path": ..., "filename": ...}]
+    digest = db.Column(db.Boolean, default=False, nullable=False)
+
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued / sending / sent / failed
+    tries = db.Column(db.Integer, nullable=False, default=0)
+    send_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)  # when a flush claimed it (status "sending")
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
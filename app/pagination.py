@@ -0,0 +1,127 @@
+from __future__ import annotations
+import base64, json, re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from .models import Attempt, MediaAsset, Question
+
+# Keyset ("seek") pagination: the cursor is the sort key of the last row shown,
+# so page N costs one index range scan no matter how deep it is.
+
+_WEEK = re.compile(r"^(\d{4})-W(\d{1,2})$")
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """-> decoded values, or None for a missing/garbled cursor (first page)."""
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        return None
+
+def page_size(args, default: int, maximum: int) -> int:
+    try:
+        return max(1, min(int(args.get("limit") or default), maximum))
+    except ValueError:
+        return default
+
+def attempt_filters(args) -> Dict[str, Any]:
+    """Query-string filters shared by the HTML lists and the JSON API."""
+    f: Dict[str, Any] = {}
+    if args.get("teacher_id"):
+        f["teacher_id"] = args["teacher_id"].strip()
+    if (args.get("skill_id") or "").isdigit():
+        f["skill_id"] = int(args["skill_id"])
+    m = _WEEK.match((args.get("week") or "").strip())  # <input type="week"> -> 2025-W07
+    if m:
+        f["week"] = (int(m.group(1)), int(m.group(2)))
+    if args.get("result") in ("pass", "fail"):
+        f["result"] = args["result"]
+    return f
+
+def attempts_page(filters: Dict[str, Any], cursor: Optional[str], limit: int) -> Tuple[List[Attempt], Optional[str]]:
+    """Finished attempts, newest first, ordered by (finished_at, id)."""
+    q = Attempt.query.options(
+        joinedload(Attempt.student), joinedload(Attempt.teacher), joinedload(Attempt.skill)
+    ).filter(Attempt.finished_at.isnot(None))
+    if "teacher_id" in filters:
+        q = q.filter(Attempt.teacher_id == filters["teacher_id"])
+    if "skill_id" in filters:
+        q = q.filter(Attempt.skill_id == filters["skill_id"])
+    if "week" in filters:
+        q = q.filter(Attempt.iso_year == filters["week"][0], Attempt.iso_week == filters["week"][1])
+    if "result" in filters:
+        q = q.filter(Attempt.passed.is_(filters["result"] == "pass"))
+
+    after = decode_cursor(cursor)
+    if after and len(after) == 2:
+        try:
+            q = q.filter(tuple_(Attempt.finished_at, Attempt.id) < (datetime.fromisoformat(after[0]), int(after[1])))
+        except (TypeError, ValueError):
+            pass
+
+    rows = q.order_by(Attempt.finished_at.desc(), Attempt.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1].finished_at, rows[-1].id])
+
+def questions_page(filters: Dict[str, Any], cursor: Optional[str], limit: int) -> Tuple[List[Question], Optional[str]]:
+    """Questions, newest first, ordered by id."""
+    q = Question.query.options(joinedload(Question.skill))
+    if "skill_id" in filters:
+        q = q.filter(Question.skill_id == filters["skill_id"])
+    after = decode_cursor(cursor)
+    if after and len(after) == 1 and isinstance(after[0], int):
+        q = q.filter(Question.id < after[0])
+
+    rows = q.order_by(Question.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1].id])
+
+def media_page(owner_id: Optional[str], cursor: Optional[str], limit: int) -> Tuple[List[MediaAsset], Optional[str]]:
+    """One library's files (owner_id None = shared library), ordered by path."""
+    q = MediaAsset.query.filter(MediaAsset.owner_id.is_(None) if owner_id is None else MediaAsset.owner_id == owner_id)
+    after = decode_cursor(cursor)
+    if after and len(after) == 1 and isinstance(after[0], str):
+        q = q.filter(MediaAsset.path > after[0])
+
+    rows = q.order_by(MediaAsset.path.asc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1].path])
+
+def attempt_json(a: Attempt) -> Dict[str, Any]:
+    return {
+        "id": a.id,
+        "student": {"id": a.student_id, "name": a.student.name if a.student else None},
+        "teacher": {"id": a.teacher_id, "name": a.teacher.name if a.teacher else None},
+        "skill": {"id": a.skill_id, "name": a.skill.name if a.skill else None},
+        "iso_year": a.iso_year,
+        "iso_week": a.iso_week,
+        "finished_at": a.finished_at.isoformat() if a.finished_at else None,
+        "duration_sec": a.duration_sec,
+        "score": a.score,
+        "correct_count": a.correct_count,
+        "total_count": a.total_count,
+        "passed": a.passed,
+        "has_pdf": bool(a.pdf_path),
+    }
+
+def question_json(q: Question) -> Dict[str, Any]:
+    return {
+        "id": q.id,
+        "skill": {"id": q.skill_id, "name": q.skill.name if q.skill else None},
+        "qtype": q.qtype,
+        "prompt": q.prompt,
+    }
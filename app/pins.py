@@ -0,0 +1,34 @@
+from __future__ import annotations
+from functools import lru_cache, partial
+from typing import Callable, Optional
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash
+
+# PINs are 4-6 digits, so the hash cost mostly buys time against an offline
+# attack on a leaked database. PIN_HASH_METHOD trades that against how many
+# logins a worker can verify per second when a whole class signs in at once.
+# Stored hashes are moved to the configured method on the next good login.
+
+DEFAULT_METHOD = "scrypt:32768:8:1"  # werkzeug 3's default
+
+def pin_hash_method() -> str:
+    if has_app_context():
+        return current_app.config.get("PIN_HASH_METHOD") or DEFAULT_METHOD
+    return DEFAULT_METHOD
+
+def hash_pin(pin: str, method: Optional[str] = None) -> str:
+    return generate_password_hash(pin, method=method or pin_hash_method())
+
+def pin_hasher(method: Optional[str] = None) -> Callable[[str], str]:
+    """Picklable hash function for process pools (see roster.hash_pins)."""
+    return partial(generate_password_hash, method=method or pin_hash_method())
+
+@lru_cache(maxsize=16)
+def _stored_prefix(method: str) -> str:
+    """The method as werkzeug writes it into a hash ("scrypt" -> "scrypt:32768:8:1")."""
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+def needs_rehash(pin_hash: str, method: Optional[str] = None) -> bool:
+    """True when ``pin_hash`` was made with other parameters than the configured method."""
+    return pin_hash.split("$", 1)[0] != _stored_prefix(method or pin_hash_method())
@@ -0,0 +1,80 @@
+from __future__ import annotations
+import json, random
+from typing import List, Optional, Sequence, Tuple
+
+from .bank import CompiledBank, CompiledQuestion
+from .cache import TTLCache
+from .models import Attempt, Skill
+
+# Question pools. A skill with draw_count set gives each attempt that many
+# questions from its bank, optionally stratified by the "tag" or "difficulty"
+# key of the question meta so each group is represented in proportion to its
+# size. The draw, the question order and the option order all follow from one
+# seed stored on the Attempt together with the chosen ids, so resuming,
+# submitting and re-rendering see the same test. Option inputs keep their
+# original index as value, so grading and stored responses are unchanged.
+
+DRAW_BY = ("tag", "difficulty")
+FIXED_ORDER_TYPES = {"true_false"}  # options keep their order
+
+_groups_cache = TTLCache(ttl=3600, maxsize=256)  # keyed by bank version, never stale
+
+def _groups(bank: CompiledBank, by: str) -> Tuple[Tuple[int, ...], ...]:
+    """Question ids of the bank grouped by a meta key (missing values form one group)."""
+
+    def build():
+        groups = {}
+        for q in bank.questions:
+            value = q.meta.get(by)
+            groups.setdefault(str(value).strip().lower() if value not in (None, "") else "", []).append(q.id)
+        return tuple(tuple(ids) for _, ids in sorted(groups.items()))
+
+    return _groups_cache.get_or_set((bank.skill_id, bank.version, by), build)
+
+def _allocate(sizes: Sequence[int], n: int, rng: random.Random) -> List[int]:
+    """Split ``n`` draws across groups in proportion to their sizes (largest remainder, ties at random)."""
+    total = sum(sizes)
+    quotas = [n * s / total for s in sizes]
+    counts = [int(q) for q in quotas]
+    order = sorted(range(len(sizes)), key=lambda i: (quotas[i] - counts[i], rng.random()), reverse=True)
+    for i in order[:n - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+def draw(bank: CompiledBank, skill: Skill, seed: Optional[int]) -> List[int]:
+    """Question ids for one attempt, in display order. Without a pool: the whole bank in bank order."""
+    ids = [q.id for q in bank.questions]
+    n = skill.draw_count or 0
+    if n <= 0 or seed is None:
+        return ids
+    rng = random.Random(seed)
+    n = min(n, len(ids))
+    if not n:
+        return []
+    if skill.draw_by not in DRAW_BY:
+        return rng.sample(ids, n)
+    groups = _groups(bank, skill.draw_by)
+    picked: List[int] = []
+    for group, k in zip(groups, _allocate([len(g) for g in groups], n, rng)):
+        picked.extend(rng.sample(group, k))
+    rng.shuffle(picked)
+    return picked
+
+def option_order(q: CompiledQuestion, seed: Optional[int]) -> Tuple[int, ...]:
+    """Original option indexes in the order this attempt shows them."""
+    order = list(range(len(q.options)))
+    if seed is not None and q.qtype not in FIXED_ORDER_TYPES and len(order) > 1:
+        random.Random(f"{seed}:{q.id}").shuffle(order)
+    return tuple(order)
+
+def assign(attempt: Attempt, skill: Skill, bank: CompiledBank) -> None:
+    """Choose a new attempt's questions (and seed, for pooled skills)."""
+    attempt.seed = random.SystemRandom().randrange(1, 2 ** 31) if skill.draw_count else None
+    attempt.question_ids_json = json.dumps(draw(bank, skill, attempt.seed))
+
+def attempt_questions(attempt: Attempt, bank: CompiledBank) -> List[CompiledQuestion]:
+    """The attempt's questions in display order; attempts started before pools get the whole bank."""
+    if not attempt.question_ids_json:
+        return list(bank.questions)
+    found = (bank.get(qid) for qid in json.loads(attempt.question_ids_json))
+    return [q for q in found if q is not None]  # a question deleted mid-attempt is dropped
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import re, time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from flask import Flask, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Opt-in per-request SQL profiling (SQL_PROFILE=1). Counts statements and time,
+# groups them by shape (literals stripped) and flags shapes repeated more than
+# SQL_PROFILE_REPEAT_LIMIT times in one request -- the usual N+1 lazy-load pattern.
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)")
+_SPACE = re.compile(r"\s+")
+
+class NPlusOneError(RuntimeError):
+    """Raised instead of logging when SQL_PROFILE_STRICT is on (tests / CI)."""
+
+class QueryStats:
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def repeated(self, limit: int) -> Dict[str, int]:
+        return {s: n for s, n in self.shapes.items() if n > limit}
+
+def statement_shape(statement: str) -> str:
+    s = _LITERALS.sub("?", statement)
+    s = _LISTS.sub("(...)", s)
+    return _SPACE.sub(" ", s).strip()
+
+def current_stats() -> Optional[QueryStats]:
+    return g.get("_sql_stats") if has_app_context() else None
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault("_sql_started", []).append(time.perf_counter())
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is None:
+        return
+    started = conn.info.get("_sql_started")
+    if started:
+        stats.seconds += time.perf_counter() - started.pop()
+    stats.count += 1
+    stats.shapes[statement_shape(statement)] += 1
+
+def init_profiler(app: Flask) -> None:
+    if not app.config.get("SQL_PROFILE"):
+        return
+    limit = app.config["SQL_PROFILE_REPEAT_LIMIT"]
+    strict = app.config["SQL_PROFILE_STRICT"]
+
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+
+    @app.before_request
+    def _start_profile():
+        g._sql_stats = QueryStats()
+
+    @app.after_request
+    def _finish_profile(response):
+        stats: Any = g.pop("_sql_stats", None)
+        if stats is None:
+            return response
+        ms = stats.seconds * 1000
+        response.headers["X-SQL-Queries"] = str(stats.count)
+        response.headers["Server-Timing"] = f'sql;dur={ms:.1f};desc="{stats.count} queries"'
+        app.logger.info("SQL %s %s: %d queries, %.1f ms", request.method, request.path, stats.count, ms)
+
+        repeated = stats.repeated(limit)
+        if repeated:
+            worst = sorted(repeated.items(), key=lambda kv: -kv[1])
+            detail = "; ".join(f"{n}x {shape[:200]}" for shape, n in worst[:3])
+            msg = f"Possible N+1 on {request.method} {request.path}: {detail}"
+            if strict:
+                raise NPlusOneError(msg)
+            app.logger.warning(msg)
+        return response
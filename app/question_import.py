@@ -0,0 +1,138 @@
+from __future__ import annotations
+import csv, io, json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from . import db
+from .bank import bump_bank_version
+from .grading import GRADERS
+from .media import link_questions, media_refs
+from .models import Skill, Question
+
+CHOICE_TYPES = {"mcq_single", "mcq_multi", "true_false", "image_mcq_single", "video_cued_mcq_single"}
+MAX_REPORTED_ERRORS = 200
+
+def _blank(v: Any) -> bool:
+    return v is None or str(v).strip() in ("", "None")
+
+def _intish(v: Any) -> int:
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return int(str(v).strip())
+
+def answer_json(qtype: str, raw: Any) -> Optional[str]:
+    """Answer cell/field -> stored answer_json. Raises ValueError for malformed choice answers."""
+    if qtype == "mcq_multi":
+        return json.dumps([_intish(x) for x in str(raw or "").split(",") if x.strip()], ensure_ascii=False)
+    if qtype == "short_text":
+        return json.dumps("" if raw is None else str(raw), ensure_ascii=False)
+    return None if _blank(raw) else json.dumps(_intish(raw), ensure_ascii=False)
+
+def iter_rows(f, filename: str) -> Iterator[Dict[str, Any]]:
+    """Stream rows as dicts from an uploaded CSV or XLSX without materialising the sheet."""
+    name = filename.lower()
+    if name.endswith(".csv"):
+        text = io.TextIOWrapper(f.stream, encoding="utf-8-sig", newline="")
+        try:
+            yield from csv.DictReader(text)
+        finally:
+            text.detach()
+    elif name.endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(f.stream, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            headers = [str(c).strip() if c is not None else "" for c in header]
+            for r in rows:
+                yield {headers[i]: (r[i] if i < len(r) else None) for i in range(len(headers))}
+        finally:
+            wb.close()
+    else:
+        raise ValueError("Only .csv or .xlsx supported.")
+
+def _parse_row(row: Dict[str, Any], skill_ids: set, skill_by_name: Dict[str, int],
+               default_skill_id: Optional[int]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    qtype = str(row.get("qtype") or "").strip()
+    prompt = str(row.get("prompt") or "").strip()
+    if not prompt or not qtype:
+        return None, "qtype and prompt are required"
+    if qtype not in GRADERS:
+        return None, f"unknown qtype '{qtype}'"
+
+    sid = None
+    if not _blank(row.get("skill_id")):
+        try:
+            sid = _intish(row.get("skill_id"))
+        except ValueError:
+            return None, f"invalid skill_id '{row.get('skill_id')}'"
+    if sid is None and default_skill_id:
+        sid = default_skill_id
+    if sid is None and not _blank(row.get("skill_name")):
+        sid = skill_by_name.get(str(row.get("skill_name")).strip())
+    if sid is None or sid not in skill_ids:
+        return None, "unknown skill (set skill_id, skill_name or a default skill)"
+
+    options_json = None
+    options_raw = row.get("options")
+    if not _blank(options_raw):
+        opts = [x.strip() for x in str(options_raw).split("|") if x.strip()]
+        options_json = json.dumps(opts, ensure_ascii=False)
+    if qtype in CHOICE_TYPES and not options_json:
+        return None, "options are required for choice questions"
+
+    try:
+        ans = answer_json(qtype, row.get("answer"))
+    except ValueError:
+        return None, f"invalid answer '{row.get('answer')}' for {qtype}"
+
+    meta = row.get("meta_json") or row.get("meta")
+    meta_json = None
+    if not _blank(meta):
+        m = str(meta).strip()
+        meta_json = m if (m.startswith("{") or m.startswith("[")) else json.dumps(m, ensure_ascii=False)
+
+    return {"skill_id": sid, "qtype": qtype, "prompt": prompt, "options_json": options_json,
+            "answer_json": ans, "meta_json": meta_json}, None
+
+def import_questions(f, filename: str, default_skill_id: Optional[int] = None,
+                     batch_size: int = 500) -> Dict[str, Any]:
+    """Validate and insert questions in batches; one transaction, one bank-version bump per skill.
+
+    Returns {"created", "skipped", "errors": [{"row", "error"}, ...]} (errors capped).
+    """
+    skills = db.session.query(Skill.id, Skill.name).all()
+    skill_ids = {sid for sid, _ in skills}
+    skill_by_name = {name.strip(): sid for sid, name in skills}
+
+    created, skipped = 0, 0
+    errors: List[Dict[str, Any]] = []
+    touched = set()
+    with_media = set()  # skills whose new questions reference library media
+    batch: List[Dict[str, Any]] = []
+
+    for line, row in enumerate(iter_rows(f, filename), start=2):  # row 1 is the header
+        values, error = _parse_row(row, skill_ids, skill_by_name, default_skill_id)
+        if error:
+            skipped += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": line, "error": error})
+            continue
+        batch.append(values)
+        touched.add(values["skill_id"])
+        if values["meta_json"] and media_refs(values["meta_json"]):
+            with_media.add(values["skill_id"])
+        if len(batch) >= batch_size:
+            db.session.execute(insert(Question), batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Question), batch)
+        created += len(batch)
+
+    bump_bank_version(touched)
+    if with_media:
+        link_questions(skill_ids=with_media)
+    db.session.commit()
+    return {"created": created, "skipped": skipped, "errors": errors}
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict
+
+from flask import current_app
+
+from . import db, stats
+from .jobs import handler, enqueue
+from .mailer import queue_email, smtp_configured
+from .models import User, Skill, Attempt
+from .utils import generate_attempt_pdf
+from .answers import display_answers
+
+def report_job_key(attempt_id: int) -> str:
+    return f"attempt_report:{attempt_id}"
+
+def enqueue_attempt_report(attempt: Attempt, rebuild: bool = False) -> None:
+    """Queue the PDF/e-mail job; ``rebuild`` (after a regrade) runs it again if it already ran."""
+    enqueue("attempt_report", {"attempt_id": attempt.id}, key=report_job_key(attempt.id), requeue=rebuild)
+
+@handler("attempt_report")
+def build_attempt_report(payload: Dict[str, Any]):
+    attempt = db.session.get(Attempt, payload["attempt_id"])
+    if attempt is None or attempt.finished_at is None:
+        return {"skipped": "attempt missing or unfinished"}
+
+    pdf_filename = f"attempt_{attempt.id}.pdf"
+    pdf_abs = os.path.join(current_app.config["REPORTS_DIR"], pdf_filename)
+
+    # Idempotent: a retry after the PDF was written only re-queues the (deduplicated) e-mail.
+    if not (attempt.pdf_path and os.path.exists(pdf_abs)):
+        student = db.session.get(User, attempt.student_id)
+        teacher = User.query.filter_by(id=attempt.teacher_id, role="teacher").first()
+        skill = db.session.get(Skill, attempt.skill_id)
+        answers = display_answers(attempt)
+        pass_pct = (skill.pass_pct if skill else None) or 80
+
+        generate_attempt_pdf(
+            pdf_abs,
+            school_name="Al Thaghr School",
+            student_id=attempt.student_id,
+            student_name=student.name if student else attempt.student_id,
+            teacher_name=teacher.name if teacher else "-",
+            skill_name=skill.name if skill else "-",
+            started_at=attempt.started_at,
+            finished_at=attempt.finished_at,
+            duration_sec=attempt.duration_sec or 0,
+            answers=answers,
+            summary={
+                "score_pct": int(round((attempt.score or 0) * 100)),
+                "correct": attempt.correct_count,
+                "total": attempt.total_count,
+                "lacking_skills": [w["skill"].name for w in stats.weakest_skills(attempt.student_id)],
+                "pass_pct": pass_pct,
+                "pass_fail": "PASS" if attempt.passed else "FAIL",
+            }
+        )
+        attempt.pdf_path = pdf_filename
+
+    _queue_teacher_email(attempt, pdf_abs)
+    db.session.commit()
+    return {"pdf_path": pdf_filename}
+
+def _queue_teacher_email(attempt: Attempt, pdf_abs: str) -> None:
+    if not smtp_configured():
+        return
+    teacher = User.query.filter_by(id=attempt.teacher_id, role="teacher").first()
+    if not (teacher and teacher.email):
+        return
+    student = db.session.get(User, attempt.student_id)
+    skill = db.session.get(Skill, attempt.skill_id)
+    queue_email(
+        teacher.email,
+        subject=f"Student test report — {student.name if student else attempt.student_id} — {skill.name if skill else '-'}",
+        body="Attached is the PDF report for the completed test.",
+        attachments=[{"path": pdf_abs, "filename": os.path.basename(pdf_abs), "mime": "application/pdf"}],
+        dedupe_key=f"attempt_report:{attempt.id}",
+        digest=True,
+    )
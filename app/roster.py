@@ -0,0 +1,126 @@
+from __future__ import annotations
+import csv, os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import insert, update
+
+from . import db
+from .jobs import handler, report_progress
+from .pins import pin_hasher
+from .cache import forget_users
+from .models import User, Skill, StudentSkill
+
+def _hash_pool(workers: int):
+    # spawn: the caller may be a threaded web/worker process holding DB connections.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+def hash_pins(pins: List[str], pool: Optional[ProcessPoolExecutor] = None, workers: int = 1) -> List[str]:
+    """Hash PINs, fanning out to ``pool`` when given: the hash is deliberately slow."""
+    hasher = pin_hasher()
+    if pool is None or len(pins) < 32:
+        return [hasher(p) for p in pins]
+    return list(pool.map(hasher, pins, chunksize=max(1, len(pins) // (workers * 4))))
+
+def _clean(row: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "id": (row.get("student_id") or "").strip(),
+        "name": (row.get("name") or "").strip(),
+        "pin": (row.get("pin") or "1234").strip(),
+        "teacher_id": (row.get("teacher_id") or "").strip(),
+    }
+
+def _apply_batch(rows: List[Dict[str, str]], skills: List[Skill], counts: Dict[str, int],
+                 pool: Optional[ProcessPoolExecutor], workers: int) -> None:
+    by_id = {r["id"]: r for r in rows}  # last row wins within a batch
+    ids = list(by_id)
+
+    existing = dict(db.session.query(User.id, User.role).filter(User.id.in_(ids)).all())
+    new_rows, updates = [], []
+    for sid, r in by_id.items():
+        role = existing.get(sid)
+        if role is None:
+            new_rows.append(r)
+        elif role == "student":
+            upd = {"id": sid, "name": r["name"]}
+            if r["teacher_id"]:
+                upd["teacher_id"] = r["teacher_id"]
+            updates.append(upd)
+        else:
+            counts["skipped"] += 1  # ID belongs to a teacher/chairman
+
+    if new_rows:
+        hashes = hash_pins([r["pin"] for r in new_rows], pool, workers)
+        db.session.execute(insert(User), [
+            {"id": r["id"], "role": "student", "name": r["name"],
+             "teacher_id": r["teacher_id"] or None, "pin_hash": h}
+            for r, h in zip(new_rows, hashes)
+        ])
+    # Rows without a teacher_id keep their current teacher, so update the two shapes separately.
+    for shape in ({"id", "name"}, {"id", "name", "teacher_id"}):
+        same = [u for u in updates if set(u) == shape]
+        if same:
+            db.session.execute(update(User), same)
+
+    student_ids = [r["id"] for r in new_rows] + [u["id"] for u in updates]
+    have = set(
+        db.session.query(StudentSkill.student_id, StudentSkill.skill_id)
+        .filter(StudentSkill.student_id.in_(student_ids))
+        .all()
+    ) if student_ids else set()
+    perms = [
+        {"student_id": sid, "skill_id": sk.id, "allowed": sk.order_index == 1}
+        for sid in student_ids for sk in skills if (sid, sk.id) not in have
+    ]
+    if perms:
+        db.session.execute(insert(StudentSkill), perms)
+
+    db.session.commit()
+    forget_users([u["id"] for u in updates])
+    counts["created"] += len(new_rows)
+    counts["updated"] += len(updates)
+
+def import_roster(path: str, *, batch_size: Optional[int] = None,
+                  progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Stream a student roster CSV (student_id,name[,pin,teacher_id]) into users and permissions."""
+    batch_size = batch_size or current_app.config["ROSTER_BATCH_SIZE"]
+    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
+    counts = {"rows": 0, "created": 0, "updated": 0, "skipped": 0}
+
+    workers = current_app.config["ROSTER_HASH_WORKERS"]
+    pool = _hash_pool(workers) if workers > 1 else None
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            batch: List[Dict[str, str]] = []
+            for raw in csv.DictReader(f):
+                counts["rows"] += 1
+                row = _clean(raw)
+                if not row["id"] or not row["name"]:
+                    counts["skipped"] += 1
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    _apply_batch(batch, skills, counts, pool, workers)
+                    batch = []
+                    if progress:
+                        progress(dict(counts))
+            if batch:
+                _apply_batch(batch, skills, counts, pool, workers)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if progress:
+        progress(dict(counts))
+    return counts
+
+@handler("roster_import")
+def roster_import_job(payload: Dict[str, Any]):
+    path = payload["path"]
+    counts = import_roster(path, progress=report_progress)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return counts
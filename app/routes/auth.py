@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from ..models import User
 from .. import db
+from ..cache import teacher_choices, forget_users
+from ..pins import needs_rehash
 
 bp = Blueprint("auth", __name__)
 
@@ -18,7 +20,7 @@ def home():
 
 @bp.route("/login", methods=["GET", "POST"])
 def login():
-    teachers = User.query.filter_by(role="teacher").order_by(User.name.asc()).all()
+    teachers = teacher_choices()
 
     if request.method == "POST":
         role = request.form.get("role")
@@ -39,16 +41,26 @@ def login():
             flash("Wrong PIN.", "error")
             return render_template("login.html", teachers=teachers)
 
+        dirty = False
         if role == "student":
             if not teacher_id:
                 flash("Select your teacher.", "error")
                 return render_template("login.html", teachers=teachers)
-            teacher = User.query.filter_by(id=teacher_id, role="teacher").first()
-            if not teacher:
+            known = teacher_id in {t.id for t in teachers}
+            if not known and not User.query.filter_by(id=teacher_id, role="teacher").first():
                 flash("Teacher not found.", "error")
                 return render_template("login.html", teachers=teachers)
-            user.teacher_id = teacher.id
+            if user.teacher_id != teacher_id:
+                user.teacher_id = teacher_id
+                dirty = True
+
+        # Move the stored hash to the configured PIN_HASH_METHOD while we know the PIN.
+        if needs_rehash(user.pin_hash):
+            user.set_pin(pin)
+            dirty = True
+        if dirty:
             db.session.commit()
+            forget_users([user.id])
 
         login_user(user)
 
@@ -1,10 +1,16 @@
 from __future__ import annotations
-import csv, io
-from werkzeug.security import generate_password_hash
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import os, uuid
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-from .. import db
-from ..models import User, Skill, StudentSkill, Attempt, Question
+from .. import db, stats, exports, item_analysis
+from ..models import User, Skill, StudentSkill, Job, MediaAsset
+from ..pools import DRAW_BY
+from ..question_import import import_questions
+from ..jobs import enqueue
+from ..media import delete_asset, save_upload, usage_counts
+from ..cache import forget_teachers
+from ..pins import hash_pin
+from ..pagination import attempt_filters, attempts_page, questions_page, media_page, page_size, attempt_json, question_json
 
 bp = Blueprint("chairman", __name__)
 
@@ -21,25 +27,11 @@ def dashboard():
         return redirect(url_for('auth.home'))
 
     teachers = User.query.filter_by(role="teacher").all()
-    students = User.query.filter_by(role="student").all()
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
-    attempts = Attempt.query.filter(Attempt.finished_at.isnot(None)).all()
-
-    perf = []
-    for t in teachers:
-        t_attempts = [a for a in attempts if a.teacher_id == t.id]
-        avg = round(100 * (sum([a.score or 0 for a in t_attempts]) / len(t_attempts)), 2) if t_attempts else 0.0
-        perf.append({"teacher": t, "attempts": len(t_attempts), "avg": avg})
-    perf.sort(key=lambda x: x["avg"], reverse=True)
+    perf = stats.teacher_performance()
+    sperf = stats.students_needing_attention(limit=10)
 
-    sperf = []
-    for s in students:
-        s_attempts = [a for a in attempts if a.student_id == s.id]
-        avg = round(100 * (sum([a.score or 0 for a in s_attempts]) / len(s_attempts)), 2) if s_attempts else 0.0
-        sperf.append({"student": s, "attempts": len(s_attempts), "avg": avg})
-    sperf.sort(key=lambda x: x["avg"])
-
-    return render_template("chairman_dashboard.html", teachers=teachers, students=students, skills=skills, perf=perf, sperf=sperf)
+    return render_template("chairman_dashboard.html", teachers=teachers, skills=skills, perf=perf, sperf=sperf)
 
 @bp.get("/users")
 @login_required
@@ -49,7 +41,8 @@ def users():
 
     teachers = User.query.filter_by(role="teacher").order_by(User.name.asc()).all()
     students = User.query.filter_by(role="student").order_by(User.name.asc()).all()
-    return render_template("chairman_users.html", teachers=teachers, students=students)
+    imports = Job.query.filter_by(kind="roster_import").order_by(Job.id.desc()).limit(5).all()
+    return render_template("chairman_users.html", teachers=teachers, students=students, imports=imports)
 
 @bp.post("/users/add_teacher")
 @login_required
@@ -75,9 +68,10 @@ def add_teacher():
         role="teacher",
         name=name,
         email=email or None,
-        pin_hash=generate_password_hash(pin),
+        pin_hash=hash_pin(pin),
     ))
     db.session.commit()
+    forget_teachers()
     flash("Teacher added.", "ok")
     return redirect(url_for("chairman.users"))
 
@@ -92,47 +86,13 @@ def import_students():
         flash("Upload CSV file.", "error")
         return redirect(url_for("chairman.users"))
 
-    content = f.read().decode("utf-8-sig")
-    reader = csv.DictReader(io.StringIO(content))
-    created, updated = 0, 0
-
-    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
-
-    for row in reader:
-        sid = (row.get("student_id") or "").strip()
-        name = (row.get("name") or "").strip()
-        pin = (row.get("pin") or "1234").strip()
-        teacher_id = (row.get("teacher_id") or "").strip()
-
-        if not sid or not name:
-            continue
-
-        u = User.query.filter_by(id=sid, role="student").first()
-        if not u:
-            u = User(
-                id=sid,
-                role="student",
-                name=name,
-                teacher_id=teacher_id or None,
-                pin_hash=generate_password_hash(pin),
-            )
-            db.session.add(u)
-            created += 1
-        else:
-            u.name = name
-            u.teacher_id = teacher_id or u.teacher_id
-            updated += 1
-
-        db.session.flush()
-
-        for sk in skills:
-            perm = StudentSkill.query.filter_by(student_id=u.id, skill_id=sk.id).first()
-            if not perm:
-                allowed = (sk.order_index == 1)
-                db.session.add(StudentSkill(student_id=u.id, skill_id=sk.id, allowed=allowed))
-
+    # Saved to disk and imported by the job worker: hashing thousands of PINs
+    # does not fit in a web request.
+    path = os.path.join(current_app.config["IMPORTS_DIR"], f"roster_{uuid.uuid4().hex}.csv")
+    f.save(path)
+    enqueue("roster_import", {"path": path, "filename": f.filename})
     db.session.commit()
-    flash(f"Students imported. Created: {created}, Updated: {updated}.", "ok")
+    flash("Roster upload received. Import progress is shown below.", "ok")
     return redirect(url_for("chairman.users"))
 
 @bp.get("/skills")
@@ -144,6 +104,12 @@ def skills():
     skills = Skill.query.order_by(Skill.order_index.asc()).all()
     return render_template("chairman_skills.html", skills=skills)
 
+def _pool_settings(form):
+    """(draw_count, draw_by) from the skill forms; blank or 0 means every question."""
+    draw_count = max(0, int(form.get("draw_count") or "0")) or None
+    draw_by = form.get("draw_by") if form.get("draw_by") in DRAW_BY else None
+    return draw_count, draw_by
+
 @bp.post("/skills/add")
 @login_required
 def add_skill():
@@ -156,12 +122,14 @@ def add_skill():
 
     pass_pct_raw = request.form.get("pass_pct")
     pass_pct = int(pass_pct_raw) if pass_pct_raw and str(pass_pct_raw).strip() else None
+    draw_count, draw_by = _pool_settings(request.form)
 
     if not name:
         flash("Skill name required.", "error")
         return redirect(url_for("chairman.skills"))
 
-    sk = Skill(name=name, order_index=order_index, duration_min=duration_min, pass_pct=pass_pct, is_active=True)
+    sk = Skill(name=name, order_index=order_index, duration_min=duration_min, pass_pct=pass_pct, is_active=True,
+               draw_count=draw_count, draw_by=draw_by)
     db.session.add(sk)
     db.session.commit()
 
@@ -173,6 +141,22 @@ def add_skill():
     flash("Skill added.", "ok")
     return redirect(url_for("chairman.skills"))
 
+@bp.post("/skills/<int:skill_id>/pool")
+@login_required
+def skill_pool(skill_id: int):
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+
+    sk = Skill.query.get(skill_id)
+    if not sk:
+        flash("Skill not found.", "error")
+        return redirect(url_for("chairman.skills"))
+    # Attempts already started keep the questions they were given.
+    sk.draw_count, sk.draw_by = _pool_settings(request.form)
+    db.session.commit()
+    flash("Question pool updated.", "ok")
+    return redirect(url_for("chairman.skills"))
+
 @bp.get("/question_tool")
 @login_required
 def question_tool():
@@ -180,8 +164,10 @@ def question_tool():
         return redirect(url_for('auth.home'))
 
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
-    questions = Question.query.order_by(Question.id.desc()).limit(500).all()
-    return render_template("question_tool.html", skills=skills, questions=questions, role=current_user.role)
+    filters = attempt_filters(request.args)
+    questions, next_cursor = questions_page(filters, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    return render_template("question_tool.html", skills=skills, questions=questions, role=current_user.role,
+                           filters=filters, next_cursor=next_cursor)
 
 @bp.post("/question_tool/add")
 @login_required
@@ -192,25 +178,39 @@ def add_question():
         return redirect(url_for('auth.home'))
     return teacher_add_question()
 
+@bp.post("/question_tool/<int:question_id>/answer")
+@login_required
+def fix_answer(question_id: int):
+    from ..routes.teacher import update_answer_key
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+    return update_answer_key(question_id)
+
+@bp.post("/question_tool/regrade")
+@login_required
+def regrade():
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+    skill_id = int(request.form.get("skill_id") or "0") or None
+    enqueue("regrade", {"skill_id": skill_id})
+    db.session.commit()
+    flash("Re-grade queued.", "ok")
+    return redirect(url_for("chairman.question_tool"))
 
 @bp.get("/media")
 @login_required
 def media_library():
     if not _ensure_admin():
         return redirect(url_for('auth.home'))
-    import os
-    from flask import current_app
-    media_dir = current_app.config["MEDIA_DIR"]
-    os.makedirs(media_dir, exist_ok=True)
-    files = [n for n in sorted(os.listdir(media_dir)) if os.path.isfile(os.path.join(media_dir, n))]
-    return render_template("chairman_media.html", files=files)
+    assets, next_cursor = media_page(None, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    return render_template("chairman_media.html", assets=assets, next_cursor=next_cursor,
+                           used=usage_counts([a.path for a in assets]))
 
 @bp.post("/media/upload")
 @login_required
 def media_upload():
     if not _ensure_admin():
         return redirect(url_for('auth.home'))
-    import os
     from flask import current_app
     f = request.files.get("file")
     if not f or not f.filename:
@@ -221,10 +221,25 @@ def media_upload():
         flash("Media type not allowed.", "error")
         return redirect(url_for("chairman.media_library"))
     safe = "".join([c if c.isalnum() or c in "._-" else "_" for c in f.filename]).strip("_") or ("media."+ext)
-    media_dir = current_app.config["MEDIA_DIR"]
-    os.makedirs(media_dir, exist_ok=True)
-    f.save(os.path.join(media_dir, safe))
-    flash("Uploaded.", "ok")
+    path = save_upload(f, "", safe, current_user.id)
+    db.session.commit()
+    flash("Uploaded." if path == safe else f"Uploaded as {path} (that name was taken).", "ok")
+    return redirect(url_for("chairman.media_library"))
+
+@bp.post("/media/delete")
+@login_required
+def media_delete():
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+    asset = MediaAsset.query.filter_by(path=request.form.get("path") or "").first()
+    if not asset:
+        flash("File not found.", "error")
+    elif usage_counts([asset.path]):
+        flash("That file is still used by a question.", "error")
+    else:
+        delete_asset(asset)
+        db.session.commit()
+        flash("File removed.", "ok")
     return redirect(url_for("chairman.media_library"))
 
 @bp.get("/attempts")
@@ -233,8 +248,63 @@ def attempts():
     if not _ensure_admin():
         return redirect(url_for('auth.home'))
 
-    attempts = Attempt.query.filter(Attempt.finished_at.isnot(None)).order_by(Attempt.finished_at.desc()).limit(500).all()
-    return render_template("chairman_attempts.html", attempts=attempts)
+    filters = attempt_filters(request.args)
+    attempts, next_cursor = attempts_page(filters, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    teachers = User.query.filter_by(role="teacher").order_by(User.name.asc()).all()
+    skills = Skill.query.order_by(Skill.order_index.asc()).all()
+    return render_template("chairman_attempts.html", attempts=attempts, next_cursor=next_cursor,
+                           filters=filters, teachers=teachers, skills=skills)
+
+@bp.get("/export/<kind>.<fmt>")
+@login_required
+def export(kind: str, fmt: str):
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+    if fmt not in exports.FORMATS:
+        flash("Unknown export format.", "error")
+        return redirect(url_for("chairman.dashboard"))
+
+    if kind == "attempts":
+        return exports.export_response("attempts", fmt, exports.ATTEMPT_HEADER,
+                                       exports.attempt_rows(attempt_filters(request.args)))
+    if kind == "teacher_performance":
+        return exports.export_response("teacher_performance", fmt, exports.PERFORMANCE_HEADER,
+                                       exports.teacher_performance_rows())
+    if kind == "roster":
+        return exports.export_response("roster", fmt, exports.ROSTER_HEADER,
+                                       exports.roster_rows(request.args.get("teacher_id") or None))
+    flash("Unknown export.", "error")
+    return redirect(url_for("chairman.dashboard"))
+
+@bp.get("/api/attempts")
+@login_required
+def api_attempts():
+    if current_user.role != "chairman":
+        return jsonify({"error": "Chairman access only."}), 403
+    limit = page_size(request.args, current_app.config["PAGE_SIZE"], current_app.config["API_MAX_PAGE_SIZE"])
+    attempts, next_cursor = attempts_page(attempt_filters(request.args), request.args.get("cursor"), limit)
+    return jsonify({"items": [attempt_json(a) for a in attempts], "next_cursor": next_cursor})
+
+@bp.get("/api/questions")
+@login_required
+def api_questions():
+    if current_user.role != "chairman":
+        return jsonify({"error": "Chairman access only."}), 403
+    limit = page_size(request.args, current_app.config["PAGE_SIZE"], current_app.config["API_MAX_PAGE_SIZE"])
+    questions, next_cursor = questions_page(attempt_filters(request.args), request.args.get("cursor"), limit)
+    return jsonify({"items": [question_json(q) for q in questions], "next_cursor": next_cursor})
+
+@bp.get("/item_analysis")
+@login_required
+def item_analysis_view():
+    if not _ensure_admin():
+        return redirect(url_for('auth.home'))
+    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
+    skill_id = request.args.get("skill_id", type=int) or (skills[0].id if skills else None)
+    min_answers = max(1, request.args.get("min_answers", 1, type=int))
+    items = item_analysis.item_report(skill_id, min_answers) if skill_id else []
+    return render_template("item_analysis.html", skills=skills, skill_id=skill_id, min_answers=min_answers,
+                           items=items, role=current_user.role)
 
 @bp.get("/question_import")
 @login_required
@@ -250,11 +320,6 @@ def question_import_upload():
     if not _ensure_admin():
         return redirect(url_for("auth.home"))
 
-    import io
-    import csv
-    import json
-    from openpyxl import load_workbook
-
     f = request.files.get("file")
     default_skill_id = int(request.form.get("default_skill_id") or "0") or None
 
@@ -262,78 +327,13 @@ def question_import_upload():
         flash("Upload a CSV/XLSX file.", "error")
         return redirect(url_for("chairman.question_import"))
 
-    name = f.filename.lower()
-    rows = []
-
-    if name.endswith(".csv"):
-        content = f.read().decode("utf-8-sig")
-        reader = csv.DictReader(io.StringIO(content))
-        rows = list(reader)
-    elif name.endswith(".xlsx"):
-        wb = load_workbook(f, data_only=True)
-        ws = wb.active
-        headers = [str(c.value).strip() if c.value is not None else "" for c in next(ws.iter_rows(min_row=1, max_row=1))]
-        for r in ws.iter_rows(min_row=2, values_only=True):
-            d = {headers[i]: (r[i] if i < len(r) else None) for i in range(len(headers))}
-            rows.append(d)
-    else:
-        flash("Only .csv or .xlsx supported.", "error")
+    try:
+        report = import_questions(f, f.filename, default_skill_id=default_skill_id)
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "error")
         return redirect(url_for("chairman.question_import"))
 
-    created = 0
-    skipped = 0
-
-    for row in rows:
-        skill_id = row.get("skill_id")
-        skill_name = row.get("skill_name")
-        qtype = (row.get("qtype") or "").strip()
-        prompt = (row.get("prompt") or "").strip()
-        if not prompt or not qtype:
-            skipped += 1
-            continue
-
-        sid = None
-        try:
-            sid = int(skill_id) if skill_id not in (None, "", "None") else None
-        except Exception:
-            sid = None
-        if sid is None and default_skill_id:
-            sid = default_skill_id
-        if sid is None and skill_name:
-            sk = Skill.query.filter_by(name=str(skill_name).strip()).first()
-            sid = sk.id if sk else None
-        if sid is None:
-            skipped += 1
-            continue
-
-        options_raw = (row.get("options") or "").strip()
-        options_json = None
-        if options_raw:
-            opts = [x.strip() for x in str(options_raw).split("|") if x.strip()]
-            options_json = json.dumps(opts, ensure_ascii=False)
-
-        ans_raw = row.get("answer")
-        answer_json = None
-        try:
-            if qtype == "mcq_multi":
-                answer_json = json.dumps([int(x.strip()) for x in str(ans_raw).split(",") if x.strip()], ensure_ascii=False)
-            elif qtype == "short_text":
-                answer_json = json.dumps(str(ans_raw or ""), ensure_ascii=False)
-            else:
-                answer_json = json.dumps(int(ans_raw), ensure_ascii=False) if ans_raw not in (None, "", "None") else None
-        except Exception:
-            answer_json = json.dumps(str(ans_raw or ""), ensure_ascii=False) if qtype == "short_text" else None
-
-        meta = (row.get("meta_json") or row.get("meta") or "")
-        meta_json = None
-        if meta not in (None, "", "None"):
-            m = str(meta).strip()
-            meta_json = m if (m.startswith("{") or m.startswith("[")) else json.dumps(m, ensure_ascii=False)
-
-        q = Question(skill_id=sid, qtype=qtype, prompt=prompt, options_json=options_json, answer_json=answer_json, meta_json=meta_json)
-        db.session.add(q)
-        created += 1
-
-    db.session.commit()
-    flash(f"Imported. Created: {created}, Skipped: {skipped}.", "ok")
-    return redirect(url_for("chairman.question_tool"))
+    flash(f"Imported. Created: {report['created']}, Skipped: {report['skipped']}.", "ok")
+    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
+    return render_template("chairman_question_import.html", skills=skills, report=report)
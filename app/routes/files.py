@@ -1,8 +1,12 @@
 from __future__ import annotations
-import os
-from flask import Blueprint, current_app, send_file, abort
+import mimetypes
+from flask import Blueprint, current_app, abort, request
 from flask_login import login_required, current_user
-from ..models import Attempt, RemediationUpload
+from .. import db
+from ..blobs import blob_relpath, can_read, is_sha, variants_path
+from ..delivery import deliver, resolve
+from ..media import media_file
+from ..models import Attempt, Blob, RemediationUpload
 
 bp = Blueprint("files", __name__)
 
@@ -16,10 +20,9 @@ def report(attempt_id: int):
         abort(403)
     if current_user.role == "teacher" and a.teacher_id != current_user.id:
         abort(403)
-    pdf_abs = os.path.join(current_app.config["REPORTS_DIR"], a.pdf_path)
-    if not os.path.exists(pdf_abs):
-        abort(404)
-    return send_file(pdf_abs, as_attachment=True, download_name=a.pdf_path)
+    pdf_abs = resolve(current_app.config["REPORTS_DIR"], a.pdf_path)
+    # Re-grading rewrites the PDF in place: always revalidate (the ETag follows mtime/size).
+    return deliver(pdf_abs, as_attachment=True, download_name=a.pdf_path, max_age=0)
 
 @bp.get("/remediation/<int:upload_id>")
 @login_required
@@ -31,15 +34,30 @@ def remediation(upload_id: int):
         abort(403)
     if current_user.role == "teacher" and u.teacher_id != current_user.id:
         abort(403)
-    abs_path = os.path.join(current_app.config["UPLOADS_DIR"], u.stored_path)
-    if not os.path.exists(abs_path):
-        abort(404)
-    return send_file(abs_path, as_attachment=True, download_name=u.filename)
+    if u.blob_sha:
+        # Content never changes under a hash; the row may be deleted, so keep the normal max-age.
+        abs_path = resolve(current_app.config["BLOBS_DIR"], blob_relpath(u.blob_sha))
+        return deliver(abs_path, as_attachment=True, download_name=u.filename)
+    abs_path = resolve(current_app.config["UPLOADS_DIR"], u.stored_path)
+    return deliver(abs_path, as_attachment=True, download_name=u.filename, max_age=0)
 
 @bp.get("/media/<path:relpath>")
 @login_required
 def media(relpath: str):
-    abs_path = os.path.join(current_app.config["MEDIA_DIR"], relpath)
-    if not os.path.exists(abs_path):
+    return deliver(media_file(relpath), mimetype=mimetypes.guess_type(relpath)[0])
+
+@bp.get("/blob/<sha>")
+@bp.get("/blob/<sha>/<variant>")
+@login_required
+def blob(sha: str, variant: str = None):
+    """Content-addressed URL: the bytes behind it never change, so browsers keep it for a year."""
+    if not is_sha(sha):
+        abort(404)
+    row = db.session.query(Blob.mime).filter(Blob.sha256 == sha).first()
+    if row is None or not can_read(sha, current_user):
         abort(404)
-    return send_file(abs_path)
+    if variant:
+        return deliver(resolve(variants_path(sha), variant), immutable=True)
+    name = request.args.get("name")  # download name for attachments
+    return deliver(resolve(current_app.config["BLOBS_DIR"], blob_relpath(sha)), mimetype=row[0],
+                   download_name=name, as_attachment=bool(name), immutable=True)
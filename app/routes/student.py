@@ -1,11 +1,17 @@
 from __future__ import annotations
-import os, json
-from datetime import datetime, timedelta
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from datetime import datetime
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-from .. import db
-from ..models import User, Skill, StudentSkill, Question, Attempt, RemediationUpload
-from ..utils import iso_year_week, generate_attempt_pdf, try_email_pdf
+from sqlalchemy.orm import joinedload
+from .. import db, stats, item_analysis, autosave, pools
+from ..fragments import question_markup
+from ..models import User, Skill, StudentSkill, Attempt, RemediationUpload
+from ..utils import iso_year_week
+from ..jobs import job_for
+from ..reports import enqueue_attempt_report, report_job_key
+from ..bank import get_bank
+from ..grading import grader_for
+from ..answers import save_answers, display_answers
 
 bp = Blueprint("student", __name__)
 
@@ -24,21 +30,24 @@ def dashboard():
     teacher = User.query.filter_by(id=current_user.teacher_id, role="teacher").first()
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
     perms = {p.skill_id: p for p in StudentSkill.query.filter_by(student_id=current_user.id).all()}
-    attempts = Attempt.query.filter_by(student_id=current_user.id).order_by(Attempt.started_at.desc()).all()
+    attempts = Attempt.query.options(joinedload(Attempt.skill)).filter_by(student_id=current_user.id).order_by(Attempt.started_at.desc()).limit(10).all()
+    by_skill = stats.student_skill_progress(current_user.id)
 
     progress = []
     for sk in skills:
-        sk_attempts = [a for a in attempts if a.skill_id == sk.id and a.finished_at is not None]
+        row = by_skill.get(sk.id) or {}
         progress.append({
             "skill": sk,
             "allowed": bool(perms.get(sk.id).allowed) if perms.get(sk.id) else False,
-            "times": len(sk_attempts),
-            "best": int(round(max([a.score or 0 for a in sk_attempts], default=0)*100)),
-            "last": sk_attempts[0].finished_at if sk_attempts else None
+            "times": row.get("times", 0),
+            "best": row.get("best", 0),
+            "last": row.get("last"),
         })
 
-    rem_files = RemediationUpload.query.filter_by(student_id=current_user.id).order_by(RemediationUpload.uploaded_at.desc()).all()
-    return render_template("student_dashboard.html", teacher=teacher, progress=progress, attempts=attempts[:10], rem_files=rem_files)
+    rem_files = RemediationUpload.query.options(joinedload(RemediationUpload.skill)).filter_by(student_id=current_user.id).order_by(RemediationUpload.uploaded_at.desc()).all()
+    weakest = stats.weakest_skills(current_user.id)
+    return render_template("student_dashboard.html", teacher=teacher, progress=progress, attempts=attempts,
+                           rem_files=rem_files, weakest=weakest)
 
 def _weekly_limit_reached(skill_id: int) -> bool:
     now = datetime.utcnow()
@@ -63,17 +72,40 @@ def start(skill_id: int):
         flash("This skill is locked. Your teacher must allow it.", "error")
         return redirect(url_for("student.dashboard"))
 
-    if _weekly_limit_reached(skill_id):
-        flash("Weekly access limit reached (1 attempt per week).", "error")
-        return redirect(url_for("student.dashboard"))
-
     skill = Skill.query.get(skill_id)
     if not skill or not skill.is_active:
         flash("Skill not found.", "error")
         return redirect(url_for("student.dashboard"))
 
-    questions = Question.query.filter_by(skill_id=skill_id).all()
-    if not questions:
+    duration_min = skill.duration_min or current_app.config["DEFAULT_TEST_DURATION_MIN"]
+    bank = get_bank(skill.id, skill.bank_version)
+
+    # A started attempt (browser crash, closed tab) is resumed with its saved
+    # answers while its time lasts, instead of using up another weekly attempt.
+    attempt = autosave.open_attempt(current_user.id, skill_id)
+    if attempt is not None:
+        questions = pools.attempt_questions(attempt, bank)
+        deadline = autosave.deadline_for(attempt, skill)
+        if datetime.utcnow() < deadline:
+            return render_template("test.html", attempt=attempt, skill=skill, duration_min=duration_min,
+                                   questions_html=question_markup(skill.id, bank.version, questions, attempt.seed),
+                                   draft=autosave.draft_for(attempt.id))
+        if autosave.has_draft(attempt.id):
+            _finish(attempt, skill, questions, autosave.draft_form(attempt.id), deadline)
+            db.session.commit()
+            flash("Your last attempt ran out of time; it was submitted with its saved answers.", "error")
+            return redirect(url_for("student.result", attempt_id=attempt.id))
+        # Nothing was saved (abandoned, or started before autosave): close it
+        # without a score, so it feeds no statistics and sends no report.
+        _close_unscored(attempt, deadline)
+        db.session.commit()
+        flash("Your last attempt ran out of time without saved answers; it was closed without a score.", "error")
+
+    if _weekly_limit_reached(skill_id):
+        flash("Weekly access limit reached (1 attempt per week).", "error")
+        return redirect(url_for("student.dashboard"))
+
+    if not bank.questions:
         flash("No questions yet for this skill (admin will add later).", "error")
         return redirect(url_for("student.dashboard"))
 
@@ -87,11 +119,25 @@ def start(skill_id: int):
         iso_week=w,
         started_at=now
     )
+    pools.assign(attempt, skill, bank)
     db.session.add(attempt)
     db.session.commit()
 
-    duration_min = skill.duration_min or current_app.config["DEFAULT_TEST_DURATION_MIN"]
-    return render_template("test.html", attempt=attempt, skill=skill, duration_min=duration_min, questions=questions)
+    questions = pools.attempt_questions(attempt, bank)
+    return render_template("test.html", attempt=attempt, skill=skill, duration_min=duration_min,
+                           questions_html=question_markup(skill.id, bank.version, questions, attempt.seed),
+                           draft={"a": {}, "t": {}, "rev": 0})
+
+@bp.post("/autosave/<int:attempt_id>", endpoint="autosave")
+@login_required
+def autosave_attempt(attempt_id: int):
+    if current_user.role != "student":
+        return jsonify({"error": "Student access only."}), 403
+    try:
+        return jsonify(autosave.save(attempt_id, current_user.id, request.get_json(silent=True, force=True)))
+    except autosave.AutosaveError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), e.status
 
 @bp.post("/submit/<int:attempt_id>")
 @login_required
@@ -107,137 +153,58 @@ def submit(attempt_id: int):
         return redirect(url_for("student.result", attempt_id=attempt.id))
 
     skill = Skill.query.get(attempt.skill_id)
-    questions = Question.query.filter_by(skill_id=attempt.skill_id).all()
-    duration_min = skill.duration_min or current_app.config["DEFAULT_TEST_DURATION_MIN"]
+    # Only the questions this attempt was shown are graded.
+    questions = pools.attempt_questions(attempt, get_bank(skill.id, skill.bank_version))
+    finished_at = min(datetime.utcnow(), autosave.deadline_for(attempt, skill))
+    _finish(attempt, skill, questions, request.form, finished_at)
+    db.session.commit()
 
-    now = datetime.utcnow()
-    max_end = attempt.started_at + timedelta(minutes=duration_min)
-    finished_at = min(now, max_end)
+    return redirect(url_for("student.result", attempt_id=attempt.id))
+
+def _close_unscored(attempt: Attempt, finished_at: datetime) -> None:
+    """Mark an expired attempt finished with no score (score/passed stay NULL). Caller commits."""
+    attempt.finished_at = finished_at
+    attempt.duration_sec = int((finished_at - attempt.started_at).total_seconds())
 
-    answers_payload = []
+def _finish(attempt: Attempt, skill: Skill, questions, form, finished_at: datetime) -> None:
+    """Grade ``form`` (a submitted test, or a draft) into the attempt. Caller commits."""
+    graded = []
     correct, total = 0, 0
 
     for q in questions:
         total += 1
-        key = f"q_{q.id}"
-        raw = request.form.getlist(key) if q.qtype == "mcq_multi" else request.form.get(key)
-
-        try:
-            correct_answer = json.loads(q.answer_json) if q.answer_json else None
-        except Exception:
-            correct_answer = None
-
-        is_correct = False
-
-        if q.qtype in {"mcq_single","true_false","image_mcq_single","video_cued_mcq_single"}:
-            try:
-                is_correct = (raw is not None and correct_answer is not None and int(raw) == int(correct_answer))
-            except Exception:
-                is_correct = False
-            student_disp = raw if raw is not None else "-"
-            correct_disp = str(correct_answer) if correct_answer is not None else "-"
-
-        elif q.qtype == "mcq_multi":
-            try:
-                chosen = sorted([int(x) for x in raw])
-                corr = sorted([int(x) for x in (correct_answer or [])])
-                is_correct = (chosen == corr)
-                student_disp = ",".join(map(str, chosen)) if chosen else "-"
-                correct_disp = ",".join(map(str, corr)) if corr else "-"
-            except Exception:
-                is_correct = False
-                student_disp, correct_disp = "-", "-"
-
-        elif q.qtype == "short_text":
-            target = str(correct_answer or "").strip().lower()
-            given = (raw or "").strip().lower()
-            is_correct = bool(target) and (given == target)
-            student_disp = raw or "-"
-            correct_disp = str(correct_answer or "-")
-
-        else:
-            student_disp = str(raw) if raw is not None else "-"
-            correct_disp = str(correct_answer) if correct_answer is not None else "-"
-            is_correct = False
+        grader = grader_for(q.qtype)
+        response = grader.read(form, f"q_{q.id}")
+        is_correct, _ = grader.grade(response, q.answer)
 
         if is_correct:
             correct += 1
 
-        answers_payload.append({
+        spent = form.get(f"t_{q.id}", "")
+        graded.append({
             "question_id": q.id,
-            "prompt": q.prompt,
-            "qtype": q.qtype,
-            "student_answer": student_disp,
-            "correct_answer": correct_disp,
-            "is_correct": is_correct
+            "response": response,
+            "is_correct": is_correct,
+            "time_spent_sec": int(spent) if spent.isdigit() else None,
         })
 
     score = correct / total if total else 0.0
+    pass_pct = skill.pass_pct or 80
+    passed = score * 100 >= pass_pct
     attempt.finished_at = finished_at
     attempt.duration_sec = int((finished_at - attempt.started_at).total_seconds())
     attempt.score = score
     attempt.correct_count = correct
     attempt.total_count = total
     attempt.passed = passed
-    attempt.answers_json = json.dumps(answers_payload, ensure_ascii=False)
-
-    lacking = _compute_lacking_skills(current_user.id)
-
-    pdf_filename = f"attempt_{attempt.id}.pdf"
-    pdf_abs = os.path.join(current_app.config['REPORTS_DIR'], pdf_filename)
-    teacher = User.query.filter_by(id=attempt.teacher_id, role="teacher").first()
-
-    generate_attempt_pdf(
-        pdf_abs,
-        school_name="Al Thaghr School",
-        student_id=current_user.id,
-        student_name=current_user.name,
-        teacher_name=teacher.name if teacher else "-",
-        skill_name=skill.name if skill else "-",
-        started_at=attempt.started_at,
-        finished_at=attempt.finished_at,
-        duration_sec=attempt.duration_sec,
-        answers=answers_payload,
-        summary={
-            "score_pct": int(round(score*100)),
-            "correct": correct,
-            "total": total,
-            "lacking_skills": lacking,
-            "pass_pct": pass_pct,
-            "pass_fail": "PASS" if passed else "FAIL",
-        }
-    )
-    attempt.pdf_path = pdf_filename
-    db.session.commit()
-
-    # optional email
-    if teacher and teacher.email:
-        try_email_pdf(
-            teacher.email,
-            subject=f"Student test report — {current_user.name} — {skill.name}",
-            body="Attached is the PDF report for the completed test.",
-            pdf_path=pdf_abs
-        )
+    save_answers(attempt.id, graded)
+    autosave.discard(attempt.id)
+    db.session.flush()
+    stats.record_attempt(attempt)
+    item_analysis.record_answers(graded, score)
 
-    return redirect(url_for("student.result", attempt_id=attempt.id))
-
-def _compute_lacking_skills(student_id: str):
-    rows = Attempt.query.filter_by(student_id=student_id).filter(Attempt.finished_at.isnot(None)).all()
-    by_skill = {}
-    for a in rows:
-        by_skill.setdefault(a.skill_id, []).append(a.score or 0)
-    avgs = []
-    for sid, vals in by_skill.items():
-        avg = sum(vals)/len(vals) if vals else 0
-        avgs.append((avg, sid))
-    avgs.sort(key=lambda x: x[0])
-    out = []
-    from ..models import Skill
-    for avg, sid in avgs[:3]:
-        sk = Skill.query.get(sid)
-        if sk:
-            out.append(sk.name)
-    return out
+    # PDF rendering and the teacher e-mail run in the job worker.
+    enqueue_attempt_report(attempt)
 
 @bp.get("/result/<int:attempt_id>")
 @login_required
@@ -250,9 +217,14 @@ def result(attempt_id: int):
         flash("Attempt not found.", "error")
         return redirect(url_for("student.dashboard"))
 
-    answers = json.loads(attempt.answers_json) if attempt.answers_json else []
+    if attempt.finished_at is not None and attempt.score is None:
+        flash("This attempt ran out of time without answers and has no result.", "error")
+        return redirect(url_for("student.dashboard"))
+
+    answers = display_answers(attempt)
     skill = Skill.query.get(attempt.skill_id)
-    return render_template("student_result.html", attempt=attempt, skill=skill, answers=answers)
+    report_job = None if attempt.pdf_path else job_for(report_job_key(attempt.id))
+    return render_template("student_result.html", attempt=attempt, skill=skill, answers=answers, report_job=report_job)
 
 @bp.get("/download_report/<int:attempt_id>")
 @login_required
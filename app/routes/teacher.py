@@ -1,11 +1,20 @@
 from __future__ import annotations
-import os, json
+import json
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-from .. import db
-from ..models import User, Skill, StudentSkill, Attempt, RemediationUpload, Question
+from sqlalchemy.orm import joinedload
+from .. import db, stats, exports, item_analysis
+from ..models import User, Skill, StudentSkill, Attempt, RemediationUpload, Question, MediaAsset
 from ..utils import safe_filename
+from ..bank import bump_bank_version
+from ..question_import import answer_json as parse_answer, import_questions
+from ..grading import regrade_job_key
+from ..jobs import enqueue
+from ..blobs import release, store
+from ..media import delete_asset, link_questions, save_upload, usage_counts
+from ..uploads import add_remediation
+from ..pagination import attempt_filters, attempts_page, questions_page, media_page, page_size, attempt_json, question_json
 
 bp = Blueprint("teacher", __name__)
 
@@ -26,7 +35,7 @@ def _can_unlock_skill_for_student(student_id: str, skill_id: int) -> tuple[bool,
     if not prev:
         return True, ""
 
-    prev_attempt = Attempt.query.filter_by(student_id=student_id, skill_id=prev.id).filter(Attempt.finished_at.isnot(None)).order_by(Attempt.finished_at.desc()).first()
+    prev_attempt = Attempt.query.filter_by(student_id=student_id, skill_id=prev.id).filter(Attempt.finished_at.isnot(None), Attempt.score.isnot(None)).order_by(Attempt.finished_at.desc()).first()
     if not prev_attempt:
         return False, f"Cannot unlock: student hasn't attempted previous skill ({prev.name}) yet."
 
@@ -46,19 +55,10 @@ def dashboard():
     if not _ensure_teacher():
         return redirect(url_for('auth.home'))
 
-    students = User.query.filter_by(role="student", teacher_id=current_user.id).order_by(User.name.asc()).all()
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
-    attempts = Attempt.query.filter_by(teacher_id=current_user.id).filter(Attempt.finished_at.isnot(None)).all()
-    avg_score = round(100 * (sum([a.score or 0 for a in attempts]) / len(attempts)), 2) if attempts else 0.0
-
-    student_rows = []
-    for s in students:
-        s_attempts = [a for a in attempts if a.student_id == s.id]
-        student_rows.append({
-            "student": s,
-            "attempts": len(s_attempts),
-            "avg": round(100 * (sum([a.score or 0 for a in s_attempts]) / len(s_attempts)), 1) if s_attempts else 0
-        })
+    avg_score = stats.teacher_average(current_user.id)
+    student_rows = stats.teacher_student_rows(current_user.id)
+    students = [r["student"] for r in student_rows]
     return render_template("teacher_dashboard.html", students=students, skills=skills, avg_score=avg_score, student_rows=student_rows)
 
 @bp.get("/students/<student_id>")
@@ -74,9 +74,11 @@ def student_detail(student_id: str):
 
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
     perms = {p.skill_id: p for p in StudentSkill.query.filter_by(student_id=student.id).all()}
-    attempts = Attempt.query.filter_by(student_id=student.id, teacher_id=current_user.id).order_by(Attempt.started_at.desc()).all()
-    rem_files = RemediationUpload.query.filter_by(student_id=student.id, teacher_id=current_user.id).order_by(RemediationUpload.uploaded_at.desc()).all()
-    return render_template("teacher_student.html", student=student, skills=skills, perms=perms, attempts=attempts, rem_files=rem_files)
+    attempts = Attempt.query.options(joinedload(Attempt.skill)).filter_by(student_id=student.id, teacher_id=current_user.id).order_by(Attempt.started_at.desc()).all()
+    rem_files = RemediationUpload.query.options(joinedload(RemediationUpload.skill)).filter_by(student_id=student.id, teacher_id=current_user.id).order_by(RemediationUpload.uploaded_at.desc()).all()
+    weakest = stats.weakest_skills(student.id)
+    return render_template("teacher_student.html", student=student, skills=skills, perms=perms, attempts=attempts,
+                           rem_files=rem_files, weakest=weakest)
 
 @bp.post("/students/<student_id>/toggle_skill")
 @login_required
@@ -136,45 +138,45 @@ def upload_remediation(student_id: str):
         return redirect(url_for("teacher.student_detail", student_id=student.id))
 
     safe = safe_filename(f.filename)
-    stored_dir = os.path.join(current_app.config['UPLOADS_DIR'], 'teacher', current_user.id, student.id, str(skill_id))
-    os.makedirs(stored_dir, exist_ok=True)
-    stored_path = os.path.join(stored_dir, safe)
-    f.save(stored_path)
-
-    rel = os.path.relpath(stored_path, current_app.config['UPLOADS_DIR'])
-    up = RemediationUpload(
-        teacher_id=current_user.id,
-        student_id=student.id,
-        skill_id=skill_id,
-        filename=safe,
-        stored_path=rel,
-        note=note or None
-    )
-    db.session.add(up)
+    # Stored once per distinct content: the same worksheet for a whole class is one blob.
+    sha, size = store(f.stream)
+    add_remediation(current_user.id, student.id, skill_id, safe, sha, size, note)
     db.session.commit()
 
     flash("Uploaded successfully.", "ok")
     return redirect(url_for("teacher.student_detail", student_id=student.id))
 
+@bp.post("/students/<student_id>/remediation/<int:upload_id>/delete")
+@login_required
+def delete_remediation(student_id: str, upload_id: int):
+    if not _ensure_teacher():
+        return redirect(url_for('auth.home'))
+    up = RemediationUpload.query.filter_by(id=upload_id, student_id=student_id, teacher_id=current_user.id).first()
+    if not up:
+        flash("File not found.", "error")
+        return redirect(url_for("teacher.student_detail", student_id=student_id))
+    release(up.blob_sha)
+    db.session.delete(up)
+    db.session.commit()
+    flash("File removed.", "ok")
+    return redirect(url_for("teacher.student_detail", student_id=student_id))
+
 
 @bp.get("/media")
 @login_required
 def media_library():
     if not _ensure_teacher():
         return redirect(url_for('auth.home'))
-    import os
-    from flask import current_app
-    media_dir = os.path.join(current_app.config["MEDIA_DIR"], "teacher", current_user.id)
-    os.makedirs(media_dir, exist_ok=True)
-    files = [n for n in sorted(os.listdir(media_dir)) if os.path.isfile(os.path.join(media_dir, n))]
-    return render_template("teacher_media.html", files=files)
+    assets, next_cursor = media_page(current_user.id, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    return render_template("teacher_media.html", assets=assets, next_cursor=next_cursor,
+                           used=usage_counts([a.path for a in assets]),
+                           prefix=f"teacher/{current_user.id}/")
 
 @bp.post("/media/upload")
 @login_required
 def media_upload():
     if not _ensure_teacher():
         return redirect(url_for('auth.home'))
-    import os
     from flask import current_app
     f = request.files.get("file")
     if not f or not f.filename:
@@ -186,11 +188,28 @@ def media_upload():
         return redirect(url_for("teacher.media_library"))
 
     safe = "".join([c if c.isalnum() or c in "._-" else "_" for c in f.filename]).strip("_") or ("media."+ext)
-    media_dir = os.path.join(current_app.config["MEDIA_DIR"], "teacher", current_user.id)
-    os.makedirs(media_dir, exist_ok=True)
-    f.save(os.path.join(media_dir, safe))
+    prefix = f"teacher/{current_user.id}"
+    path = save_upload(f, prefix, safe, current_user.id)
+    db.session.commit()
 
-    flash("Uploaded.", "ok")
+    name = path[len(prefix) + 1:]
+    flash("Uploaded." if name == safe else f"Uploaded as {name} (that name was taken).", "ok")
+    return redirect(url_for("teacher.media_library"))
+
+@bp.post("/media/delete")
+@login_required
+def media_delete():
+    if not _ensure_teacher():
+        return redirect(url_for('auth.home'))
+    asset = MediaAsset.query.filter_by(path=request.form.get("path") or "", owner_id=current_user.id).first()
+    if not asset:
+        flash("File not found.", "error")
+    elif usage_counts([asset.path]):
+        flash("That file is still used by a question.", "error")
+    else:
+        delete_asset(asset)
+        db.session.commit()
+        flash("File removed.", "ok")
     return redirect(url_for("teacher.media_library"))
 
 @bp.get("/reports")
@@ -199,8 +218,38 @@ def reports():
     if not _ensure_teacher():
         return redirect(url_for('auth.home'))
 
-    attempts = Attempt.query.filter_by(teacher_id=current_user.id).filter(Attempt.finished_at.isnot(None)).order_by(Attempt.finished_at.desc()).limit(200).all()
-    return render_template("teacher_reports.html", attempts=attempts)
+    filters = attempt_filters(request.args)
+    filters["teacher_id"] = current_user.id
+    attempts, next_cursor = attempts_page(filters, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    skills = Skill.query.order_by(Skill.order_index.asc()).all()
+    return render_template("teacher_reports.html", attempts=attempts, next_cursor=next_cursor,
+                           filters=filters, skills=skills)
+
+@bp.get("/export/<kind>.<fmt>")
+@login_required
+def export(kind: str, fmt: str):
+    if not _ensure_teacher():
+        return redirect(url_for('auth.home'))
+    if fmt not in exports.FORMATS or kind not in ("attempts", "students"):
+        flash("Unknown export.", "error")
+        return redirect(url_for("teacher.dashboard"))
+
+    if kind == "students":
+        return exports.export_response("students", fmt, exports.ROSTER_HEADER, exports.roster_rows(current_user.id))
+    filters = attempt_filters(request.args)
+    filters["teacher_id"] = current_user.id
+    return exports.export_response("attempts", fmt, exports.ATTEMPT_HEADER, exports.attempt_rows(filters))
+
+@bp.get("/api/reports")
+@login_required
+def api_reports():
+    if current_user.role != "teacher":
+        return jsonify({"error": "Teacher access only."}), 403
+    filters = attempt_filters(request.args)
+    filters["teacher_id"] = current_user.id
+    limit = page_size(request.args, current_app.config["PAGE_SIZE"], current_app.config["API_MAX_PAGE_SIZE"])
+    attempts, next_cursor = attempts_page(filters, request.args.get("cursor"), limit)
+    return jsonify({"items": [attempt_json(a) for a in attempts], "next_cursor": next_cursor})
 
 @bp.get("/download_report/<int:attempt_id>")
 @login_required
@@ -216,8 +265,56 @@ def question_tool():
         return redirect(url_for('auth.home'))
 
     skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
-    questions = Question.query.order_by(Question.id.desc()).limit(200).all()
-    return render_template("question_tool.html", skills=skills, questions=questions, role=current_user.role)
+    filters = attempt_filters(request.args)
+    questions, next_cursor = questions_page(filters, request.args.get("cursor"), current_app.config["PAGE_SIZE"])
+    return render_template("question_tool.html", skills=skills, questions=questions, role=current_user.role,
+                           filters=filters, next_cursor=next_cursor)
+
+@bp.get("/api/questions")
+@login_required
+def api_questions():
+    if current_user.role != "teacher":
+        return jsonify({"error": "Teacher access only."}), 403
+    limit = page_size(request.args, current_app.config["PAGE_SIZE"], current_app.config["API_MAX_PAGE_SIZE"])
+    questions, next_cursor = questions_page(attempt_filters(request.args), request.args.get("cursor"), limit)
+    return jsonify({"items": [question_json(q) for q in questions], "next_cursor": next_cursor})
+
+def _answer_json(qtype: str, answer: str):
+    try:
+        return parse_answer(qtype, answer)
+    except ValueError:
+        return None
+
+def update_answer_key(question_id: int):
+    """Shared by teacher and chairman: fix a question's answer key, then re-grade past attempts."""
+    back = url_for("chairman.question_tool") if current_user.role == "chairman" else url_for("teacher.question_tool")
+    q = Question.query.get(question_id)
+    if not q:
+        flash("Question not found.", "error")
+        return redirect(back)
+
+    answer = (request.form.get("answer") or "").strip()
+    answer_json = _answer_json(q.qtype, answer)
+    if answer_json is None:
+        flash("Invalid answer for this question type.", "error")
+        return redirect(back)
+
+    q.answer_json = answer_json
+    bump_bank_version([q.skill_id])
+    db.session.flush()
+    version = db.session.query(Skill.bank_version).filter(Skill.id == q.skill_id).scalar()
+    enqueue("regrade", {"skill_id": q.skill_id}, key=regrade_job_key(q.skill_id, version))
+    db.session.commit()
+
+    flash("Answer key updated. Past attempts for this skill are being re-graded.", "ok")
+    return redirect(back)
+
+@bp.post("/question_tool/<int:question_id>/answer")
+@login_required
+def fix_answer(question_id: int):
+    if not _ensure_teacher():
+        return redirect(url_for('auth.home'))
+    return update_answer_key(question_id)
 
 @bp.post("/question_tool/add")
 @login_required
@@ -242,17 +339,7 @@ def add_question():
         opts = [x.strip() for x in options.split("\n") if x.strip()]
         options_json = json.dumps(opts, ensure_ascii=False)
 
-    # answer
-    answer_json = None
-    try:
-        if qtype == "mcq_multi":
-            answer_json = json.dumps([int(x.strip()) for x in answer.split(",") if x.strip()], ensure_ascii=False)
-        elif qtype == "short_text":
-            answer_json = json.dumps(answer, ensure_ascii=False)
-        else:
-            answer_json = json.dumps(int(answer), ensure_ascii=False) if answer != "" else None
-    except Exception:
-        answer_json = None
+    answer_json = _answer_json(qtype, answer)
 
     # meta
     meta_json = None
@@ -264,11 +351,27 @@ def add_question():
 
     q = Question(skill_id=skill_id, qtype=qtype, prompt=prompt, options_json=options_json, answer_json=answer_json, meta_json=meta_json)
     db.session.add(q)
+    bump_bank_version([skill_id])
+    if meta_json:
+        db.session.flush()
+        link_questions([q.id])
     db.session.commit()
 
     flash("Question added.", "ok")
     return redirect(url_for("teacher.question_tool"))
 
+@bp.get("/item_analysis")
+@login_required
+def item_analysis_view():
+    if not _ensure_teacher():
+        return redirect(url_for('auth.home'))
+    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
+    skill_id = request.args.get("skill_id", type=int) or (skills[0].id if skills else None)
+    min_answers = max(1, request.args.get("min_answers", 1, type=int))
+    items = item_analysis.item_report(skill_id, min_answers) if skill_id else []
+    return render_template("item_analysis.html", skills=skills, skill_id=skill_id, min_answers=min_answers,
+                           items=items, role=current_user.role)
+
 @bp.get("/question_import")
 @login_required
 def question_import():
@@ -283,11 +386,6 @@ def question_import_upload():
     if not _ensure_teacher():
         return redirect(url_for("auth.home"))
 
-    import io
-    import csv
-    import json
-    from openpyxl import load_workbook
-
     f = request.files.get("file")
     default_skill_id = int(request.form.get("default_skill_id") or "0") or None
 
@@ -295,78 +393,13 @@ def question_import_upload():
         flash("Upload a CSV/XLSX file.", "error")
         return redirect(url_for("teacher.question_import"))
 
-    name = f.filename.lower()
-    rows = []
-
-    if name.endswith(".csv"):
-        content = f.read().decode("utf-8-sig")
-        reader = csv.DictReader(io.StringIO(content))
-        rows = list(reader)
-    elif name.endswith(".xlsx"):
-        wb = load_workbook(f, data_only=True)
-        ws = wb.active
-        headers = [str(c.value).strip() if c.value is not None else "" for c in next(ws.iter_rows(min_row=1, max_row=1))]
-        for r in ws.iter_rows(min_row=2, values_only=True):
-            d = {headers[i]: (r[i] if i < len(r) else None) for i in range(len(headers))}
-            rows.append(d)
-    else:
-        flash("Only .csv or .xlsx supported.", "error")
+    try:
+        report = import_questions(f, f.filename, default_skill_id=default_skill_id)
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "error")
         return redirect(url_for("teacher.question_import"))
 
-    created = 0
-    skipped = 0
-
-    for row in rows:
-        skill_id = row.get("skill_id")
-        skill_name = row.get("skill_name")
-        qtype = (row.get("qtype") or "").strip()
-        prompt = (row.get("prompt") or "").strip()
-        if not prompt or not qtype:
-            skipped += 1
-            continue
-
-        sid = None
-        try:
-            sid = int(skill_id) if skill_id not in (None, "", "None") else None
-        except Exception:
-            sid = None
-        if sid is None and default_skill_id:
-            sid = default_skill_id
-        if sid is None and skill_name:
-            sk = Skill.query.filter_by(name=str(skill_name).strip()).first()
-            sid = sk.id if sk else None
-        if sid is None:
-            skipped += 1
-            continue
-
-        options_raw = (row.get("options") or "").strip()
-        options_json = None
-        if options_raw:
-            opts = [x.strip() for x in str(options_raw).split("|") if x.strip()]
-            options_json = json.dumps(opts, ensure_ascii=False)
-
-        ans_raw = row.get("answer")
-        answer_json = None
-        try:
-            if qtype == "mcq_multi":
-                answer_json = json.dumps([int(x.strip()) for x in str(ans_raw).split(",") if x.strip()], ensure_ascii=False)
-            elif qtype == "short_text":
-                answer_json = json.dumps(str(ans_raw or ""), ensure_ascii=False)
-            else:
-                answer_json = json.dumps(int(ans_raw), ensure_ascii=False) if ans_raw not in (None, "", "None") else None
-        except Exception:
-            answer_json = json.dumps(str(ans_raw or ""), ensure_ascii=False) if qtype == "short_text" else None
-
-        meta = (row.get("meta_json") or row.get("meta") or "")
-        meta_json = None
-        if meta not in (None, "", "None"):
-            m = str(meta).strip()
-            meta_json = m if (m.startswith("{") or m.startswith("[")) else json.dumps(m, ensure_ascii=False)
-
-        q = Question(skill_id=sid, qtype=qtype, prompt=prompt, options_json=options_json, answer_json=answer_json, meta_json=meta_json)
-        db.session.add(q)
-        created += 1
-
-    db.session.commit()
-    flash(f"Imported. Created: {created}, Skipped: {skipped}.", "ok")
-    return redirect(url_for("teacher.question_tool"))
+    flash(f"Imported. Created: {report['created']}, Skipped: {report['skipped']}.", "ok")
+    skills = Skill.query.filter_by(is_active=True).order_by(Skill.order_index.asc()).all()
+    return render_template("teacher_question_import.html", skills=skills, report=report)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from flask import Blueprint, current_app, flash, jsonify, request, url_for
+from flask_login import login_required, current_user
+from .. import db, uploads
+from ..models import UploadSession
+from ..uploads import UploadError
+
+# JSON endpoints of the resumable upload protocol; see app/uploads.py.
+bp = Blueprint("uploads", __name__)
+
+@bp.errorhandler(UploadError)
+def _upload_error(e: UploadError):
+    db.session.rollback()
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return jsonify(body), e.status
+
+def _session(session_id: str) -> UploadSession:
+    sess = db.session.get(UploadSession, session_id)
+    if sess is None or sess.user_id != current_user.id:
+        raise UploadError("Upload not found.", 404)
+    return sess
+
+def _state(sess: UploadSession, offset: int):
+    return jsonify({"id": sess.id, "offset": offset, "size": sess.size,
+                    "chunk_size": current_app.config["UPLOAD_CHUNK_BYTES"]})
+
+@bp.post("")
+@login_required
+def init():
+    sess = uploads.start(current_user, request.get_json(silent=True) or {})
+    db.session.commit()
+    return _state(sess, 0), 201
+
+@bp.get("/<session_id>")
+@login_required
+def status(session_id: str):
+    sess = _session(session_id)
+    return _state(sess, uploads.offset_of(sess))
+
+@bp.put("/<session_id>")
+@login_required
+def chunk(session_id: str):
+    sess = _session(session_id)
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        raise UploadError("offset is required.")
+    received = uploads.append(sess, offset, request.stream, request.headers.get("X-Chunk-SHA256"))
+    db.session.commit()
+    return jsonify({"offset": received})
+
+@bp.post("/<session_id>/finalize")
+@login_required
+def finalize(session_id: str):
+    sess = _session(session_id)
+    kind, result = uploads.finalize(sess)
+    db.session.commit()
+    if kind == "remediation":
+        flash("Uploaded successfully.", "ok")
+        return jsonify({"redirect": url_for("teacher.student_detail", student_id=result.student_id)})
+    flash(f"Uploaded as {result}.", "ok")
+    library = "teacher.media_library" if current_user.role == "teacher" else "chairman.media_library"
+    return jsonify({"redirect": url_for(library)})
+
+@bp.delete("/<session_id>")
+@login_required
+def cancel(session_id: str):
+    uploads.discard(_session(session_id))
+    db.session.commit()
+    return "", 204
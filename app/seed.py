@@ -1,7 +1,7 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash
 from . import db
 from .models import User, Skill, StudentSkill
+from .pins import hash_pin
 
 def ensure_seed_data():
     # chairman
@@ -10,7 +10,7 @@ def ensure_seed_data():
             id="chairman",
             role="chairman",
             name="School Chairman",
-            pin_hash=generate_password_hash("1234"),
+            pin_hash=hash_pin("1234"),
         ))
 
     # teacher
@@ -20,7 +20,7 @@ def ensure_seed_data():
             role="teacher",
             name="Teacher A",
             email="teacherA@example.com",
-            pin_hash=generate_password_hash("1234"),
+            pin_hash=hash_pin("1234"),
         ))
 
     # student
@@ -30,7 +30,7 @@ def ensure_seed_data():
             role="student",
             name="Student One",
             teacher_id="t001",
-            pin_hash=generate_password_hash("1234"),
+            pin_hash=hash_pin("1234"),
         ))
 
     if Skill.query.count() == 0:
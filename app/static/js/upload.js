@@ -0,0 +1,91 @@
+// Resumable uploads for <form data-resumable="remediation|media"> (protocol in app/uploads.py).
+// Files up to one chunk still go through the normal form post. Larger ones are
+// sent in chunks; after a dropped connection or a reload, choosing the same
+// file again continues from the last chunk the server has.
+(function () {
+  "use strict";
+
+  function sleep(ms) { return new Promise(function (r) { setTimeout(r, ms); }); }
+
+  async function api(method, url, body, headers) {
+    var resp = await fetch(url, { method: method, body: body, headers: headers || {}, credentials: "same-origin" });
+    var data = resp.status === 204 ? {} : await resp.json().catch(function () { return {}; });
+    if (!resp.ok) {
+      var err = new Error(data.error || ("Upload failed (" + resp.status + ")."));
+      err.status = resp.status;
+      err.offset = data.offset;
+      throw err;
+    }
+    return data;
+  }
+
+  async function sha256Hex(buf) {
+    if (!window.crypto || !crypto.subtle) return null; // plain-http deployments: no checksum header
+    var digest = new Uint8Array(await crypto.subtle.digest("SHA-256", buf));
+    return Array.prototype.map.call(digest, function (b) { return b.toString(16).padStart(2, "0"); }).join("");
+  }
+
+  async function upload(form, file, show) {
+    var base = form.dataset.uploadUrl;
+    var key = "upload:" + form.dataset.resumable + ":" + file.name + ":" + file.size + ":" + file.lastModified;
+    var id = localStorage.getItem(key), offset = 0, chunk = 0;
+
+    if (id) {
+      try {
+        var s = await api("GET", base + "/" + id);
+        offset = s.offset; chunk = s.chunk_size;
+      } catch (e) { id = null; }
+    }
+    if (!id) {
+      var fields = {};
+      new FormData(form).forEach(function (v, k) { if (typeof v === "string") fields[k] = v; });
+      fields.purpose = form.dataset.resumable;
+      fields.filename = file.name;
+      fields.size = file.size;
+      var created = await api("POST", base, JSON.stringify(fields), { "Content-Type": "application/json" });
+      id = created.id; offset = created.offset; chunk = created.chunk_size;
+      localStorage.setItem(key, id);
+    }
+
+    var failures = 0;
+    while (offset < file.size) {
+      show(Math.floor(offset * 100 / file.size) + "% uploaded…");
+      var buf = await file.slice(offset, offset + chunk).arrayBuffer();
+      var headers = { "Content-Type": "application/octet-stream" };
+      var sum = await sha256Hex(buf);
+      if (sum) headers["X-Chunk-SHA256"] = sum;
+      try {
+        offset = (await api("PUT", base + "/" + id + "?offset=" + offset, buf, headers)).offset;
+        failures = 0;
+      } catch (e) {
+        if (e.offset !== undefined && (e.status === 409 || e.status === 422)) { offset = e.offset; continue; }
+        if (e.status === 410) localStorage.removeItem(key);
+        if ((e.status && e.status < 500) || ++failures > 8) throw e;
+        show("Connection lost, retrying…");
+        await sleep(Math.min(30000, 1000 * Math.pow(2, failures)));
+      }
+    }
+    show("Saving…");
+    var done = await api("POST", base + "/" + id + "/finalize");
+    localStorage.removeItem(key);
+    location.href = done.redirect;
+  }
+
+  document.querySelectorAll("form[data-resumable]").forEach(function (form) {
+    var status = document.createElement("div");
+    status.className = "muted";
+    form.appendChild(status);
+    form.addEventListener("submit", function (ev) {
+      var input = form.querySelector("input[type=file]");
+      var file = input && input.files[0];
+      if (!file || file.size <= Number(form.dataset.chunkSize || 0)) return;
+      ev.preventDefault();
+      var button = form.querySelector("button[type=submit]");
+      if (button) button.disabled = true;
+      upload(form, file, function (msg) { status.textContent = msg; }).catch(function (e) {
+        status.textContent = e.message;
+        if (button) button.disabled = false;
+      });
+    });
+  });
+})();
@@ -0,0 +1,238 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, case, func, insert, or_, select, update
+
+from . import db
+from .models import User, Skill, Attempt, StudentSkillStat, TeacherSkillStat, TeacherStudentStat, SkillWeekStat
+
+# (rollup model, attempt columns forming its key)
+ROLLUPS = (
+    (StudentSkillStat, ("student_id", "skill_id")),
+    (TeacherSkillStat, ("teacher_id", "skill_id")),
+    (TeacherStudentStat, ("teacher_id", "student_id")),
+    (SkillWeekStat, ("skill_id", "iso_year", "iso_week")),
+)
+
+def _upsert(table):
+    if db.engine.url.get_backend_name() == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert(table)
+
+def _bump(model, key: Dict[str, Any], score: float, passed: bool, finished_at) -> None:
+    t = model.__table__
+    stmt = _upsert(t).values(
+        **key,
+        attempts=1,
+        score_sum=score,
+        best_score=score,
+        last_score=score,
+        last_passed=passed,
+        last_at=finished_at,
+        passed_count=1 if passed else 0,
+        failed_count=0 if passed else 1,
+    )
+    new = stmt.excluded
+    newer = or_(t.c.last_at.is_(None), t.c.last_at <= new.last_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={
+            "attempts": t.c.attempts + 1,
+            "score_sum": t.c.score_sum + new.score_sum,
+            "best_score": case(
+                (or_(t.c.best_score.is_(None), t.c.best_score < new.best_score), new.best_score),
+                else_=t.c.best_score,
+            ),
+            "last_score": case((newer, new.last_score), else_=t.c.last_score),
+            "last_passed": case((newer, new.last_passed), else_=t.c.last_passed),
+            "last_at": case((newer, new.last_at), else_=t.c.last_at),
+            "passed_count": t.c.passed_count + new.passed_count,
+            "failed_count": t.c.failed_count + new.failed_count,
+        },
+    )
+    db.session.execute(stmt)
+
+def record_attempt(attempt: Attempt) -> None:
+    """Fold one finished attempt into every rollup. Runs in the caller's transaction."""
+    score = attempt.score or 0.0
+    passed = bool(attempt.passed)
+    for model, cols in ROLLUPS:
+        key = {c: getattr(attempt, c) for c in cols}
+        _bump(model, key, score, passed, attempt.finished_at)
+
+def regrade_rollups(changes: List[Dict[str, Any]]) -> None:
+    """Move re-scored attempts from their old to their new score in every rollup.
+
+    Each change carries the attempt's key columns, finished_at, old/new score and passed.
+    Applied as deltas so attempts submitted meanwhile are kept; must run after the
+    attempt rows themselves are updated (best_score falls back to a MAX over them).
+    Runs in the caller's transaction.
+    """
+    if not changes:
+        return
+    for model, cols in ROLLUPS:
+        t = model.__table__
+        old, new, dp = bindparam("b_old"), bindparam("b_new"), bindparam("b_dp")
+        best = (
+            select(func.max(Attempt.score))
+            .where(*(getattr(Attempt, c) == bindparam(f"k_{c}") for c in cols),
+                   Attempt.finished_at.isnot(None), Attempt.score.isnot(None))
+            .scalar_subquery()
+        )
+        latest = t.c.last_at == bindparam("b_at")
+        stmt = (
+            update(t)
+            .where(*(t.c[c] == bindparam(f"k_{c}") for c in cols))
+            .values(
+                score_sum=t.c.score_sum + new - old,
+                best_score=case(
+                    (or_(t.c.best_score.is_(None), t.c.best_score <= new), new),
+                    (t.c.best_score == old, best),
+                    else_=t.c.best_score,
+                ),
+                last_score=case((latest, new), else_=t.c.last_score),
+                last_passed=case((latest, bindparam("b_passed")), else_=t.c.last_passed),
+                passed_count=t.c.passed_count + dp,
+                failed_count=t.c.failed_count - dp,
+            )
+        )
+        db.session.execute(stmt, [
+            {**{f"k_{c}": ch[c] for c in cols}, "b_at": ch["finished_at"], "b_old": ch["old_score"],
+             "b_new": ch["score"], "b_passed": ch["passed"],
+             "b_dp": int(ch["passed"]) - int(ch["old_passed"])}
+            for ch in changes
+        ])
+
+def rebuild_rollups(batch_size: int = 1000) -> int:
+    """Recompute every rollup table from the attempt history. Returns attempts scanned."""
+    acc: List[Dict[tuple, Dict[str, Any]]] = [{} for _ in ROLLUPS]
+    scanned = 0
+
+    q = (
+        db.session.query(
+            Attempt.student_id, Attempt.teacher_id, Attempt.skill_id,
+            Attempt.iso_year, Attempt.iso_week,
+            Attempt.score, Attempt.passed, Attempt.finished_at,
+        )
+        .filter(Attempt.finished_at.isnot(None), Attempt.score.isnot(None))  # NULL score: expired unanswered
+        .order_by(Attempt.finished_at.asc(), Attempt.id.asc())
+        .yield_per(batch_size)
+    )
+    for row in q:
+        scanned += 1
+        score = row.score or 0.0
+        passed = bool(row.passed)
+        for (model, cols), rows in zip(ROLLUPS, acc):
+            key = tuple(getattr(row, c) for c in cols)
+            r = rows.get(key)
+            if r is None:
+                r = rows[key] = dict(zip(cols, key), attempts=0, score_sum=0.0, best_score=None,
+                                     passed_count=0, failed_count=0)
+            r["attempts"] += 1
+            r["score_sum"] += score
+            r["best_score"] = score if r["best_score"] is None else max(r["best_score"], score)
+            r["last_score"], r["last_passed"], r["last_at"] = score, passed, row.finished_at
+            r["passed_count" if passed else "failed_count"] += 1
+
+    for (model, _cols), rows in zip(ROLLUPS, acc):
+        db.session.query(model).delete(synchronize_session=False)
+        _insert_batches(model, rows.values(), batch_size)
+    db.session.commit()
+    return scanned
+
+def _insert_batches(model, rows: Iterable[Dict[str, Any]], batch_size: int) -> None:
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+def _pct(score_sum: Optional[float], attempts: Optional[int], ndigits: int) -> float:
+    return round(100 * (score_sum or 0) / attempts, ndigits) if attempts else 0.0
+
+def _totals_by(model, key_col, *filters):
+    """Subquery: (key, attempts, score_sum) summed over the small rollup rows."""
+    return (
+        db.session.query(
+            key_col.label("key"),
+            func.sum(model.attempts).label("attempts"),
+            func.sum(model.score_sum).label("score_sum"),
+        )
+        .filter(*filters)
+        .group_by(key_col)
+        .subquery()
+    )
+
+def teacher_performance() -> List[Dict[str, Any]]:
+    agg = _totals_by(TeacherSkillStat, TeacherSkillStat.teacher_id)
+    rows = (
+        db.session.query(User, agg.c.attempts, agg.c.score_sum)
+        .outerjoin(agg, agg.c.key == User.id)
+        .filter(User.role == "teacher")
+        .all()
+    )
+    perf = [{"teacher": t, "attempts": n or 0, "avg": _pct(total, n, 2)} for t, n, total in rows]
+    perf.sort(key=lambda x: x["avg"], reverse=True)
+    return perf
+
+def students_needing_attention(limit: int = 10) -> List[Dict[str, Any]]:
+    agg = _totals_by(StudentSkillStat, StudentSkillStat.student_id)
+    avg_col = func.coalesce(agg.c.score_sum / func.nullif(agg.c.attempts, 0), 0)
+    rows = (
+        db.session.query(User, agg.c.attempts, agg.c.score_sum)
+        .outerjoin(agg, agg.c.key == User.id)
+        .filter(User.role == "student")
+        .order_by(avg_col.asc(), User.id.asc())
+        .limit(limit)
+        .all()
+    )
+    return [{"student": s, "attempts": n or 0, "avg": _pct(total, n, 2)} for s, n, total in rows]
+
+def teacher_average(teacher_id: str) -> float:
+    n, total = (
+        db.session.query(func.sum(TeacherSkillStat.attempts), func.sum(TeacherSkillStat.score_sum))
+        .filter(TeacherSkillStat.teacher_id == teacher_id)
+        .one()
+    )
+    return _pct(total, n, 2)
+
+def teacher_student_rows(teacher_id: str) -> List[Dict[str, Any]]:
+    """The teacher's students with totals over the attempts taken with this teacher."""
+    rows = (
+        db.session.query(User, TeacherStudentStat.attempts, TeacherStudentStat.score_sum)
+        .outerjoin(TeacherStudentStat, (TeacherStudentStat.student_id == User.id)
+                   & (TeacherStudentStat.teacher_id == teacher_id))
+        .filter(User.role == "student", User.teacher_id == teacher_id)
+        .order_by(User.name.asc())
+        .all()
+    )
+    return [
+        {"student": s, "attempts": n or 0, "avg": _pct(total, n, 1) if n else 0}
+        for s, n, total in rows
+    ]
+
+def student_skill_progress(student_id: str) -> Dict[int, Dict[str, Any]]:
+    """Per-skill (times, best %, last finished_at) for one student, keyed by skill id."""
+    rows = StudentSkillStat.query.filter_by(student_id=student_id).all()
+    return {
+        r.skill_id: {"times": r.attempts, "best": int(round((r.best_score or 0) * 100)), "last": r.last_at}
+        for r in rows
+    }
+
+def weakest_skills(student_id: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """A student's lowest-average skills: one query on the (student_id, skill_id) rollup key."""
+    avg = StudentSkillStat.score_sum / StudentSkillStat.attempts
+    rows = (
+        db.session.query(Skill, StudentSkillStat.attempts, avg)
+        .join(StudentSkillStat, StudentSkillStat.skill_id == Skill.id)
+        .filter(StudentSkillStat.student_id == student_id, StudentSkillStat.attempts > 0)
+        .order_by(avg.asc(), Skill.order_index.asc())
+        .limit(limit)
+        .all()
+    )
+    return [{"skill": sk, "attempts": n, "avg": round(100 * (a or 0), 1)} for sk, n, a in rows]
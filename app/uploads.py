@@ -0,0 +1,221 @@
+from __future__ import annotations
+import hashlib, json, mimetypes, os, time, uuid
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .blobs import CHUNK, adopt, blob_relpath, retain
+from .jobs import enqueue, handler
+from .media import add_upload
+from .models import RemediationUpload, Skill, UploadSession, User
+from .utils import locked, safe_filename
+
+# Resumable uploads for files too big for one request over a school uplink:
+#   POST   /uploads                {purpose, filename, size, ...}    -> {id, offset, chunk_size}
+#   GET    /uploads/<id>                                              -> {offset, size, chunk_size}
+#   PUT    /uploads/<id>?offset=N  raw bytes, optional X-Chunk-SHA256 -> {offset}
+#   POST   /uploads/<id>/finalize                                     -> {redirect}
+#   DELETE /uploads/<id>
+# Chunks are appended to BLOBS_DIR/parts/<id>.part; the file's size is the
+# resume offset. Finalize hashes it into the blob store and files it exactly
+# like the one-shot form posts. Sessions idle for UPLOAD_SESSION_TTL_SEC are
+# removed by the upload_sweep job and `flask clean-uploads`.
+
+class UploadError(ValueError):
+    """Rejected upload step; ``status`` is the HTTP status, ``offset`` the resume point if known."""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+def add_remediation(teacher_id: str, student_id: str, skill_id: int, filename: str,
+                    sha: str, size: int, note: Optional[str] = None) -> RemediationUpload:
+    """RemediationUpload for content already in the blob store. Caller commits."""
+    retain(sha, size, mimetypes.guess_type(filename)[0])
+    up = RemediationUpload(teacher_id=teacher_id, student_id=student_id, skill_id=skill_id,
+                           filename=filename, stored_path=blob_relpath(sha), blob_sha=sha, note=note or None)
+    db.session.add(up)
+    return up
+
+def part_path(session_id: str) -> str:
+    return os.path.join(current_app.config["BLOBS_DIR"], "parts", f"{session_id}.part")
+
+def _ext(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+def _target(user, purpose: str, filename: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Check the same things the form posts check; -> params stored on the session."""
+    if purpose == "remediation":
+        if user.role != "teacher":
+            raise UploadError("Teacher access only.", 403)
+        student = User.query.filter_by(id=str(data.get("student_id") or ""), role="student",
+                                       teacher_id=user.id).first()
+        if not student:
+            raise UploadError("Student not found.", 404)
+        skill_id = int(data["skill_id"]) if str(data.get("skill_id") or "").isdigit() else 0
+        if not Skill.query.get(skill_id):
+            raise UploadError("Skill not found.", 404)
+        if _ext(filename) not in current_app.config["ALLOWED_UPLOAD_EXT"]:
+            raise UploadError("File type not allowed.", 415)
+        return {"student_id": student.id, "skill_id": skill_id, "note": (data.get("note") or "").strip()}
+    if purpose == "media":
+        if user.role not in ("teacher", "chairman"):
+            raise UploadError("Teacher access only.", 403)
+        if _ext(filename) not in current_app.config["MEDIA_ALLOWED_EXT"]:
+            raise UploadError("Media type not allowed.", 415)
+        return {"folder": f"teacher/{user.id}" if user.role == "teacher" else ""}
+    raise UploadError("Unknown upload purpose.")
+
+def start(user, data: Dict[str, Any]) -> UploadSession:
+    """Open a session from the init request's JSON. Caller commits."""
+    purpose = data.get("purpose")
+    filename = safe_filename(str(data.get("filename") or ""))
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        raise UploadError("File size is required.")
+    if size <= 0:
+        raise UploadError("The file is empty.")
+    if size > current_app.config["UPLOAD_MAX_BYTES"]:
+        limit = current_app.config["UPLOAD_MAX_BYTES"] // (1024 * 1024)
+        raise UploadError(f"Files are limited to {limit} MB.", 413)
+    params = _target(user, purpose, filename, data)
+
+    sess = UploadSession(id=uuid.uuid4().hex, user_id=user.id, purpose=purpose, filename=filename,
+                         size=size, received=0, params_json=json.dumps(params, ensure_ascii=False))
+    path = part_path(sess.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    db.session.add(sess)
+    # One sweep per hour that saw uploads, running once the TTL has passed.
+    ttl = current_app.config["UPLOAD_SESSION_TTL_SEC"]
+    enqueue("upload_sweep", {}, key=f"upload_sweep:{datetime.utcnow():%Y%m%d%H}", delay_sec=ttl + 3600)
+    return sess
+
+def offset_of(sess: UploadSession) -> int:
+    try:
+        return os.path.getsize(part_path(sess.id))
+    except FileNotFoundError:
+        raise UploadError("This upload has expired; start again.", 410)
+
+def append(sess: UploadSession, offset: int, stream: BinaryIO, checksum: Optional[str] = None) -> int:
+    """Write one chunk at ``offset`` (must equal the bytes received so far). Caller commits."""
+    try:
+        out = open(part_path(sess.id), "r+b")
+    except FileNotFoundError:
+        raise UploadError("This upload has expired; start again.", 410)
+    # A retried PUT of the same chunk waits here, then finds the offset taken.
+    with out, locked(out):
+        have = out.seek(0, os.SEEK_END)
+        if offset != have:
+            raise UploadError("Offset does not match the bytes received.", 409, offset=have)
+        limit = min(current_app.config["UPLOAD_CHUNK_BYTES"], sess.size - have)
+        h, n = hashlib.sha256(), 0
+        while True:
+            buf = stream.read(CHUNK)
+            if not buf:
+                break
+            n += len(buf)
+            if n > limit:
+                out.truncate(have)
+                raise UploadError("Chunk is larger than allowed.", 413, offset=have)
+            h.update(buf)
+            out.write(buf)
+        if checksum and h.hexdigest() != checksum.strip().lower():
+            out.truncate(have)
+            raise UploadError("Chunk checksum does not match; resend it.", 422, offset=have)
+    sess.received = have + n
+    sess.updated_at = datetime.utcnow()
+    return sess.received
+
+def finalize(sess: UploadSession) -> Tuple[str, Any]:
+    """Move the finished file into the blob store and file it. -> ("remediation", RemediationUpload)
+    or ("media", library path). Caller commits. Finalizing again returns what was filed the first time."""
+    if sess.result_json:
+        return _filed(sess)
+    path = part_path(sess.id)
+    h = hashlib.sha256()
+    try:
+        have = os.path.getsize(path)
+        if have != sess.size:
+            raise UploadError("The upload is not complete.", 409, offset=have)
+        with open(path, "rb") as fh:
+            for buf in iter(lambda: fh.read(CHUNK), b""):
+                h.update(buf)
+    except FileNotFoundError:
+        have = None  # a concurrent finalize adopted it; the claim below waits for its result
+
+    # Claim the session in the filing transaction: a second finalize blocks here
+    # until the first commits, then finds the row already claimed.
+    claimed = db.session.execute(
+        update(UploadSession).where(UploadSession.id == sess.id, UploadSession.result_json.is_(None))
+        .values(result_json="{}", updated_at=datetime.utcnow())
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        sess = db.session.get(UploadSession, sess.id)
+        if sess is None or not sess.result_json or sess.result_json == "{}":
+            raise UploadError("This upload has expired; start again.", 410)
+        return _filed(sess)
+    if have is None:
+        raise UploadError("This upload has expired; start again.", 410)
+    sha = h.hexdigest()
+    adopt(path, sha)
+
+    params = json.loads(sess.params_json or "{}")
+    if sess.purpose == "remediation":
+        up = add_remediation(sess.user_id, params["student_id"], params["skill_id"], sess.filename,
+                             sha, have, params.get("note"))
+        db.session.flush()
+        filed: Dict[str, Any] = {"remediation": up.id}
+        result: Tuple[str, Any] = ("remediation", up)
+    else:
+        library_path = add_upload(sha, have, params["folder"], sess.filename, sess.user_id)
+        filed = {"media": library_path}
+        result = ("media", library_path)
+    db.session.execute(update(UploadSession).where(UploadSession.id == sess.id)
+                       .values(result_json=json.dumps(filed, ensure_ascii=False)))
+    return result
+
+def _filed(sess: UploadSession) -> Tuple[str, Any]:
+    filed = json.loads(sess.result_json)
+    if "remediation" in filed:
+        up = db.session.get(RemediationUpload, filed["remediation"])
+        if up is None:
+            raise UploadError("The uploaded file was removed.", 410)
+        return "remediation", up
+    return "media", filed["media"]
+
+def discard(sess: UploadSession) -> None:
+    try:
+        os.remove(part_path(sess.id))
+    except FileNotFoundError:
+        pass
+    db.session.delete(sess)
+
+def expire_sessions(ttl_sec: Optional[int] = None) -> int:
+    """Drop sessions idle for longer than UPLOAD_SESSION_TTL_SEC, and part files without a session."""
+    ttl = current_app.config["UPLOAD_SESSION_TTL_SEC"] if ttl_sec is None else ttl_sec
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for sess in stale:
+        discard(sess)
+    db.session.commit()
+
+    parts = os.path.join(current_app.config["BLOBS_DIR"], "parts")
+    live = {sid for (sid,) in db.session.query(UploadSession.id)}
+    orphans = 0
+    if os.path.isdir(parts):
+        for e in os.scandir(parts):
+            if e.name[:-len(".part")] not in live and e.stat().st_mtime < time.time() - ttl:
+                os.remove(e.path)
+                orphans += 1
+    return len(stale) + orphans
+
+@handler("upload_sweep")
+def upload_sweep_job(payload: Dict[str, Any]):
+    return {"removed": expire_sessions()}
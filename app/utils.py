@@ -1,11 +1,10 @@
 from __future__ import annotations
-import os, re, smtplib
+import os, re
+from contextlib import contextmanager
 from datetime import datetime
-from email.message import EmailMessage
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import IO, Any, Dict, Iterator, List, Tuple
 
-from flask import current_app
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
@@ -17,6 +16,25 @@ def safe_filename(name: str) -> str:
     name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
     return name or "file"
 
+@contextmanager
+def locked(fh: IO) -> Iterator[None]:
+    """Exclusive lock on an open file for the block, across processes (fcntl; msvcrt on Windows)."""
+    if os.name == "nt":
+        import msvcrt
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fh, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        if os.name == "nt":
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
 def _wrap(s: str, width: int) -> List[str]:
     words = s.split()
     out, line, n = [], [], 0
@@ -86,26 +104,3 @@ def generate_attempt_pdf(
             c.showPage(); y = height - 60; c.setFont("Helvetica", 10)
 
     c.save()
-
-def try_email_pdf(to_email: str, subject: str, body: str, pdf_path: str) -> bool:
-    cfg = current_app.config
-    if not (cfg.get("SMTP_HOST") and cfg.get("SMTP_USER") and cfg.get("SMTP_PASS") and cfg.get("SMTP_FROM")):
-        return False
-
-    msg = EmailMessage()
-    msg["From"] = cfg["SMTP_FROM"]
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.set_content(body)
-
-    with open(pdf_path, "rb") as f:
-        data = f.read()
-    msg.add_attachment(data, maintype="application", subtype="pdf", filename=os.path.basename(pdf_path))
-
-    server = smtplib.SMTP(cfg["SMTP_HOST"], cfg.get("SMTP_PORT", 587))
-    if cfg.get("SMTP_TLS", True):
-        server.starttls()
-    server.login(cfg["SMTP_USER"], cfg["SMTP_PASS"])
-    server.send_message(msg)
-    server.quit()
-    return True
@@ -0,0 +1,15 @@
+"""Job worker entry point: ``python -m app.worker [--burst]``."""
+from __future__ import annotations
+import sys
+
+from . import create_app
+from .jobs import run_worker
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    app = create_app()
+    app.logger.info("Job worker started")
+    run_worker(app, burst="--burst" in argv)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 import os
 bind = f"0.0.0.0:{os.environ.get('PORT','10000')}"
 workers = int(os.environ.get('WEB_CONCURRENCY','2'))
-threads = int(os.environ.get('GUNICORN_THREADS','1'))
+# threads > 1 selects the gthread worker, whose heartbeat keeps running while a
+# thread streams a long CSV/XLSX export (a sync worker is killed after `timeout`).
+threads = int(os.environ.get('GUNICORN_THREADS','4'))
 timeout = int(os.environ.get('GUNICORN_TIMEOUT','120'))
+
+def post_worker_init(worker):
+    # One background job thread per web worker unless JOBS_EMBEDDED_WORKER=0
+    # (then run `python -m app.worker` as its own process).
+    from app.jobs import start_embedded_worker
+    start_embedded_worker(worker.wsgi)
@@ -1,5 +1,7 @@
 from app import create_app
+from app.jobs import start_embedded_worker
 app = create_app()
 
 if __name__ == "__main__":
+    start_embedded_worker(app)
     app.run(debug=True)
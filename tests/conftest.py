@@ -0,0 +1,89 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config  # noqa: E402
+
+STORAGE_SUBDIRS = {"REPORTS_DIR": "reports", "UPLOADS_DIR": "uploads", "MEDIA_DIR": "media",
+                   "IMPORTS_DIR": "imports", "BLOBS_DIR": "blobs"}
+
+def configure(monkeypatch, tmp_path, db_path=None, **overrides):
+    """Point Config at a throw-away SQLite database and storage folder under ``tmp_path``."""
+    storage = tmp_path / "storage"
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{db_path or tmp_path / 'app.db'}")
+    monkeypatch.setattr(Config, "STORAGE_DIR", str(storage))
+    for name, sub in STORAGE_SUBDIRS.items():
+        monkeypatch.setattr(Config, name, str(storage / sub))
+    monkeypatch.setattr(Config, "PIN_HASH_METHOD", "pbkdf2:sha256:1000")  # seed users quickly
+    for name, value in overrides.items():
+        monkeypatch.setattr(Config, name, value, raising=False)
+
+def reset_caches():
+    """Per-process caches outlive an app; a new database reuses ids, so start empty."""
+    from app import bank, cache, fragments, media, pools
+    bank._CACHE.clear()
+    cache._users.clear()
+    cache._teachers.clear()
+    media._blobs.clear()
+    media._variants.clear()
+    fragments.forget_fragments()
+    pools._groups_cache.clear()
+
+def make_app():
+    from app import create_app
+    reset_caches()
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    configure(monkeypatch, tmp_path)
+    app = make_app()
+    with app.app_context():
+        yield app
+    reset_caches()
+
+@pytest.fixture
+def profiled_app(monkeypatch, tmp_path):
+    """Like ``app`` with SQL_PROFILE on, so responses carry X-SQL-Queries."""
+    configure(monkeypatch, tmp_path, SQL_PROFILE=True)
+    app = make_app()
+    with app.app_context():
+        yield app
+    reset_caches()
+
+def add_attempts(n, students=4, skill_ids=(1, 2, 3), teacher_id="t001"):
+    """``n`` finished attempts spread over ``students`` students of ``teacher_id`` (the first is s001)."""
+    from app import db
+    from app.models import Attempt, User
+    from app.stats import rebuild_rollups
+    ids = ["s001"] + [f"s{900 + i}" for i in range(1, students)]
+    for sid in ids[1:]:
+        if db.session.get(User, sid) is None:
+            db.session.add(User(id=sid, role="student", name=f"Student {sid}", pin_hash="!", teacher_id=teacher_id))
+    now = datetime.utcnow()
+    for i in range(n):
+        started = now - timedelta(days=i % 90, minutes=30)
+        year, week, _ = started.isocalendar()
+        correct = i % 5
+        db.session.add(Attempt(student_id=ids[i % len(ids)], teacher_id=teacher_id,
+                               skill_id=skill_ids[i % len(skill_ids)], iso_year=year, iso_week=week,
+                               started_at=started, finished_at=started + timedelta(minutes=10), duration_sec=600,
+                               score=correct / 4, correct_count=correct, total_count=4, passed=correct == 4))
+    db.session.commit()
+    rebuild_rollups()
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"], sess["_fresh"] = user_id, True
+    return client
+
+@pytest.fixture
+def client_for(app):
+    """client_for("t001") -> a test client signed in as that user."""
+    return lambda user_id: login(app.test_client(), user_id)
@@ -0,0 +1,84 @@
+-- Schema of the baseline release (before any numbered migration), used by
+-- tests/test_migrate.py to check that the current tree upgrades it.
+
+CREATE TABLE attempt (
+	id INTEGER NOT NULL, 
+	student_id VARCHAR(64) NOT NULL, 
+	teacher_id VARCHAR(64) NOT NULL, 
+	skill_id INTEGER NOT NULL, 
+	iso_year INTEGER NOT NULL, 
+	iso_week INTEGER NOT NULL, 
+	started_at DATETIME NOT NULL, 
+	finished_at DATETIME, 
+	duration_sec INTEGER, 
+	score FLOAT, 
+	correct_count INTEGER, 
+	total_count INTEGER, 
+	passed BOOLEAN, 
+	answers_json TEXT, 
+	pdf_path VARCHAR(512), 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(student_id) REFERENCES user (id), 
+	FOREIGN KEY(teacher_id) REFERENCES user (id), 
+	FOREIGN KEY(skill_id) REFERENCES skill (id)
+);
+
+CREATE TABLE question (
+	id INTEGER NOT NULL, 
+	skill_id INTEGER NOT NULL, 
+	qtype VARCHAR(32) NOT NULL, 
+	prompt TEXT NOT NULL, 
+	options_json TEXT, 
+	answer_json TEXT, 
+	meta_json TEXT, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(skill_id) REFERENCES skill (id)
+);
+
+CREATE TABLE remediation_upload (
+	id INTEGER NOT NULL, 
+	teacher_id VARCHAR(64) NOT NULL, 
+	student_id VARCHAR(64) NOT NULL, 
+	skill_id INTEGER NOT NULL, 
+	filename VARCHAR(256) NOT NULL, 
+	stored_path VARCHAR(512) NOT NULL, 
+	uploaded_at DATETIME NOT NULL, 
+	note VARCHAR(512), 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(teacher_id) REFERENCES user (id), 
+	FOREIGN KEY(student_id) REFERENCES user (id), 
+	FOREIGN KEY(skill_id) REFERENCES skill (id)
+);
+
+CREATE TABLE skill (
+	id INTEGER NOT NULL, 
+	name VARCHAR(160) NOT NULL, 
+	order_index INTEGER, 
+	duration_min INTEGER, 
+	pass_pct INTEGER, 
+	is_active BOOLEAN, 
+	PRIMARY KEY (id)
+);
+
+CREATE TABLE student_skill (
+	id INTEGER NOT NULL, 
+	student_id VARCHAR(64) NOT NULL, 
+	skill_id INTEGER NOT NULL, 
+	allowed BOOLEAN, 
+	unlocked_at DATETIME, 
+	locked_reason VARCHAR(256), 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(student_id) REFERENCES user (id), 
+	FOREIGN KEY(skill_id) REFERENCES skill (id)
+);
+
+CREATE TABLE user (
+	id VARCHAR(64) NOT NULL, 
+	role VARCHAR(16) NOT NULL, 
+	name VARCHAR(128) NOT NULL, 
+	pin_hash VARCHAR(256) NOT NULL, 
+	teacher_id VARCHAR(64), 
+	email VARCHAR(256), 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(teacher_id) REFERENCES user (id)
+);
@@ -0,0 +1,165 @@
+import json
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import login
+
+from app import autosave, db
+from app.models import Attempt, AttemptDraft, Job, Question, StudentSkill, StudentSkillStat, User
+
+@pytest.fixture
+def skill_id(app):
+    """Skill 1 of the seed data, unlocked for s001, with three single-choice questions."""
+    for i in range(3):
+        db.session.add(Question(skill_id=1, qtype="mcq_single", prompt=f"Q{i}",
+                                options_json=json.dumps(["A", "B"]), answer_json="0"))
+    StudentSkill.query.filter_by(student_id="s001", skill_id=1).update({"allowed": True})
+    db.session.commit()
+    return 1
+
+def _attempt(started_at, student_id="s001", skill_id=1):
+    a = Attempt(student_id=student_id, teacher_id="t001", skill_id=skill_id,
+                iso_year=started_at.isocalendar()[0], iso_week=started_at.isocalendar()[1], started_at=started_at)
+    db.session.add(a)
+    db.session.commit()
+    return a
+
+def test_start_resumes_attempt_within_its_time(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow() - timedelta(minutes=2))
+    resp = client_for("s001").get(f"/student/start/{skill_id}")
+    assert resp.status_code == 200
+    assert f"Attempt #{a.id}".encode() in resp.data
+    assert Attempt.query.count() == 1
+
+def test_expired_attempt_without_draft_is_closed_unscored(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow() - timedelta(days=100))
+    client_for("s001").get(f"/student/start/{skill_id}")
+
+    a = db.session.get(Attempt, a.id)
+    assert a.finished_at is not None
+    assert a.score is None and a.passed is None
+    assert StudentSkillStat.query.count() == 0
+    assert Job.query.filter(Job.kind == "attempt_report").count() == 0
+    resp = client_for("s001").get(f"/student/result/{a.id}")
+    assert resp.status_code == 302
+
+def test_expired_attempt_with_draft_is_graded_from_it(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow() - timedelta(hours=2))
+    first = Question.query.order_by(Question.id).first()
+    db.session.add(AttemptDraft(attempt_id=a.id, student_id="s001", deadline=a.started_at + timedelta(minutes=15),
+                                data_json=json.dumps({"a": {str(first.id): "0"}, "t": {}}), rev=1,
+                                saved_at=a.started_at))
+    db.session.commit()
+
+    resp = client_for("s001").get(f"/student/start/{skill_id}")
+    assert resp.headers["Location"].endswith(f"/student/result/{a.id}")
+    a = db.session.get(Attempt, a.id)
+    assert (a.correct_count, a.total_count) == (1, 3)
+    assert db.session.get(AttemptDraft, a.id) is None
+    assert StudentSkillStat.query.count() == 1
+
+def _save(client, attempt_id, delta):
+    resp = client.post(f"/student/autosave/{attempt_id}", json=delta)
+    return resp.status_code, resp.get_json()
+
+def test_saves_merge_and_bump_rev(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow())
+    q1, q2 = [str(q.id) for q in Question.query.order_by(Question.id).limit(2)]
+    client = client_for("s001")
+    assert _save(client, a.id, {"a": {q1: "0"}, "t": {q1: 5}}) == (200, {"rev": 1, "saved": True, "deferred": False})
+    assert _save(client, a.id, {"a": {q2: "1"}}) == (200, {"rev": 2, "saved": True, "deferred": False})
+    assert _save(client, a.id, {"a": {q2: "1"}}) == (200, {"rev": 2, "saved": False, "deferred": False})
+    # Timers alone wait for AUTOSAVE_MIN_INTERVAL_SEC; the next answer carries them.
+    assert _save(client, a.id, {"t": {q1: 9}}) == (200, {"rev": 2, "saved": False, "deferred": True})
+    assert autosave.draft_for(a.id) == {"a": {q1: "0", q2: "1"}, "t": {q1: 5}, "rev": 2}
+
+def test_concurrent_saves_lose_no_answers(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow())
+    qids = [str(q.id) for q in Question.query.order_by(Question.id)]
+    _save(client_for("s001"), a.id, {"a": {qids[0]: "1"}})  # create the draft
+    results = []
+
+    def tab(qid):
+        with app.app_context():  # a session of its own, like another worker
+            client = client_for("s001")
+            for value in ("0", "1", "0"):
+                # Lost rev races end in 409 ("saved elsewhere"); send the same change again.
+                for _ in range(20):
+                    status, body = _save(client, a.id, {"a": {qid: value}})
+                    if status != 409:
+                        break
+                results.append((status, body))
+
+    threads = [threading.Thread(target=tab, args=(qid,)) for qid in qids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [status for status, _ in results] == [200] * 3 * len(qids)
+    saved = [body for _, body in results if body["saved"]]
+    draft = autosave.draft_for(a.id)
+    assert draft["rev"] == 1 + len(saved)
+    assert draft["a"] == {qid: "0" for qid in qids}
+
+def test_save_rejected_for_other_student_or_submitted_attempt(app, client_for, skill_id):
+    a = _attempt(datetime.utcnow())
+    qid = str(Question.query.first().id)
+    db.session.add(User(id="s002", role="student", name="Other", pin_hash="!", teacher_id="t001"))
+    db.session.commit()
+    with app.app_context():  # flask-login keeps the signed-in user on g
+        assert _save(client_for("s002"), a.id, {"a": {qid: "0"}})[0] == 404
+    assert _save(client_for("s001"), a.id, {"a": {qid: "0"}})[0] == 200
+    with app.app_context():
+        assert _save(client_for("s002"), a.id, {"a": {qid: "1"}})[0] == 404
+    db.session.get(Attempt, a.id).finished_at = datetime.utcnow()  # as _finish does
+    autosave.discard(a.id)
+    db.session.commit()
+    assert _save(client_for("s001"), a.id, {"a": {qid: "0"}})[0] == 409
+
+@pytest.mark.bench
+def test_bench_concurrent_savers(app, skill_id, savers=500):
+    """Write volume and latency with ``savers`` students saving at once, each from its own session."""
+    qids = [str(q.id) for q in Question.query.order_by(Question.id)]
+    attempts = {}
+    now = datetime.utcnow()
+    for i in range(savers):
+        sid = f"s{5000 + i}"
+        db.session.add(User(id=sid, role="student", name=sid, pin_hash="!", teacher_id="t001"))
+        attempts[sid] = _attempt(now, student_id=sid).id
+    start, timings, results = threading.Barrier(savers), [], []
+
+    def student(sid):
+        with app.app_context():
+            client = login(app.test_client(), sid)
+            start.wait()
+            # Per question: an answer, a timer-only save and a repeat, as the debounced page sends them.
+            for qid in qids:
+                for delta in ({"a": {qid: "0"}, "t": {qid: 5}}, {"t": {qid: 9}}, {"a": {qid: "0"}}):
+                    t0 = time.perf_counter()
+                    results.append(_save(client, attempts[sid], delta))
+                    timings.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=student, args=(sid,)) for sid in attempts]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    statuses = [status for status, _ in results]
+    writes = sum(1 for status, body in results if status == 200 and body["saved"])
+    deferred = sum(1 for status, body in results if status == 200 and body["deferred"])
+    stored = sum(len(d.data_json) for d in AttemptDraft.query)
+    timings.sort()
+    print(f"\n{savers} savers, {len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.0f}/s): "
+          f"{writes} writes, {deferred} deferred, {len(results) - writes - deferred} unchanged, "
+          f"{statuses.count(409)} conflicts, {len(statuses) - statuses.count(200) - statuses.count(409)} errors; "
+          f"{stored} bytes stored; latency p50 {statistics.median(timings) * 1000:.1f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms")
+    assert writes == savers * len(qids)
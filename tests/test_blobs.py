@@ -0,0 +1,67 @@
+import io
+import os
+from datetime import datetime, timedelta
+
+from app import db
+from app.blobs import blob_path, collect_garbage, release, retain, store
+from app.models import Blob, RemediationUpload
+
+CONTENT = b"worksheet" * 100
+
+def _released_blob():
+    sha, size = store(io.BytesIO(CONTENT))
+    retain(sha, size, "application/pdf")
+    db.session.commit()
+    release(sha)
+    db.session.commit()
+    db.session.get(Blob, sha).released_at = datetime.utcnow() - timedelta(days=30)
+    db.session.commit()
+    return sha
+
+def _tmp_files(app):
+    tmp = os.path.join(app.config["BLOBS_DIR"], "tmp")
+    return os.listdir(tmp) if os.path.isdir(tmp) else []
+
+def test_gc_removes_unreferenced_blob(app):
+    sha = _released_blob()
+    assert collect_garbage(grace_sec=60)["removed"] == 1
+    assert db.session.get(Blob, sha) is None
+    assert not os.path.exists(blob_path(sha))
+
+def test_reupload_keeps_no_extra_copy(app):
+    sha = _released_blob()
+    again, size = store(io.BytesIO(CONTENT))
+    retain(again, size)
+    db.session.commit()
+    assert again == sha and db.session.get(Blob, sha).refcount == 1
+    assert _tmp_files(app) == []
+    assert collect_garbage(grace_sec=60)["removed"] == 0
+    assert os.path.exists(blob_path(sha))
+
+def test_upload_racing_gc_restores_the_file(app):
+    sha = _released_blob()
+    # The upload finds the file in place ...
+    again, size = store(io.BytesIO(CONTENT))
+    # ... then GC, which saw refcount 0, removes row and file before the upload retains it.
+    assert collect_garbage(grace_sec=60)["removed"] == 1
+    assert not os.path.exists(blob_path(sha))
+
+    retain(again, size)
+    db.session.commit()
+    assert db.session.get(Blob, sha).refcount == 1
+    with open(blob_path(sha), "rb") as fh:
+        assert fh.read() == CONTENT
+    assert _tmp_files(app) == []
+
+def test_remediation_upload_and_delete_release_the_blob(app, client_for):
+    client = client_for("t001")
+    resp = client.post("/teacher/students/s001/upload_remediation",
+                       data={"skill_id": "1", "file": (io.BytesIO(CONTENT), "sheet.pdf")})
+    assert resp.status_code == 302
+    up = RemediationUpload.query.one()
+    assert db.session.get(Blob, up.blob_sha).refcount == 1
+
+    resp = client.post(f"/teacher/students/s001/remediation/{up.id}/delete")
+    assert resp.status_code == 302
+    assert RemediationUpload.query.count() == 0
+    assert db.session.get(Blob, up.blob_sha).refcount == 0
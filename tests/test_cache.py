@@ -0,0 +1,37 @@
+import os
+
+from app import db
+from app.cache import _marker, forget_users, load_cached_user
+from app.models import User
+
+def _edit_in_another_worker(user_id, **values):
+    """Commit an edit and signal it the way another process's forget_users() would."""
+    User.query.filter_by(id=user_id).update(values)
+    db.session.commit()
+    with open(_marker["path"], "ab") as fh:
+        fh.write(b".")
+
+def test_cached_user_is_reused(app):
+    first = load_cached_user("s001")
+    User.query.filter_by(id="s001").update({"name": "Renamed"})
+    db.session.commit()
+    assert load_cached_user("s001") is first  # no signal: kept until USER_CACHE_SEC
+
+def test_edit_in_another_worker_reaches_this_one(app):
+    assert load_cached_user("s001").teacher_id == "t001"
+    _edit_in_another_worker("s001", teacher_id="t002", role="teacher")
+    user = load_cached_user("s001")
+    assert (user.teacher_id, user.role) == ("t002", "teacher")
+
+def test_forget_users_signals_other_workers(app):
+    load_cached_user("s001")
+    before = os.path.getsize(_marker["path"]) if os.path.exists(_marker["path"]) else 0
+    forget_users(["s001"])
+    assert os.path.getsize(_marker["path"]) == before + 1
+
+def test_role_change_applies_to_the_next_request(app, client_for):
+    client = client_for("t001")
+    assert client.get("/teacher/dashboard").status_code == 200
+    _edit_in_another_worker("t001", role="student", teacher_id="t001")
+    with app.app_context():  # flask-login keeps the signed-in user on g
+        assert client.get("/teacher/dashboard").status_code == 302
@@ -0,0 +1,53 @@
+import tracemalloc
+
+import pytest
+from conftest import add_attempts, login
+
+@pytest.mark.parametrize("user,url", [
+    ("chairman", "/chairman/dashboard"),
+    ("t001", "/teacher/dashboard"),
+    ("s001", "/student/dashboard"),
+])
+def test_dashboard_query_count_does_not_grow_with_attempts(profiled_app, user, url):
+    client = login(profiled_app.test_client(), user)
+    client.get(url)  # fills the per-worker user and teacher caches
+    counts = []
+    for n in (3, 60):
+        add_attempts(n)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        counts.append(int(resp.headers["X-SQL-Queries"]))
+    assert counts[0] == counts[1], counts
+
+def test_teacher_sees_only_attempts_taken_with_them(app, client_for):
+    from app import db, stats
+    from app.models import User
+    db.session.add(User(id="t002", role="teacher", name="Other teacher", pin_hash="!"))
+    db.session.commit()
+    add_attempts(4, students=1)                   # s001 with t001: scores 0, .25, .5, .75
+    add_attempts(6, students=1, teacher_id="t002")  # s001 picked t002 at an earlier login
+
+    row = next(r for r in stats.teacher_student_rows("t001") if r["student"].id == "s001")
+    assert (row["attempts"], row["avg"]) == (4, 37.5)
+
+    resp = client_for("t001").get("/teacher/export/students.csv")
+    line = next(l for l in resp.get_data(as_text=True).splitlines() if l.startswith("s001,"))
+    assert line.split(",")[4:6] == ["4", "37.5"]
+
+@pytest.mark.parametrize("user,url", [
+    ("chairman", "/chairman/dashboard"),
+    ("t001", "/teacher/dashboard"),
+    ("s001", "/student/dashboard"),
+])
+def test_dashboard_memory_peak_does_not_grow_with_attempts(app, user, url):
+    client = login(app.test_client(), user)
+    client.get(url)
+    peaks = []
+    for n in (60, 2940):  # 60 fills every capped list (the student's last 10 attempts); then 3000 in all
+        add_attempts(n)
+        tracemalloc.start()
+        resp = client.get(url)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert resp.status_code == 200
+    assert peaks[1] < peaks[0] * 1.25, peaks
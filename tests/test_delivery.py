@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from conftest import configure, login, make_app
+
+from app.config import Config
+
+RELPATH = "teacher/t001/clip.mp4"
+CONTENT = bytes(range(256)) * 20  # 5120 bytes
+
+def _media_app(monkeypatch, tmp_path, mode):
+    configure(monkeypatch, tmp_path, FILE_DELIVERY=mode)
+    app = make_app()
+    path = os.path.join(Config.MEDIA_DIR, RELPATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(CONTENT)
+    return app
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    app = _media_app(monkeypatch, tmp_path, "flask")
+    with app.app_context():
+        yield login(app.test_client(), "t001")
+
+def test_strong_etag_and_not_modified(client):
+    first = client.get(f"/files/media/{RELPATH}")
+    assert first.status_code == 200 and first.data == CONTENT
+    etag, weak = first.get_etag()
+    assert etag and not weak
+    assert "private" in first.headers["Cache-Control"]
+
+    again = client.get(f"/files/media/{RELPATH}", headers={"If-None-Match": f'"{etag}"'})
+    assert again.status_code == 304 and again.data == b""
+
+def test_range_with_if_range(client):
+    etag = client.get(f"/files/media/{RELPATH}").get_etag()[0]
+    part = client.get(f"/files/media/{RELPATH}", headers={"Range": "bytes=0-1023", "If-Range": f'"{etag}"'})
+    assert part.status_code == 206
+    assert part.headers["Content-Range"] == f"bytes 0-1023/{len(CONTENT)}"
+    assert part.data == CONTENT[:1024]
+
+    tail = client.get(f"/files/media/{RELPATH}", headers={"Range": "bytes=5000-"})
+    assert tail.status_code == 206 and tail.data == CONTENT[5000:]
+
+    stale = client.get(f"/files/media/{RELPATH}", headers={"Range": "bytes=0-1023", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.data == CONTENT
+
+def test_nginx_mode_hands_off_with_x_accel_redirect(monkeypatch, tmp_path):
+    app = _media_app(monkeypatch, tmp_path, "nginx")
+    with app.app_context():
+        resp = login(app.test_client(), "t001").get(f"/files/media/{RELPATH}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Redirect"] == f"/_protected/media/{RELPATH}"
+    assert resp.headers["Content-Type"] == "video/mp4"
+    assert resp.data == b""
+
+def test_apache_mode_hands_off_with_x_sendfile(monkeypatch, tmp_path):
+    app = _media_app(monkeypatch, tmp_path, "apache")
+    with app.app_context():
+        resp = login(app.test_client(), "t001").get(f"/files/media/{RELPATH}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Sendfile"] == os.path.join(Config.MEDIA_DIR, RELPATH)
+    assert resp.data == b""
+
+def test_missing_or_traversal_is_404(client):
+    assert client.get("/files/media/teacher/t001/nope.mp4").status_code == 404
+    assert client.get("/files/media/../app.db").status_code == 404
@@ -0,0 +1,26 @@
+import csv
+import io
+
+import pytest
+
+from app import exports
+
+@pytest.mark.parametrize("user,url", [
+    ("t001", "/teacher/export/attempts.csv"),
+    ("t001", "/teacher/export/students.csv"),
+    ("chairman", "/chairman/export/attempts.csv"),
+    ("chairman", "/chairman/export/roster.csv"),
+])
+def test_csv_export_headers(client_for, user, url):
+    resp = client_for(user).get(url)
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "text/csv; charset=utf-8"
+    assert resp.headers["Content-Disposition"].startswith("attachment; filename=")
+    header = next(csv.reader(io.StringIO(resp.get_data(as_text=True).lstrip("\ufeff"))))
+    assert header in (exports.ATTEMPT_HEADER, exports.ROSTER_HEADER)
+
+def test_xlsx_export_content_type(client_for):
+    resp = client_for("t001").get("/teacher/export/attempts.xlsx")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assert resp.data[:2] == b"PK"
@@ -0,0 +1,73 @@
+import json
+import statistics
+import time
+
+import pytest
+
+from app import db, fragments
+from app.bank import bump_bank_version
+from app.models import Attempt, Question, StudentSkill
+
+@pytest.fixture
+def question(app):
+    q = Question(skill_id=1, qtype="mcq_single", prompt="Which organelle makes ATP?",
+                 options_json=json.dumps(["Mitochondria", "Ribosome"]), answer_json="0")
+    db.session.add(q)
+    StudentSkill.query.filter_by(student_id="s001", skill_id=1).update({"allowed": True})
+    db.session.commit()
+    return q
+
+def _start(client_for):
+    Attempt.query.delete()  # a fresh attempt each time, not a resumed one
+    db.session.commit()
+    resp = client_for("s001").get("/student/start/1")
+    assert resp.status_code == 200
+    return resp.get_data(as_text=True)
+
+def test_question_markup_is_cached_until_the_bank_version_changes(app, client_for, question):
+    assert "Which organelle makes ATP?" in _start(client_for)
+
+    question.prompt = "Which organelle makes proteins?"
+    db.session.commit()
+    assert "Which organelle makes ATP?" in _start(client_for)  # same version: served from cache
+
+    bump_bank_version([question.skill_id])
+    db.session.commit()
+    page = _start(client_for)
+    assert "Which organelle makes proteins?" in page
+    assert "Which organelle makes ATP?" not in page
+
+_BENCH_QUESTIONS = [
+    ("mcq_single", ["Mitochondria", "Ribosome", "Nucleus", "Vacuole"], 0, None),
+    ("mcq_multi", ["Oxygen", "Glucose", "Carbon dioxide", "Water"], [1, 2], None),
+    ("true_false", ["True", "False"], 0, None),
+    ("short_text", None, "osmosis", None),
+    ("video_cued_mcq_single", ["Before", "During", "After"], 1, {"video_url": "/static/bench.mp4", "cues": [5, 12, 20]}),
+]
+
+@pytest.mark.bench
+def test_bench_start_latency(app, client_for, questions=100, requests=100):
+    """GET /student/start for a ``questions``-item bank with the markup cache off and on."""
+    for i in range(questions):
+        qtype, options, answer, meta = _BENCH_QUESTIONS[i % len(_BENCH_QUESTIONS)]
+        db.session.add(Question(skill_id=1, qtype=qtype, prompt=f"Benchmark question {i + 1}",
+                                options_json=json.dumps(options) if options else None,
+                                answer_json=json.dumps(answer), meta_json=json.dumps(meta) if meta else None))
+    StudentSkill.query.filter_by(student_id="s001", skill_id=1).update({"allowed": True})
+    db.session.commit()
+
+    means = {}
+    for mode, ttl in (("uncached", 0), ("cached", 300)):
+        app.config["TEST_FRAGMENT_CACHE_SEC"] = ttl
+        fragments.forget_fragments()
+        page = _start(client_for)  # warm-up: compiles the bank and templates (and fills the cache)
+        timings = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            _start(client_for)
+            timings.append(time.perf_counter() - t0)
+        timings.sort()
+        means[mode] = statistics.fmean(timings)
+        print(f"\n{mode:<9} mean {means[mode] * 1000:6.2f} ms  p50 {timings[len(timings) // 2] * 1000:6.2f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:6.2f} ms  ({len(page)} chars)")
+    assert means["cached"] < means["uncached"]
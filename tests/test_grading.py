@@ -0,0 +1,51 @@
+import json
+import re
+
+from conftest import add_attempts
+
+from app import db
+from app.bank import bump_bank_version
+from app.grading import regrade_attempts
+from app.item_analysis import rebuild_item_stats
+from app.models import Question, QuestionStat, StudentSkill, User
+from app.stats import ROLLUPS, rebuild_rollups
+
+def _snapshot():
+    tables = [model for model, _ in ROLLUPS] + [QuestionStat]
+    out = {}
+    for model in tables:
+        t = model.__table__
+        rows = db.session.execute(t.select()).mappings().all()
+        out[t.name] = sorted(
+            (tuple((k, round(v, 9) if isinstance(v, float) else v) for k, v in r.items() if k not in ("id", "updated_at"))
+             for r in rows), key=repr)
+    return out
+
+def test_regrade_adjusts_rollups_and_item_stats_in_place(app, client_for):
+    for prompt in ("2 + 2?", "3 + 3?"):
+        db.session.add(Question(skill_id=1, qtype="mcq_single", prompt=prompt,
+                                options_json=json.dumps(["a", "b"]), answer_json="0"))
+    students = ["s001", "s901", "s902"]
+    for sid in students[1:]:
+        db.session.add(User(id=sid, role="student", name=sid, pin_hash="!", teacher_id="t001"))
+        db.session.add(StudentSkill(student_id=sid, skill_id=1, allowed=True))
+    StudentSkill.query.filter_by(student_id="s001", skill_id=1).update({"allowed": True})
+    db.session.commit()
+    qids = [q.id for q in Question.query.order_by(Question.id)]
+    for sid, picks in zip(students, (("0", "0"), ("1", "0"), ("1", "1"))):
+        with app.app_context():
+            client = client_for(sid)
+            page = client.get("/student/start/1").get_data(as_text=True)
+            attempt_id = int(re.search(r"/student/submit/(\d+)", page).group(1))
+            client.post(f"/student/submit/{attempt_id}", data={f"q_{q}": p for q, p in zip(qids, picks)})
+    add_attempts(6, students=2, skill_ids=(1,))  # no stored answers: re-scored to 0
+
+    db.session.get(Question, qids[0]).answer_json = "1"
+    bump_bank_version([1])
+    db.session.commit()
+    assert regrade_attempts(skill_id=1, batch_size=4)["changed"] > 0
+    regraded = _snapshot()
+
+    rebuild_rollups()
+    rebuild_item_stats()
+    assert regraded == _snapshot()
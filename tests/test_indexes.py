@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import tuple_
+
+from app import db
+from app.models import Attempt, AttemptAnswer, MediaAsset, Question, RemediationUpload, StudentSkill
+
+# Hot-path queries and the index each one must be able to use (checked with
+# EXPLAIN QUERY PLAN on SQLite; a renamed or dropped index fails here).
+HOT_QUERIES = [
+    ("weekly limit check", "ix_attempt_student_week_skill",
+     lambda: Attempt.query.filter_by(student_id="s", iso_year=2024, iso_week=1, skill_id=1)),
+    ("teacher reports", "ix_attempt_teacher_finished_id",
+     lambda: Attempt.query.filter(Attempt.teacher_id == "t", Attempt.finished_at.isnot(None),
+                                  tuple_(Attempt.finished_at, Attempt.id) < (datetime(2024, 1, 1), 10))
+     .order_by(Attempt.finished_at.desc(), Attempt.id.desc()).limit(50)),
+    ("skill permission lookup", "ux_student_skill_student_skill",
+     lambda: StudentSkill.query.filter_by(student_id="s", skill_id=1)),
+    ("attempt browser (all teachers)", "ix_attempt_finished_id",
+     lambda: Attempt.query.filter(Attempt.finished_at.isnot(None))
+     .order_by(Attempt.finished_at.desc(), Attempt.id.desc()).limit(50)),
+    ("attempt browser by skill", "ix_attempt_skill_finished_id",
+     lambda: Attempt.query.filter(Attempt.skill_id == 1, Attempt.finished_at.isnot(None))
+     .order_by(Attempt.finished_at.desc(), Attempt.id.desc()).limit(50)),
+    ("questions of a skill", "ix_question_skill",
+     lambda: Question.query.filter_by(skill_id=1)),
+    ("answers of an attempt", "ux_attempt_answer_attempt_position",
+     lambda: AttemptAnswer.query.filter_by(attempt_id=1).order_by(AttemptAnswer.position.asc())),
+    ("answers to a question", "ix_attempt_answer_question",
+     lambda: AttemptAnswer.query.filter_by(question_id=1, is_correct=False)),
+    ("remediation lookup", "ix_remediation_teacher_student_skill",
+     lambda: RemediationUpload.query.filter_by(teacher_id="t", student_id="s", skill_id=1)),
+    ("media library page", "ix_media_asset_owner_path",
+     lambda: MediaAsset.query.filter(MediaAsset.owner_id == "t", MediaAsset.path > "a")
+     .order_by(MediaAsset.path.asc()).limit(50)),
+]
+
+def explain(query) -> str:
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return "\n".join(" ".join(str(c) for c in r) for r in rows)
+
+@pytest.mark.parametrize("label,index,query", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_its_index(app, label, index, query):
+    plan = explain(query())
+    assert index in plan, plan
+    assert "TEMP B-TREE" not in plan, plan  # ORDER BY served by the index
@@ -0,0 +1,60 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from conftest import configure, make_app
+
+from app import db
+from app.jobs import HANDLERS, _load_handlers, _requeue_stale, claim_next, enqueue, report_progress, run_job, work_once
+from app.models import Job
+
+def _drain():
+    _load_handlers()
+    while work_once():
+        pass
+
+def test_report_progress_renews_the_lock(app, monkeypatch):
+    _drain()
+    def long_job(payload):
+        job = Job.query.filter_by(key="long").one()
+        job.locked_at = datetime.utcnow() - timedelta(hours=1)  # claimed long ago
+        db.session.commit()
+        report_progress({"done": 1})
+        _requeue_stale(datetime.utcnow())
+        return {"status": db.session.get(Job, job.id).status}
+
+    monkeypatch.setitem(HANDLERS, "long", long_job)
+    enqueue("long", key="long")
+    db.session.commit()
+    assert work_once()
+    job = Job.query.filter_by(key="long").one()
+    assert (job.status, job.result_json) == ("done", '{"status": "running"}')
+
+def test_silent_job_past_lock_timeout_is_not_claimed_twice(monkeypatch, tmp_path):
+    configure(monkeypatch, tmp_path, JOB_LOCK_TIMEOUT_SEC=1)
+    app = make_app()
+    runs = []
+    monkeypatch.setitem(HANDLERS, "slow", lambda payload: runs.append(1) or time.sleep(2.5))
+    with app.app_context():
+        _drain()
+        enqueue("slow", key="slow")
+        db.session.commit()
+
+    stolen = []
+    def other_worker():
+        deadline = time.monotonic() + 2.2
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            with app.app_context():
+                if claim_next() is not None:
+                    stolen.append(1)
+                db.session.remove()
+
+    with app.app_context():
+        job = claim_next()
+        claim = threading.Thread(target=other_worker)
+        claim.start()
+        run_job(job)
+        claim.join()
+        assert Job.query.filter_by(key="slow").one().status == "done"
+    assert (len(runs), stolen) == (1, [])
@@ -0,0 +1,84 @@
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import configure, make_app
+
+from app import db
+from app.mailer import flush_outbox, queue_email
+from app.models import OutboxMessage
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.send_message; each DATA is stored and answered slowly."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 test ESMTP")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            verb = line[:4].upper()
+            if not line or verb == "QUIT":
+                self.reply("221 bye")
+                return
+            if verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                time.sleep(0.1)
+                self.server.received.append(b"".join(data).decode())
+            self.reply("250 ok")
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpHandler)
+    server.daemon_threads = True
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def mail_app(monkeypatch, tmp_path, smtp_server):
+    configure(monkeypatch, tmp_path, SMTP_HOST="127.0.0.1", SMTP_PORT=smtp_server.server_address[1],
+              SMTP_FROM="tests@example.org", SMTP_TLS=False, SMTP_RATE_PER_MIN=0)
+    return make_app()
+
+def test_overlapping_flushes_send_each_message_once(mail_app, smtp_server):
+    with mail_app.app_context():
+        for i in range(6):
+            queue_email(f"t{i}@example.org", f"Report {i}", "body")
+        db.session.commit()
+
+    def flush():
+        with mail_app.app_context():
+            flush_outbox()
+            db.session.remove()
+
+    workers = [threading.Thread(target=flush) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    subjects = sorted(line for m in smtp_server.received for line in m.splitlines() if line.startswith("Subject:"))
+    assert subjects == [f"Subject: Report {i}" for i in range(6)]
+    with mail_app.app_context():
+        assert {m.status for m in OutboxMessage.query} == {"sent"}
+
+def test_flush_requeues_claims_left_by_a_dead_worker(mail_app, smtp_server):
+    with mail_app.app_context():
+        fresh = queue_email("a@example.org", "Being sent elsewhere", "body")
+        stuck = queue_email("b@example.org", "Stuck", "body")
+        fresh.status, fresh.locked_at = "sending", datetime.utcnow()
+        stuck.status, stuck.locked_at = "sending", datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        assert flush_outbox()["sent"] == 1
+        assert (fresh.status, stuck.status) == ("sending", "sent")
+    assert len(smtp_server.received) == 1
@@ -0,0 +1,71 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from sqlalchemy import inspect, text
+
+from conftest import STORAGE_SUBDIRS, configure, make_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(__file__), "data", "baseline_schema.sql")
+
+def baseline_db(path):
+    """A database as the baseline release left it, with one finished attempt."""
+    con = sqlite3.connect(path)
+    con.executescript(open(BASELINE).read())
+    con.executescript("""
+        INSERT INTO user (id, role, name, pin_hash) VALUES ('t9', 'teacher', 'Old Teacher', '!');
+        INSERT INTO user (id, role, name, pin_hash, teacher_id) VALUES ('s9', 'student', 'Old Student', '!', 't9');
+        INSERT INTO skill (id, name, order_index, duration_min, pass_pct, is_active) VALUES (1, 'Old skill', 1, 10, 80, 1);
+        INSERT INTO question (id, skill_id, qtype, prompt, options_json, answer_json)
+            VALUES (1, 1, 'mcq_single', 'Pick A', '["A", "B"]', '0');
+    """)
+    con.execute(
+        "INSERT INTO attempt (id, student_id, teacher_id, skill_id, iso_year, iso_week, started_at, finished_at,"
+        " duration_sec, score, correct_count, total_count, passed, answers_json)"
+        " VALUES (1, 's9', 't9', 1, 2024, 10, '2024-03-04 10:00:00', '2024-03-04 10:05:00', 300, 1.0, 1, 1, 1, ?)",
+        (json.dumps([{"question_id": 1, "response": "0", "is_correct": True}]),),
+    )
+    con.commit()
+    con.close()
+
+def test_upgrades_baseline_database(monkeypatch, tmp_path):
+    from app.migrate import MIGRATIONS
+    db_path = tmp_path / "old.db"
+    baseline_db(db_path)
+    configure(monkeypatch, tmp_path, db_path=db_path)
+
+    app = make_app()
+    with app.app_context():
+        from app import db
+        applied = [v for (v,) in db.session.execute(text("SELECT version FROM schema_migration ORDER BY version"))]
+        assert applied == sorted(v for v, _, _ in MIGRATIONS)
+        columns = {c["name"] for c in inspect(db.engine).get_columns("attempt")}
+        assert {"question_ids_json", "seed"} <= columns
+        indexes = {i["name"] for i in inspect(db.engine).get_indexes("attempt")}
+        assert "ix_attempt_teacher_finished_id" in indexes and "ix_attempt_teacher_finished" not in indexes
+        # Backfills ran against the old rows.
+        assert db.session.execute(text("SELECT attempts FROM student_skill_stat")).scalar() == 1
+        assert db.session.execute(text("SELECT COUNT(*) FROM attempt_answer")).scalar() == 1
+        assert db.session.execute(text("SELECT answers FROM question_stat")).scalar() == 1
+
+    # And it boots again with nothing left to apply.
+    with make_app().app_context():
+        pass
+
+def test_workers_booting_together_share_one_migration(tmp_path):
+    db_path = tmp_path / "old.db"
+    baseline_db(db_path)
+    storage = tmp_path / "storage"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", STORAGE_DIR=str(storage),
+               PIN_HASH_METHOD="pbkdf2:sha256:1000", PYTHONPATH=ROOT)
+    procs = [subprocess.Popen([sys.executable, "-c", "from app import create_app; create_app()"],
+                              cwd=ROOT, env=env, stderr=subprocess.PIPE) for _ in range(4)]
+    errors = [p.communicate(timeout=120)[1].decode() for p in procs]
+    assert [p.returncode for p in procs] == [0, 0, 0, 0], "\n".join(errors)
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT COUNT(*) FROM user WHERE id = 'chairman'").fetchone()[0] == 1
+    assert con.execute("SELECT COUNT(*) FROM attempt_answer").fetchone()[0] == 1
+    assert not [d for d in STORAGE_SUBDIRS.values() if not (storage / d).is_dir()]
@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+USERS = {"chairman": "chairman", "teacher": "t001", "student": "s001"}
+
+def test_every_template_compiles(app):
+    for name in app.jinja_env.list_templates():
+        if name.endswith(".html"):
+            app.jinja_env.get_template(name)
+
+def _pages(app, prefix):
+    for rule in app.url_map.iter_rules():
+        if "GET" in rule.methods and not rule.arguments and rule.rule.startswith(prefix):
+            yield rule.rule
+
+@pytest.mark.parametrize("role", sorted(USERS))
+def test_pages_render(app, client_for, role):
+    client = client_for(USERS[role])
+    checked = 0
+    for url in _pages(app, f"/{role}/"):
+        resp = client.get(url)
+        assert resp.status_code < 500, f"{url} -> {resp.status_code}"
+        checked += 1
+    assert checked
+
+@pytest.mark.parametrize("user_id,prefix", [("chairman", "/chairman"), ("t001", "/teacher")])
+def test_media_library_lists_files(app, client_for, user_id, prefix):
+    client = client_for(user_id)
+    png = (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89"
+           b"\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82")
+    resp = client.post(f"{prefix}/media/upload", data={"file": (io.BytesIO(png), "dot.png")},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 302
+    page = client.get(f"{prefix}/media")
+    assert page.status_code == 200
+    assert b"dot.png" in page.data
+    assert b"Remove" in page.data
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User
+from app.pins import needs_rehash
+
+@pytest.mark.parametrize("made_with,configured,expected", [
+    ("scrypt", "scrypt", False),
+    ("scrypt:32768:8:1", "scrypt", False),
+    ("scrypt", "scrypt:32768:8:1", False),
+    ("pbkdf2:sha256", "pbkdf2:sha256", False),
+    ("pbkdf2", "pbkdf2:sha256", False),
+    ("pbkdf2:sha256:1000", "pbkdf2:sha256:1000", False),
+    ("scrypt:16384:8:1", "scrypt", True),
+    ("pbkdf2:sha256:1000", "pbkdf2:sha256", True),
+    ("pbkdf2:sha256:1000", "scrypt", True),
+])
+def test_needs_rehash_compares_full_method(made_with, configured, expected):
+    assert needs_rehash(generate_password_hash("1234", method=made_with), configured) is expected
+
+def _login(client):
+    return client.post("/login", data={"role": "teacher", "user_id": "t001", "pin": "1234"})
+
+def test_login_moves_hash_to_configured_method_once(app):
+    app.config["PIN_HASH_METHOD"] = "pbkdf2:sha256:2000"
+    user = db.session.get(User, "t001")
+    assert user.pin_hash.startswith("pbkdf2:sha256:1000$")
+
+    assert _login(app.test_client()).status_code == 302
+    db.session.expire_all()
+    rehashed = db.session.get(User, "t001").pin_hash
+    assert rehashed.startswith("pbkdf2:sha256:2000$")
+
+    assert _login(app.test_client()).status_code == 302
+    db.session.expire_all()
+    assert db.session.get(User, "t001").pin_hash == rehashed
+
+@pytest.mark.bench
+@pytest.mark.parametrize("method", ["scrypt:32768:8:1", "scrypt:16384:8:1", "pbkdf2:sha256:600000",
+                                    "pbkdf2:sha256:100000"])
+def test_bench_logins_per_worker(app, method, logins=10):
+    """Sequential logins through one app, as a single sync gunicorn worker serves them."""
+    app.config["PIN_HASH_METHOD"] = method
+    db.session.get(User, "t001").pin_hash = generate_password_hash("1234", method=method)
+    db.session.commit()
+    client = app.test_client()
+    started = time.perf_counter()
+    for _ in range(logins):
+        assert _login(client).status_code == 302
+    elapsed = time.perf_counter() - started
+    print(f"\n{method:<22} {logins / elapsed:6.1f} logins/s per worker ({elapsed / logins * 1000:.0f} ms each)")
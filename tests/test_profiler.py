@@ -0,0 +1,40 @@
+import pytest
+from conftest import add_attempts, configure, login, make_app
+
+from app.models import User
+from app.profiler import NPlusOneError, statement_shape
+
+@pytest.fixture
+def strict_app(monkeypatch, tmp_path):
+    configure(monkeypatch, tmp_path, SQL_PROFILE=True, SQL_PROFILE_STRICT=True, SQL_PROFILE_REPEAT_LIMIT=5)
+    app = make_app()
+    with app.app_context():
+        yield app
+
+def test_statement_shape_strips_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM user WHERE id = 'a''b' AND n > 12.5") == \
+        "SELECT * FROM user WHERE id = ? AND n > ?"
+    assert statement_shape("SELECT x\n  FROM t WHERE id IN (?, ?,?)") == "SELECT x FROM t WHERE id IN (...)"
+    assert statement_shape("SELECT x FROM t WHERE id IN (%(id_1)s, %(id_2)s)") == \
+        "SELECT x FROM t WHERE id IN (...)"
+    assert statement_shape("SELECT a1 FROM t2 WHERE b = 3") == "SELECT a1 FROM t2 WHERE b = ?"
+
+@pytest.mark.parametrize("user,url", [
+    ("chairman", "/chairman/attempts"),
+    ("t001", "/teacher/reports"),
+])
+def test_list_pages_pass_strict_mode(strict_app, user, url):
+    add_attempts(40, students=12)
+    resp = login(strict_app.test_client(), user).get(url)
+    assert resp.status_code == 200
+    assert int(resp.headers["X-SQL-Queries"]) < 15
+
+def test_strict_mode_raises_on_repeated_statements(strict_app):
+    @strict_app.get("/_n_plus_one")
+    def n_plus_one():
+        for i in range(10):
+            User.query.filter_by(id=f"u{i}").first()
+        return "ok"
+
+    with pytest.raises(NPlusOneError, match="Possible N\\+1 on GET /_n_plus_one"):
+        strict_app.test_client().get("/_n_plus_one")
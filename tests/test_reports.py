@@ -0,0 +1,37 @@
+import json
+import re
+
+from app import db
+from app.grading import regrade_attempts
+from app.jobs import _load_handlers, job_for, work_once
+from app.models import Attempt, Question, Skill, StudentSkill
+from app.reports import report_job_key
+
+def _run_jobs():
+    _load_handlers()
+    while work_once():
+        pass
+
+def test_each_regrade_rebuilds_the_report(app, client_for):
+    db.session.add(Question(skill_id=1, qtype="mcq_single", prompt="2 + 2?",
+                            options_json=json.dumps(["4", "5"]), answer_json="0"))
+    StudentSkill.query.filter_by(student_id="s001", skill_id=1).update({"allowed": True})
+    db.session.commit()
+    client = client_for("s001")
+    page = client.get("/student/start/1").get_data(as_text=True)
+    attempt_id = int(re.search(r"/student/submit/(\d+)", page).group(1))
+    qid = Question.query.first().id
+    client.post(f"/student/submit/{attempt_id}", data={f"q_{qid}": "0"})
+    _run_jobs()
+    assert db.session.get(Attempt, attempt_id).pdf_path
+
+    # Two regrades at the same bank version (only the pass mark changes).
+    for pass_pct in (101, 80):
+        db.session.get(Skill, 1).pass_pct = pass_pct
+        db.session.commit()
+        assert regrade_attempts(skill_id=1)["changed"] == 1
+        assert db.session.get(Attempt, attempt_id).pdf_path is None
+        assert job_for(report_job_key(attempt_id)).status == "queued"  # what the result page shows
+        _run_jobs()
+        assert db.session.get(Attempt, attempt_id).pdf_path
+        assert job_for(report_job_key(attempt_id)).status == "done"
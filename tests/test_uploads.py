@@ -0,0 +1,97 @@
+import io
+import threading
+import time
+
+import pytest
+
+from app import db, uploads
+from app.models import Blob, MediaAsset, UploadSession, User
+
+class HeldStream:
+    """Yields its first piece, then waits for ``release`` before the rest."""
+
+    def __init__(self, first, rest):
+        self.parts = [first, rest]
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def read(self, size=-1):
+        if len(self.parts) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return self.parts.pop(0) if self.parts else b""
+
+@pytest.fixture
+def session_id(app):
+    sess = uploads.start(db.session.get(User, "t001"), {"purpose": "media", "filename": "clip.mp4", "size": 20})
+    db.session.commit()
+    return sess.id
+
+def _append(app, session_id, offset, stream, errors):
+    with app.app_context():
+        try:
+            uploads.append(db.session.get(UploadSession, session_id), offset, stream)
+            db.session.commit()
+        except uploads.UploadError as e:
+            errors.append((e.status, e.offset))
+
+def test_chunks_append_in_order(app, session_id):
+    sess = db.session.get(UploadSession, session_id)
+    assert uploads.append(sess, 0, io.BytesIO(b"a" * 10)) == 10
+    with pytest.raises(uploads.UploadError) as e:
+        uploads.append(sess, 0, io.BytesIO(b"a" * 10))
+    assert (e.value.status, e.value.offset) == (409, 10)
+    assert uploads.append(sess, 10, io.BytesIO(b"b" * 10)) == 20
+    with open(uploads.part_path(session_id), "rb") as fh:
+        assert fh.read() == b"a" * 10 + b"b" * 10
+
+def test_concurrent_puts_at_the_same_offset_write_once(app, session_id):
+    errors = []
+    slow = HeldStream(b"A" * 5, b"A" * 5)
+    first = threading.Thread(target=_append, args=(app, session_id, 0, slow, errors))
+    first.start()
+    assert slow.started.wait(5)
+    # The same chunk again (a client retry) while the first is still being written.
+    second = threading.Thread(target=_append, args=(app, session_id, 0, io.BytesIO(b"B" * 10), errors))
+    second.start()
+    time.sleep(0.2)
+    slow.release.set()
+    first.join()
+    second.join()
+
+    assert errors == [(409, 10)]
+    with open(uploads.part_path(session_id), "rb") as fh:
+        assert fh.read() == b"A" * 10
+
+def _upload(client, body=b"x" * 20):
+    resp = client.post("/uploads", json={"purpose": "media", "filename": "clip.mp4", "size": len(body)})
+    sid = resp.get_json()["id"]
+    assert client.put(f"/uploads/{sid}?offset=0", data=body).status_code == 200
+    return sid
+
+def test_finalize_again_returns_the_first_result(app, client_for):
+    client = client_for("t001")
+    sid = _upload(client)
+    first = client.post(f"/uploads/{sid}/finalize")
+    again = client.post(f"/uploads/{sid}/finalize")
+    assert first.status_code == again.status_code == 200
+    assert first.get_json() == again.get_json()
+    assert MediaAsset.query.count() == 1
+
+def test_concurrent_finalize_files_once(app, client_for):
+    sid = _upload(client_for("t001"))
+    responses = []
+
+    def finalize():
+        with app.app_context():
+            responses.append(client_for("t001").post(f"/uploads/{sid}/finalize"))
+
+    threads = [threading.Thread(target=finalize) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.data for r in responses}) == 1
+    assert MediaAsset.query.count() == 1
+    assert db.session.query(Blob.refcount).scalar() == 1